@@ -0,0 +1,100 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/aws-bridge/blocking_io.py
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Threads available for blocking file and subprocess work
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "4"))
+# Log a warning when this many calls are waiting for a free thread
+BLOCKING_IO_QUEUE_WARNING = int(os.getenv("BLOCKING_IO_QUEUE_WARNING", "16"))
+
+
+class BlockingExecutor:
+    """Bounded thread pool for blocking calls made from async handlers.
+
+    Keeps the event loop free while files are read/written or subprocesses
+    run, and tracks how many calls are running and queued so saturation
+    shows up in the health endpoint.
+    """
+
+    def __init__(self, max_workers: int = BLOCKING_IO_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking-io")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+
+    def _call(self, func: Callable, submitted: float):
+        started = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_time += started - submitted
+        failed = True
+        try:
+            result = func()
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                self._failed += failed
+                self._run_time += time.monotonic() - started
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool and await its result"""
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+            queued = self._queued
+        if queued >= BLOCKING_IO_QUEUE_WARNING:
+            logger.warning(f"Blocking I/O queue depth is {queued}")
+
+        call = functools.partial(func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, call, time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "max_queued": self._max_queued,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._wait_time / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self._run_time / completed * 1000, 2) if completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+blocking_executor = BlockingExecutor()
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking function on the shared blocking I/O pool"""
+    return await blocking_executor.run(func, *args, **kwargs)
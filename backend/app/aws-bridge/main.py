@@ -15,7 +15,6 @@ from pydantic_settings import BaseSettings
 from typing import List, Optional
 import json
 import os
-import subprocess
 import shutil
 import logging
 from logging.handlers import RotatingFileHandler
@@ -23,6 +22,8 @@ import ssl
 import secrets
 from pathlib import Path
 from datetime import datetime
+from blocking_io import blocking_executor, run_blocking
+from reload_manager import RESTART, ReloadManager
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -195,29 +196,14 @@ def generate_bridge_config(
     
     return "\n".join(config_lines)
 
-def restart_mosquitto() -> bool:
-    """
-    Restart the Mosquitto broker service.
-    Returns True if successful, False otherwise.
-    """
-    try:
-        # Try systemctl first
-        result = subprocess.run(
-            ['rc-service', 'mosquitto', 'restart'],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0:
-            return True
-            
-        return result.returncode == 0
-        
-    except Exception as e:
-        logger.error(f"Error restarting Mosquitto: {str(e)}")
-        return False
-
+def save_bridge_config(config_path: str, config_content: str):
+    """Write a bridge configuration file into the Mosquitto conf.d directory"""
+    os.makedirs(settings.MOSQUITTO_CONF_PATH, exist_ok=True)
+    with open(config_path, "w") as config_file:
+        config_file.write(config_content)
 
+# Applies bridge changes; saves made within the coalescing window share one restart
+reload_manager = ReloadManager()
 
 @app.post("/api/v1/aws-bridge")
 async def create_aws_bridge(
@@ -267,7 +253,8 @@ async def create_aws_bridge(
                     detail=f"Invalid {file_type} certificate"
                 )
             
-            filepath = save_certificate(
+            filepath = await run_blocking(
+                save_certificate,
                 content,
                 f"{bridge_config_obj.client_id}_{file_type}.pem"
             )
@@ -286,14 +273,13 @@ async def create_aws_bridge(
 
         # Save bridge configuration
         config_path = os.path.join(settings.MOSQUITTO_CONF_PATH, f"{bridge_name}.conf")
-        os.makedirs(settings.MOSQUITTO_CONF_PATH, exist_ok=True)
-        with open(config_path, "w") as config_file:
-            config_file.write(config_content)
+        await run_blocking(save_bridge_config, config_path, config_content)
         logger.info(f"Saved bridge configuration to {config_path}")
 
-        # Restart Mosquitto
-        if not restart_mosquitto():
-            logger.error("Failed to restart Mosquitto broker")
+        # Bridges are only read at startup, so the broker has to restart
+        result = await reload_manager.request_async(f"Bridge {bridge_name} configured", RESTART)
+        if not result["success"]:
+            logger.error(f"Failed to restart Mosquitto broker: {result['message']}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to restart Mosquitto broker"
@@ -319,7 +305,8 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "blocking_io": blocking_executor.stats(),
     }
 
 if __name__ == "__main__":
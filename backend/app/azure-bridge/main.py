@@ -15,7 +15,6 @@ from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from typing import List, Optional
 import os
-import subprocess
 import shutil
 import logging
 from logging.handlers import RotatingFileHandler
@@ -23,6 +22,8 @@ import ssl
 import secrets
 from datetime import datetime
 from pathlib import Path
+from blocking_io import blocking_executor, run_blocking
+from reload_manager import RESTART, ReloadManager, run_restart_command
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -174,14 +175,14 @@ bridge_attempt_unsubscribe true
 
     return config
 
-def restart_mosquitto() -> bool:
-    """Restart Mosquitto broker"""
-    try:
-        subprocess.run(["supervisorctl", "restart", "mosquitto"], check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to restart Mosquitto: {str(e)}")
-        return False
+def save_bridge_config(config_path: str, config_content: str):
+    """Write a bridge configuration file into the Mosquitto conf.d directory"""
+    os.makedirs(settings.MOSQUITTO_CONF_PATH, exist_ok=True)
+    with open(config_path, "w") as config_file:
+        config_file.write(config_content)
+
+# Applies bridge changes; saves made within the coalescing window share one restart
+reload_manager = ReloadManager(restart=lambda: run_restart_command("supervisorctl restart mosquitto"))
 
 @app.post("/api/v1/azure-bridge")
 async def create_azure_bridge(
@@ -204,7 +205,8 @@ async def create_azure_bridge(
                 detail="Invalid CA certificate"
             )
         
-        ca_path = save_certificate(
+        ca_path = await run_blocking(
+            save_certificate,
             content,
             f"azure_{bridge_config.device_id}_ca.pem"
         )
@@ -224,14 +226,13 @@ async def create_azure_bridge(
 
         # Save bridge configuration
         config_path = os.path.join(settings.MOSQUITTO_CONF_PATH, f"{bridge_name}.conf")
-        os.makedirs(settings.MOSQUITTO_CONF_PATH, exist_ok=True)
-        with open(config_path, "w") as config_file:
-            config_file.write(config_content)
+        await run_blocking(save_bridge_config, config_path, config_content)
         logger.info(f"Saved bridge configuration to {config_path}")
 
-        # Restart Mosquitto
-        if not restart_mosquitto():
-            logger.error("Failed to restart Mosquitto broker")
+        # Bridges are only read at startup, so the broker has to restart
+        result = await reload_manager.request_async(f"Bridge {bridge_name} configured", RESTART)
+        if not result["success"]:
+            logger.error(f"Failed to restart Mosquitto broker: {result['message']}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to restart Mosquitto broker"
@@ -258,7 +259,8 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "blocking_io": blocking_executor.stats(),
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/bench_classifier.py
+"""Microbenchmark for the mosquitto log classifier.
+
+Usage:
+    python bench_classifier.py /var/log/mosquitto/mosquitto.log
+    python bench_classifier.py --generate 2000000
+
+Reports lines/s for the classifier and, for reference, for the previous
+per-line regexes alone. The legacy figure is a lower bound on the old cost:
+it leaves out the per-line prints and model construction, and it only
+recognises connects and disconnects.
+"""
+import argparse
+import random
+import re
+import time
+from collections import Counter
+from typing import List
+
+from log_classifier import LogClassifier
+
+
+def generate_lines(count: int) -> List[str]:
+    """Synthetic log with the mix of a busy broker running log_type all"""
+    rng = random.Random(42)
+    lines = []
+    ts = 1700000000
+    for i in range(count):
+        ts += rng.random() < 0.01
+        client = f"client-{rng.randrange(50000)}"
+        ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        port = rng.randrange(1024, 65535)
+        r = rng.random()
+        if r < 0.15:
+            lines.append(f"{ts}: New connection from {ip}:{port} on port 1900.")
+        elif r < 0.30:
+            lines.append(f"{ts}: New client connected from {ip}:{port} as {client} (p2, c1, k60, u'user{i % 100}').")
+        elif r < 0.40:
+            lines.append(f"{ts}: Client {client} disconnected.")
+        elif r < 0.43:
+            lines.append(f"{ts}: Client {client} closed its connection.")
+        elif r < 0.45:
+            lines.append(f"{ts}: Client {client} has exceeded timeout, disconnecting.")
+        elif r < 0.47:
+            lines.append(f"{ts}: Socket error on client {client}, disconnecting.")
+        elif r < 0.48:
+            lines.append(f"{ts}: Client {client} disconnected, not authorised.")
+        elif r < 0.55:
+            lines.append(f"{ts}: Received SUBSCRIBE from {client}")
+            lines.append(f"{ts}: \tsensors/{client}/# (QoS 1)")
+            lines.append(f"{ts}: {client} 1 sensors/{client}/#")
+            lines.append(f"{ts}: Sending SUBACK to {client}")
+        elif r < 0.58:
+            lines.append(f"{ts}: Received UNSUBSCRIBE from {client}")
+            lines.append(f"{ts}: \tsensors/{client}/#")
+            lines.append(f"{ts}: Sending UNSUBACK to {client}")
+        elif r < 0.80:
+            lines.append(f"{ts}: Received PUBLISH from {client} (d0, q0, r0, m0, 'sensors/{client}/t', ... (5 bytes))")
+        else:
+            lines.append(f"{ts}: Received PINGREQ from {client}")
+            lines.append(f"{ts}: Sending PINGRESP to {client}")
+    return lines
+
+
+def legacy_parse(lines: List[str]) -> int:
+    matched = 0
+    for line in lines:
+        line = line.strip()
+        if re.match(r"(\d+): New client connected from (\d+\.\d+\.\d+\.\d+):(\d+) as (\S+) \(p(\d+), c(\d+), k(\d+), u'([^']+)'\)", line):
+            matched += 1
+        elif re.match(r"(\d+): Client (\S+) disconnected", line):
+            matched += 1
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logfile", nargs="?", help="captured mosquitto.log to classify")
+    parser.add_argument("--generate", type=int, default=1000000, help="synthetic lines when no log file is given")
+    parser.add_argument("--skip-legacy", action="store_true", help="only benchmark the new classifier")
+    args = parser.parse_args()
+
+    if args.logfile:
+        with open(args.logfile, "r", errors="replace") as f:
+            lines = f.read().split("\n")
+        print(f"Loaded {len(lines)} lines from {args.logfile}")
+    else:
+        lines = generate_lines(args.generate)
+        print(f"Generated {len(lines)} synthetic lines")
+
+    classifier = LogClassifier()
+    start = time.perf_counter()
+    entries = classifier.classify_lines(lines)
+    elapsed = time.perf_counter() - start
+    print(f"classifier: {len(lines) / elapsed:,.0f} lines/s ({elapsed:.2f}s, {len(entries)} events)")
+    for kind, count in Counter(entry.kind for entry in entries).most_common():
+        print(f"  {kind:<18} {count}")
+
+    if not args.skip_legacy:
+        start = time.perf_counter()
+        matched = legacy_parse(lines)
+        elapsed = time.perf_counter() - start
+        print(f"legacy:     {len(lines) / elapsed:,.0f} lines/s ({elapsed:.2f}s, {matched} events)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/dynsec_client.py
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+DYNSEC_CONTROL_TOPIC = "$CONTROL/dynamic-security/v1"
+DYNSEC_RESPONSE_TOPIC = "$CONTROL/dynamic-security/v1/response"
+
+# Seconds to wait for the broker to answer a command
+DYNSEC_COMMAND_TIMEOUT = float(os.getenv("DYNSEC_COMMAND_TIMEOUT", "10"))
+
+
+class DynsecError(Exception):
+    """Raised when the dynsec control connection cannot deliver a command"""
+
+
+class DynsecClient:
+    """Long-lived MQTT client for the dynamic-security control API.
+
+    One authenticated connection is kept open and reused. Commands are
+    published on $CONTROL/dynamic-security/v1 and each one carries a unique
+    correlationData value, which is used to match the broker's responses back
+    to the waiting caller. Several commands can share one publish.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._client = None
+
+    def _create_client(self):
+        client_id = f"bunkerm-dynsec-{secrets.token_hex(4)}"
+        try:
+            client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id=client_id)
+        except AttributeError:
+            # Fall back to older MQTT client if necessary
+            client = mqtt_client.Client(client_id=client_id)
+        client.username_pw_set(self.username, self.password)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=10)
+        return client
+
+    def start(self):
+        """Connect in the background. Safe to call more than once."""
+        with self._start_lock:
+            if self._client is not None:
+                return
+            self._client = self._create_client()
+            logger.info(f"Connecting dynsec control client to {self.host}:{self.port}")
+            self._client.connect_async(self.host, self.port, 60)
+            self._client.loop_start()
+
+    def stop(self):
+        with self._start_lock:
+            if self._client is None:
+                return
+            self._client.disconnect()
+            self._client.loop_stop()
+            self._client = None
+            self._connected.clear()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code == 0:
+            client.subscribe(DYNSEC_RESPONSE_TOPIC, qos=1)
+            self._connected.set()
+            logger.info("Dynsec control client connected")
+        else:
+            logger.error(f"Dynsec control client failed to connect: {reason_code}")
+
+    def _on_disconnect(self, client, userdata, *args):
+        self._connected.clear()
+        logger.warning("Dynsec control client disconnected")
+        # Responses to in-flight commands are lost with the connection
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(DynsecError("Connection to broker lost"))
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError:
+            logger.error("Received malformed dynsec response")
+            return
+
+        for response in payload.get("responses", []):
+            correlation_id = response.get("correlationData")
+            with self._pending_lock:
+                future = self._pending.pop(correlation_id, None)
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    def submit(self, commands: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Future]:
+        """Publish commands in a single payload and return one future per command.
+
+        Each future resolves to the broker's response dict for that command.
+        """
+        self.start()
+        timeout = DYNSEC_COMMAND_TIMEOUT if timeout is None else timeout
+        if not self._connected.wait(timeout):
+            raise DynsecError(f"Not connected to broker at {self.host}:{self.port}")
+
+        futures = []
+        payload_commands = []
+        with self._pending_lock:
+            for command in commands:
+                correlation_id = uuid.uuid4().hex
+                future: Future = Future()
+                self._pending[correlation_id] = future
+                futures.append(future)
+                payload_commands.append({**command, "correlationData": correlation_id})
+
+        info = self._client.publish(
+            DYNSEC_CONTROL_TOPIC, json.dumps({"commands": payload_commands}), qos=1
+        )
+        if info.rc != mqtt_client.MQTT_ERR_SUCCESS:
+            with self._pending_lock:
+                for command in payload_commands:
+                    self._pending.pop(command["correlationData"], None)
+            raise DynsecError(f"Failed to publish dynsec command: {mqtt_client.error_string(info.rc)}")
+        return futures
+
+    def _forget(self, futures: List[Future]):
+        """Drop futures that timed out so late responses are ignored"""
+        with self._pending_lock:
+            for correlation_id, future in list(self._pending.items()):
+                if future in futures:
+                    del self._pending[correlation_id]
+
+    def execute(self, commands: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Send commands and block until all responses arrive"""
+        timeout = DYNSEC_COMMAND_TIMEOUT if timeout is None else timeout
+        futures = self.submit(commands, timeout)
+        try:
+            return [future.result(timeout) for future in futures]
+        except FutureTimeoutError:
+            self._forget(futures)
+            raise DynsecError("Timed out waiting for dynsec response")
+
+    async def execute_async(self, commands: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Send commands and await all responses without blocking the event loop"""
+        timeout = DYNSEC_COMMAND_TIMEOUT if timeout is None else timeout
+        if not self._connected.is_set():
+            # Connection setup blocks, so wait for it in a worker thread
+            futures = await asyncio.to_thread(self.submit, commands, timeout)
+        else:
+            futures = self.submit(commands, timeout)
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(asyncio.wrap_future(future) for future in futures)),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            self._forget(futures)
+            raise DynsecError("Timed out waiting for dynsec response")
+
+
+def response_result(response: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Convert a dynsec response dict into the (success, data_or_error) convention"""
+    if response.get("error"):
+        return False, response["error"]
+    return True, response.get("data", {})
@@ -0,0 +1,308 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/event_history.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from event_store import EventRecord
+
+logger = logging.getLogger(__name__)
+
+CLIENTLOGS_DB_PATH = os.getenv("CLIENTLOGS_DB_PATH", "/app/clientlogs/data/events.db")
+# How long events and closed sessions are kept
+CLIENTLOGS_RETENTION_DAYS = int(os.getenv("CLIENTLOGS_RETENTION_DAYS", "30"))
+# Pending events are written at least this often, or sooner once a batch fills up
+EVENT_HISTORY_FLUSH_INTERVAL = float(os.getenv("EVENT_HISTORY_FLUSH_INTERVAL", "1.0"))
+EVENT_HISTORY_BATCH_SIZE = int(os.getenv("EVENT_HISTORY_BATCH_SIZE", "5000"))
+
+SECONDS_PER_DAY = 86400
+
+EVENT_COLUMNS = (
+    "id", "ts", "event_type", "client_id", "details", "status", "protocol_level",
+    "clean_session", "keep_alive", "username", "ip_address", "port",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    details TEXT NOT NULL,
+    status TEXT NOT NULL,
+    protocol_level TEXT NOT NULL,
+    clean_session INTEGER NOT NULL,
+    keep_alive INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    ip_address TEXT NOT NULL,
+    port INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_client_ts ON events (client_id, ts);
+CREATE INDEX IF NOT EXISTS idx_events_username_ts ON events (username, ts);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    ip_address TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol_level TEXT NOT NULL,
+    clean_session INTEGER NOT NULL,
+    keep_alive INTEGER NOT NULL,
+    connected_at INTEGER NOT NULL,
+    disconnected_at INTEGER,
+    end_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_client_connected ON sessions (client_id, connected_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_open ON sessions (client_id) WHERE disconnected_at IS NULL;
+"""
+
+
+def _row_to_record(row: sqlite3.Row) -> EventRecord:
+    record = EventRecord(
+        id=row["id"],
+        ts=row["ts"],
+        event_type=row["event_type"],
+        client_id=row["client_id"],
+        details=row["details"],
+        status=row["status"],
+        protocol_level=row["protocol_level"],
+        clean_session=bool(row["clean_session"]),
+        keep_alive=row["keep_alive"],
+        username=row["username"],
+        ip_address=row["ip_address"],
+        port=row["port"],
+    )
+    record.seq = row["seq"]
+    return record
+
+
+class EventHistory:
+    """On-disk history of client events and sessions, in SQLite with WAL.
+
+    Events are queued in memory and written by a background thread in
+    batches, one transaction per batch. Connect events open a row in the
+    sessions table and session-ending events close it, so the set of open
+    sessions survives restarts and rebuilds the connected-client table.
+    Events are indexed by time and by client_id/username plus time, and
+    sessions by client_id plus connect time. Per-client range queries
+    therefore stay index lookups however large the table grows.
+    """
+
+    def __init__(self, filename: str = CLIENTLOGS_DB_PATH, retention_days: int = CLIENTLOGS_RETENTION_DAYS):
+        self.filename = filename
+        self.retention_days = retention_days
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # Separate connection for queries so reads do not wait for batch writes
+        self._read_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+        self._pending: List[Tuple[EventRecord, Optional[str]]] = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_retention = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.filename, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Writing
+
+    def record(self, event: EventRecord, session_change: Optional[str] = None):
+        """Queue an event. session_change is "open", "close" or None."""
+        with self._pending_lock:
+            self._pending.append((event, session_change))
+            full = len(self._pending) >= EVENT_HISTORY_BATCH_SIZE
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        with self._write_lock:
+            try:
+                self._write_batch(batch)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.error(f"Error writing {len(batch)} events to history: {str(e)}")
+
+    def _write_batch(self, batch: List[Tuple[EventRecord, Optional[str]]]):
+        conn = self._conn
+        # Rows keep the in-memory sequence number, so numbering continues across restarts
+        conn.executemany(
+            f"INSERT INTO events (seq, {', '.join(EVENT_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(EVENT_COLUMNS))})",
+            [
+                (
+                    e.seq, e.id, e.ts, e.event_type, e.client_id, e.details, e.status, e.protocol_level,
+                    int(e.clean_session), e.keep_alive, e.username, e.ip_address, e.port,
+                )
+                for e, _ in batch
+            ],
+        )
+        # Session changes must be applied in order, since a client can reconnect within a batch
+        for e, change in batch:
+            if change is None:
+                continue
+            # A new connection also ends any session the broker took over
+            conn.execute(
+                "UPDATE sessions SET disconnected_at = ?, end_reason = ? "
+                "WHERE client_id = ? AND disconnected_at IS NULL",
+                (e.ts, e.details if change == "close" else "Session taken over", e.client_id),
+            )
+            if change == "open":
+                conn.execute(
+                    "INSERT INTO sessions (client_id, username, ip_address, port, protocol_level, "
+                    "clean_session, keep_alive, connected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        e.client_id, e.username, e.ip_address, e.port, e.protocol_level,
+                        int(e.clean_session), e.keep_alive, e.ts,
+                    ),
+                )
+
+    def enforce_retention(self):
+        """Delete events and closed sessions older than the retention window"""
+        cutoff = int(time.time()) - self.retention_days * SECONDS_PER_DAY
+        with self._write_lock:
+            events = self._conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+            sessions = self._conn.execute(
+                "DELETE FROM sessions WHERE disconnected_at IS NOT NULL AND disconnected_at < ?",
+                (cutoff,),
+            ).rowcount
+            self._conn.commit()
+        if events or sessions:
+            logger.info(f"Removed {events} events and {sessions} sessions past retention")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(EVENT_HISTORY_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - self._last_retention > 3600:
+                self._last_retention = time.monotonic()
+                try:
+                    self.enforce_retention()
+                except sqlite3.Error as e:
+                    logger.error(f"Error enforcing event retention: {str(e)}")
+        self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="event-history", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    # Reading
+
+    def _query(self, sql: str, params: tuple) -> List[sqlite3.Row]:
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def open_sessions(self) -> List[EventRecord]:
+        """Connection events for every session that has not ended"""
+        rows = self._query(
+            "SELECT * FROM sessions WHERE disconnected_at IS NULL ORDER BY connected_at", ()
+        )
+        return [
+            EventRecord(
+                ts=row["connected_at"],
+                event_type="Client Connection",
+                client_id=row["client_id"],
+                details=f"Connected from {row['ip_address']}:{row['port']}",
+                status="success",
+                protocol_level=row["protocol_level"],
+                clean_session=bool(row["clean_session"]),
+                keep_alive=row["keep_alive"],
+                username=row["username"],
+                ip_address=row["ip_address"],
+                port=row["port"],
+            )
+            for row in rows
+        ]
+
+    def recent_events(self, limit: int) -> List[EventRecord]:
+        """Newest events, oldest first"""
+        rows = self._query("SELECT * FROM events ORDER BY seq DESC LIMIT ?", (limit,))
+        return [_row_to_record(row) for row in reversed(rows)]
+
+    def events(
+        self,
+        start: int,
+        end: int,
+        client_id: Optional[str] = None,
+        username: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """Events in [start, end], newest first, optionally for one client or username"""
+        where = "ts BETWEEN ? AND ?"
+        params: tuple = (start, end)
+        if client_id:
+            where = "client_id = ? AND " + where
+            params = (client_id,) + params
+        elif username:
+            where = "username = ? AND " + where
+            params = (username,) + params
+        rows = self._query(
+            f"SELECT * FROM events WHERE {where} ORDER BY ts DESC, seq DESC LIMIT ?",
+            params + (limit,),
+        )
+        return [_row_to_record(row).to_dict() for row in rows]
+
+    def sessions(self, client_id: str, start: int, end: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Sessions of a client that overlap [start, end], newest first"""
+        rows = self._query(
+            "SELECT * FROM sessions WHERE client_id = ? AND connected_at <= ? "
+            "AND (disconnected_at IS NULL OR disconnected_at >= ?) "
+            "ORDER BY connected_at DESC LIMIT ?",
+            (client_id, end, start, limit),
+        )
+        return [
+            {
+                "client_id": row["client_id"],
+                "username": row["username"],
+                "ip_address": row["ip_address"],
+                "port": row["port"],
+                "protocol_level": row["protocol_level"],
+                "connected_at": row["connected_at"],
+                "disconnected_at": row["disconnected_at"],
+                "duration": (row["disconnected_at"] or int(time.time())) - row["connected_at"],
+                "end_reason": row["end_reason"],
+            }
+            for row in rows
+        ]
+
+    def close(self):
+        self.stop()
+        with self._write_lock:
+            self._conn.close()
+        with self._read_lock:
+            self._read_conn.close()
@@ -0,0 +1,205 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/event_store.py
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+# Maximum number of events kept in memory
+CLIENTLOGS_MAX_EVENTS = int(os.getenv("CLIENTLOGS_MAX_EVENTS", "100000"))
+
+
+class EventRecord:
+    """Compact in-memory form of an MQTTEvent"""
+
+    __slots__ = (
+        "seq", "id", "ts", "event_type", "client_id", "details", "status",
+        "protocol_level", "clean_session", "keep_alive", "username", "ip_address", "port",
+    )
+
+    def __init__(
+        self,
+        ts: int,
+        event_type: str,
+        client_id: str,
+        details: str,
+        status: str,
+        protocol_level: str,
+        clean_session: bool,
+        keep_alive: int,
+        username: str,
+        ip_address: str,
+        port: int,
+        id: Optional[str] = None,
+    ):
+        self.seq = 0
+        self.id = id or str(uuid.uuid4())
+        self.ts = ts
+        self.event_type = event_type
+        self.client_id = client_id
+        self.details = details
+        self.status = status
+        self.protocol_level = protocol_level
+        self.clean_session = clean_session
+        self.keep_alive = keep_alive
+        self.username = username
+        self.ip_address = ip_address
+        self.port = port
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.ts).isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as MQTTEvent.dict()"""
+        return {
+            "seq": self.seq,
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "event_type": self.event_type,
+            "client_id": self.client_id,
+            "details": self.details,
+            "status": self.status,
+            "protocol_level": self.protocol_level,
+            "clean_session": self.clean_session,
+            "keep_alive": self.keep_alive,
+            "username": self.username,
+            "ip_address": self.ip_address,
+            "port": self.port,
+        }
+
+
+class EventStore:
+    """Fixed-capacity ring buffer of events with per-client, username and IP indexes.
+
+    Events are numbered with an increasing sequence number and stored in slot
+    seq % capacity, so the newest k events are read in O(k) without sorting.
+    Each index maps a key to a deque of sequence numbers in arrival order.
+    When a slot is overwritten, the evicted event is always the oldest entry
+    in each of its deques and is removed with popleft(). Memory therefore
+    stays bounded by capacity.
+    """
+
+    INDEXED_FIELDS = ("client_id", "username", "ip_address")
+
+    def __init__(self, capacity: int = CLIENTLOGS_MAX_EVENTS):
+        self.capacity = capacity
+        self._slots: List[Optional[EventRecord]] = [None] * capacity
+        self._next_seq = 0
+        # Numbering starts above 0 when events are restored from an earlier run
+        self._base_seq = 0
+        self._indexes: Dict[str, Dict[str, Deque[int]]] = {field: {} for field in self.INDEXED_FIELDS}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._next_seq - self.first_seq
+
+    @property
+    def last_seq(self) -> int:
+        """Sequence number of the newest event (-1 when empty)"""
+        return self._next_seq - 1
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest event still held"""
+        return max(self._base_seq, self._next_seq - self.capacity)
+
+    def restore(self, events: List[EventRecord]):
+        """Load events from an earlier run, oldest first, into an empty store.
+
+        Numbering continues from the newest restored event, so sequence
+        numbers held by clients from before the restart stay in the past.
+        """
+        if not events:
+            return
+        with self._lock:
+            self._next_seq = self._base_seq = max(0, events[-1].seq + 1 - len(events))
+        for event in events:
+            self.append(event)
+
+    def append(self, event: EventRecord) -> EventRecord:
+        with self._lock:
+            seq = self._next_seq
+            slot = seq % self.capacity
+            evicted = self._slots[slot]
+            if evicted is not None:
+                self._unindex(evicted)
+
+            event.seq = seq
+            self._slots[slot] = event
+            for field in self.INDEXED_FIELDS:
+                key = getattr(event, field)
+                if key:
+                    self._indexes[field].setdefault(key, deque()).append(seq)
+            self._next_seq = seq + 1
+            return event
+
+    def _unindex(self, event: EventRecord):
+        for field in self.INDEXED_FIELDS:
+            key = getattr(event, field)
+            if not key:
+                continue
+            seqs = self._indexes[field].get(key)
+            if seqs and seqs[0] == event.seq:
+                seqs.popleft()
+                if not seqs:
+                    del self._indexes[field][key]
+
+    def newest(self, limit: int, since: int = -1) -> List[EventRecord]:
+        """Newest events first, only those after sequence number `since`"""
+        with self._lock:
+            first = max(self.first_seq, since + 1)
+            start = self._next_seq - 1
+            stop = max(first, self._next_seq - limit) - 1
+            return [self._slots[seq % self.capacity] for seq in range(start, stop, -1)]
+
+    def newest_by(self, field: str, key: str, limit: int, since: int = -1) -> List[EventRecord]:
+        """Newest events first for one client_id, username or ip_address"""
+        with self._lock:
+            seqs = self._indexes[field].get(key)
+            if not seqs:
+                return []
+            result = []
+            for i in range(len(seqs) - 1, max(-1, len(seqs) - 1 - limit), -1):
+                if seqs[i] <= since:
+                    break
+                result.append(self._slots[seqs[i] % self.capacity])
+            return result
+
+    def since_by(self, field: str, key: str, seq: int, limit: int) -> List[EventRecord]:
+        """Oldest first, up to `limit` events for one client_id, username or ip_address after `seq`"""
+        with self._lock:
+            seqs = self._indexes[field].get(key)
+            if not seqs:
+                return []
+            # Walk back from the newest to the first entry after `seq`
+            i = len(seqs)
+            while i > 0 and seqs[i - 1] > seq:
+                i -= 1
+            return [self._slots[seqs[j] % self.capacity] for j in range(i, min(len(seqs), i + limit))]
+
+    def since(self, seq: int, limit: int) -> List[EventRecord]:
+        """Oldest first, up to `limit` events after sequence number `seq`"""
+        with self._lock:
+            first = max(self.first_seq, seq + 1)
+            stop = min(self._next_seq, first + limit)
+            return [self._slots[s % self.capacity] for s in range(first, stop)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "size": self._next_seq - self.first_seq,
+                "total_seen": self._next_seq,
+                "clients": len(self._indexes["client_id"]),
+                "usernames": len(self._indexes["username"]),
+                "ip_addresses": len(self._indexes["ip_address"]),
+            }
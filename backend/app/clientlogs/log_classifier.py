@@ -0,0 +1,160 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/log_classifier.py
+import re
+from typing import Any, Dict, List, Optional
+
+# Event kinds produced by the classifier
+CONNECT = "connect"
+DISCONNECT = "disconnect"
+CLOSED = "closed"
+KEEPALIVE_TIMEOUT = "keepalive_timeout"
+SOCKET_ERROR = "socket_error"
+AUTH_FAILURE = "auth_failure"
+PROTOCOL_ERROR = "protocol_error"
+SUBSCRIBE = "subscribe"
+UNSUBSCRIBE = "unsubscribe"
+
+# Kinds that end a client's session
+SESSION_END_KINDS = frozenset(
+    {DISCONNECT, CLOSED, KEEPALIVE_TIMEOUT, SOCKET_ERROR, AUTH_FAILURE, PROTOCOL_ERROR}
+)
+
+# Precompiled patterns, applied only after a prefix check has picked one
+CONNECT_RE = re.compile(
+    r"New client connected from (\S+):(\d+) as (\S+) "
+    r"\(p(\d+), c(\d+), k(\d+)(?:, u'([^']*)')?\)"
+)
+# Newer brokers add the address after the client id: "Client id [1.2.3.4:5678] ..."
+CLIENT_RE = re.compile(r"Client (\S+)(?: \[[^\]]*\])? (.*)")
+SUBSCRIBE_TOPIC_RE = re.compile(r"\t(.+) \(QoS (\d)\)\s*$")
+
+# Message tails after "Client <id> " and what they mean
+CLIENT_TAILS = {
+    "disconnected.": DISCONNECT,
+    "closed its connection.": CLOSED,
+    "has exceeded timeout, disconnecting.": KEEPALIVE_TIMEOUT,
+    "disconnected, not authorised.": AUTH_FAILURE,
+    "disconnected due to protocol error.": PROTOCOL_ERROR,
+}
+
+
+class LogEntry:
+    """One classified mosquitto log line"""
+
+    __slots__ = ("kind", "ts", "client_id", "data")
+
+    def __init__(self, kind: str, ts: int, client_id: str, data: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.ts = ts
+        self.client_id = client_id
+        self.data = data or {}
+
+    def __repr__(self):
+        return f"LogEntry({self.kind!r}, {self.ts}, {self.client_id!r}, {self.data!r})"
+
+
+class LogClassifier:
+    """Single-pass classifier for mosquitto log lines.
+
+    Each line is routed on the first character of the message after its
+    "<unix ts>: " prefix, using offsets rather than slices, and only the one
+    regex that can match is then applied. Most lines are uninteresting and
+    drop out after a couple of startswith() calls. SUBSCRIBE and UNSUBSCRIBE packets are
+    logged as a "Received ..." line followed by tab-indented topic lines
+    (log_type all), so the classifier remembers which client the current
+    packet belongs to.
+    """
+
+    def __init__(self):
+        self._pending_kind: Optional[str] = None
+        self._pending_client: Optional[str] = None
+
+    def classify(self, line: str) -> Optional[LogEntry]:
+        # Work on offsets into the line so uninteresting lines allocate nothing
+        colon = line.find(": ", 0, 24)
+        if colon <= 0:
+            return None
+        pos = colon + 2
+        first = line[pos:pos + 1]
+
+        if first == "R":
+            if line.startswith("Received SUBSCRIBE from ", pos):
+                self._pending_kind, self._pending_client = SUBSCRIBE, line[pos + 24:].rstrip()
+            elif line.startswith("Received UNSUBSCRIBE from ", pos):
+                self._pending_kind, self._pending_client = UNSUBSCRIBE, line[pos + 26:].rstrip()
+            else:
+                self._pending_kind = None
+            return None
+        if first == "S":
+            if line.startswith("Socket error on client ", pos):
+                client_id = line[pos + 23:].split(",", 1)[0]
+                return self._entry(SOCKET_ERROR, line, colon, client_id, {"reason": "socket error"})
+            self._pending_kind = None
+            return None
+        if first == "N":
+            if line.startswith("New client connected from ", pos):
+                return self._connect(line, colon, pos)
+            return None
+        if first == "C":
+            if line.startswith("Client ", pos):
+                return self._client(line, colon, pos)
+            return None
+        if first == "\t" and self._pending_kind is not None:
+            return self._topic_line(line, colon, pos)
+        return None
+
+    @staticmethod
+    def _entry(kind: str, line: str, colon: int, client_id: str, data: Dict[str, Any]) -> Optional[LogEntry]:
+        ts = line[:colon]
+        if not ts.isdigit():
+            return None
+        return LogEntry(kind, int(ts), client_id, data)
+
+    def classify_lines(self, lines: List[str]) -> List[LogEntry]:
+        classify = self.classify
+        return [entry for entry in map(classify, lines) if entry is not None]
+
+    def _connect(self, line: str, colon: int, pos: int) -> Optional[LogEntry]:
+        match = CONNECT_RE.match(line, pos)
+        if not match:
+            return None
+        ip, port, client_id, protocol, clean, keep_alive, username = match.groups()
+        return self._entry(CONNECT, line, colon, client_id, {
+            "ip_address": ip,
+            "port": int(port),
+            "protocol": protocol,
+            "clean_session": clean == "1",
+            "keep_alive": int(keep_alive),
+            "username": username or "",
+        })
+
+    def _client(self, line: str, colon: int, pos: int) -> Optional[LogEntry]:
+        match = CLIENT_RE.match(line, pos)
+        if not match:
+            return None
+        client_id, tail = match.groups()
+        tail = tail.rstrip()
+        kind = CLIENT_TAILS.get(tail)
+        if kind is None:
+            if not tail.startswith("disconnected"):
+                return None
+            # Other reasons, e.g. "disconnected due to oversize packet."
+            kind = DISCONNECT
+        return self._entry(kind, line, colon, client_id, {"reason": tail.rstrip(".")})
+
+    def _topic_line(self, line: str, colon: int, pos: int) -> Optional[LogEntry]:
+        if self._pending_kind == SUBSCRIBE:
+            match = SUBSCRIBE_TOPIC_RE.match(line, pos)
+            if match:
+                return self._entry(SUBSCRIBE, line, colon, self._pending_client, {
+                    "topic": match.group(1),
+                    "qos": int(match.group(2)),
+                })
+            return None
+        return self._entry(UNSUBSCRIBE, line, colon, self._pending_client, {"topic": line[pos + 1:].rstrip()})
@@ -0,0 +1,257 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/log_tailer.py
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the log per system call
+LOG_TAIL_CHUNK_SIZE = int(os.getenv("LOG_TAIL_CHUNK_SIZE", str(1024 * 1024)))
+# How often the file is checked when inotify is unavailable (and as a safety net when it is)
+LOG_TAIL_POLL_INTERVAL = float(os.getenv("LOG_TAIL_POLL_INTERVAL", "1.0"))
+# Seconds between writes of the persisted read offset
+LOG_TAIL_OFFSET_SAVE_INTERVAL = float(os.getenv("LOG_TAIL_OFFSET_SAVE_INTERVAL", "2.0"))
+# Bytes at the end of the log replayed on a first start, when there is no saved offset
+LOG_TAIL_REPLAY_BYTES = int(os.getenv("LOG_TAIL_REPLAY_BYTES", str(8 * 1024 * 1024)))
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class _Inotify:
+    """Minimal inotify wrapper over libc; used only to wake the follower up"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the directory rather than the file so renames and re-creates are seen
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> bool:
+        """Block until something changes in the directory or timeout expires"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # Drain the queue; the events themselves are not needed
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogTailer:
+    """Follow a growing log file and hand complete lines to a callback in batches.
+
+    Changes are detected with inotify when available, with stat() polling as
+    the fallback. Data is read in large chunks, and every chunk is split into
+    lines and delivered as one batch. Rename rotation is detected by an inode
+    change: the rest of the old file is drained before the new one is opened.
+    copytruncate rotation is detected when the file shrinks below the read
+    position. The read position is saved to offset_path so that a restart
+    resumes where the previous process stopped. Without a saved position the
+    last replay_bytes of the file are read first, so connections made just
+    before a first start are still seen.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        on_lines: Callable[[List[str]], None],
+        offset_path: Optional[str] = None,
+        start_at_end: bool = True,
+        replay_bytes: int = LOG_TAIL_REPLAY_BYTES,
+    ):
+        self.path = path
+        self.on_lines = on_lines
+        self.offset_path = offset_path
+        self.start_at_end = start_at_end
+        self.replay_bytes = replay_bytes
+        self._file = None
+        self._inode: Optional[int] = None
+        self._position = 0
+        self._partial = b""
+        self._last_saved = 0.0
+        self._saved_position: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.lines_read = 0
+        self.rotations = 0
+
+    # Offset persistence
+
+    def _load_offset(self) -> Optional[dict]:
+        if not self.offset_path:
+            return None
+        try:
+            with open(self.offset_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_offset(self, force: bool = False):
+        if not self.offset_path or self._inode is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_saved < LOG_TAIL_OFFSET_SAVE_INTERVAL:
+            return
+        # Only complete lines count as consumed
+        position = self._position - len(self._partial)
+        if position == self._saved_position:
+            self._last_saved = now
+            return
+        tmp_path = f"{self.offset_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.offset_path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"path": self.path, "inode": self._inode, "offset": position}, f)
+            os.replace(tmp_path, self.offset_path)
+            self._saved_position = position
+        except OSError as e:
+            logger.error(f"Error saving log offset: {str(e)}")
+        self._last_saved = now
+
+    # File handling
+
+    def _open(self, resume: bool = False) -> bool:
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        st = os.fstat(f.fileno())
+        position = 0
+        saved = self._load_offset() if resume else None
+        if saved and saved.get("inode") == st.st_ino and 0 <= saved.get("offset", -1) <= st.st_size:
+            position = saved["offset"]
+            logger.info(f"Resuming {self.path} at offset {position}")
+        elif resume and self.start_at_end:
+            position = max(0, st.st_size - self.replay_bytes)
+            if position:
+                logger.info(f"Replaying the last {st.st_size - position} bytes of {self.path}")
+                # Replay starts mid-file; skip to the first complete line
+                f.seek(position)
+                position += len(f.readline())
+        f.seek(position)
+        self._file = f
+        self._inode = st.st_ino
+        self._position = position
+        self._partial = b""
+        return True
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_available(self):
+        """Read everything currently in the open file, delivering one batch per chunk"""
+        while not self._stop.is_set():
+            chunk = self._file.read(LOG_TAIL_CHUNK_SIZE)
+            if not chunk:
+                return
+            self._position += len(chunk)
+            data = self._partial + chunk
+            end = data.rfind(b"\n")
+            if end < 0:
+                self._partial = data
+                continue
+            self._partial = data[end + 1:]
+            lines = data[:end].decode("utf-8", errors="replace").split("\n")
+            self.lines_read += len(lines)
+            try:
+                self.on_lines(lines)
+            except Exception as e:
+                logger.error(f"Error processing log lines: {str(e)}")
+            self._save_offset()
+
+    def _check(self):
+        if self._file is None:
+            # Resume from the saved offset only the first time the file is opened
+            if not self._open(resume=self._inode is None):
+                return
+
+        self._read_available()
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # Renamed away and not yet re-created; keep draining the old file
+            return
+
+        if st.st_ino != self._inode:
+            # Rename rotation: finish the old file, then switch to the new one
+            self._read_available()
+            self._close()
+            self.rotations += 1
+            logger.info(f"{self.path} was rotated, following the new file")
+            if self._open():
+                self._read_available()
+        elif st.st_size < self._position:
+            # copytruncate rotation: the same file was emptied underneath us
+            self.rotations += 1
+            logger.info(f"{self.path} was truncated, reading from the start")
+            self._file.seek(0)
+            self._position = 0
+            self._partial = b""
+            self._read_available()
+
+    def run(self):
+        """Follow the file until stop() is called"""
+        inotify = None
+        try:
+            inotify = _Inotify(os.path.dirname(os.path.abspath(self.path)))
+            logger.info(f"Following {self.path} with inotify")
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify unavailable ({e}), polling {self.path}")
+
+        try:
+            while not self._stop.is_set():
+                self._check()
+                if inotify is not None:
+                    inotify.wait(LOG_TAIL_POLL_INTERVAL)
+                else:
+                    self._stop.wait(LOG_TAIL_POLL_INTERVAL)
+        finally:
+            self._save_offset(force=True)
+            self._close()
+            if inotify is not None:
+                inotify.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="log-tailer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
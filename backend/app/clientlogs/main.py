@@ -5,40 +5,52 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 # Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
 #
-import re
+import asyncio
 import json
-from datetime import datetime
-from typing import Dict, List
-import subprocess
-from fastapi import FastAPI, HTTPException
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import uvicorn
 from pydantic import BaseModel
-import uuid
 import os
 from dotenv import load_dotenv
+from dynsec_client import DynsecClient, DynsecError, response_result
+from log_tailer import LogTailer
+from event_store import EventRecord, EventStore
+from event_history import EventHistory
+from session_analytics import SessionAnalytics
+from presence import PRESENCE_ENABLED, PresenceEngine
+from datetime import datetime
+import log_classifier
+from log_classifier import LogClassifier, LogEntry
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Environment variables
 MOSQUITTO_ADMIN_USERNAME = os.getenv("MOSQUITTO_ADMIN_USERNAME", "bunker")
 MOSQUITTO_ADMIN_PASSWORD = os.getenv("MOSQUITTO_ADMIN_PASSWORD", "bunker")
 MOSQUITTO_IP = os.getenv("MOSQUITTO_IP", "localhost")
 MOSQUITTO_PORT = os.getenv("MOSQUITTO_PORT", "1883")
+MOSQUITTO_LOG_PATH = os.getenv("MOSQUITTO_LOG_PATH", "/var/log/mosquitto/mosquitto.log")
+# Where the log follower records how far it has read
+LOG_OFFSET_PATH = os.getenv("CLIENTLOGS_OFFSET_PATH", "/app/clientlogs/data/log_offset.json")
 
-# Base command for mosquitto_ctrl
-MOSQUITTO_BASE_COMMAND = [
-    "mosquitto_ctrl",
-    "-h", MOSQUITTO_IP,
-    "-p", MOSQUITTO_PORT,
-    "-u", MOSQUITTO_ADMIN_USERNAME,
-    "-P", MOSQUITTO_ADMIN_PASSWORD,
-    "dynsec"
-]
+# Persistent connection to the dynamic-security control topic
+dynsec_client = DynsecClient(
+    MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD
+)
 
+# Shape of the events returned by the API; stored in memory as EventRecord
 class MQTTEvent(BaseModel):
+    seq: int
     id: str
     timestamp: str
     event_type: str
@@ -52,101 +64,205 @@ class MQTTEvent(BaseModel):
     ip_address: str
     port: int
 
+# How each classified log entry is presented as an event
+EVENT_TYPES = {
+    log_classifier.CONNECT: ("Client Connection", "success"),
+    log_classifier.DISCONNECT: ("Client Disconnection", "warning"),
+    log_classifier.CLOSED: ("Client Disconnection", "warning"),
+    log_classifier.KEEPALIVE_TIMEOUT: ("Keepalive Timeout", "warning"),
+    log_classifier.SOCKET_ERROR: ("Socket Error", "error"),
+    log_classifier.AUTH_FAILURE: ("Authentication Failure", "error"),
+    log_classifier.PROTOCOL_ERROR: ("Protocol Error", "error"),
+    log_classifier.SUBSCRIBE: ("Subscribe", "success"),
+    log_classifier.UNSUBSCRIBE: ("Unsubscribe", "success"),
+}
+
+PROTOCOL_VERSIONS = {"3": "3.1", "4": "3.1.1", "5": "5.0"}
+
+# Events loaded from the history database into memory at startup
+CLIENTLOGS_WARM_EVENTS = int(os.getenv("CLIENTLOGS_WARM_EVENTS", "10000"))
+
 class MQTTMonitor:
-    def __init__(self):
-        self.connected_clients: Dict[str, MQTTEvent] = {}
-        self.events: List[MQTTEvent] = []
+    def __init__(self, history: Optional[EventHistory] = None):
+        # Latest connection event per currently connected client
+        self.connected_clients: Dict[str, EventRecord] = {}
+        self.events = EventStore()
+        self.classifier = LogClassifier()
+        self.history = history
+        self.analytics = SessionAnalytics()
 
-    def parse_connection_log(self, log_line: str) -> MQTTEvent:
-        print(f"Processing log line: {log_line}")
+    def restore(self):
+        """Rebuild connected clients and recent events from the history database"""
+        if self.history is None:
+            return
+        self.events.restore(self.history.recent_events(min(CLIENTLOGS_WARM_EVENTS, self.events.capacity)))
+        for event in self.history.open_sessions():
+            self.connected_clients[event.client_id] = event
+        print(f"Restored {len(self.events)} events and {len(self.connected_clients)} connected clients")
 
-        # Regular expression to match connection log entries with timestamp
-        pattern = r"(\d+): New client connected from (\d+\.\d+\.\d+\.\d+):(\d+) as (\S+) \(p(\d+), c(\d+), k(\d+), u'([^']+)'\)"
-        match = re.match(pattern, log_line)
+    def record(self, event: EventRecord, session_change: Optional[str] = None) -> EventRecord:
+        # Appending numbers the event, which the history stores with it
+        self.events.append(event)
+        if self.history is not None:
+            self.history.record(event, session_change)
+        return event
 
-        if match:
-            print(f"Found connection match: {match.groups()}")
-            timestamp, ip, port, client_id, protocol, clean, keep_alive, username = (
-                match.groups()
-            )
+    def process_lines(self, lines: List[str]):
+        """Classify a batch of log lines and record the resulting events"""
+        entries = self.classifier.classify_lines(lines)
+        for entry in entries:
+            self.handle_entry(entry)
+        if entries:
+            event_broadcaster.notify()
+
+    def handle_entry(self, entry: LogEntry) -> EventRecord:
+        event_type, status = EVENT_TYPES[entry.kind]
+        data = entry.data
 
-            # Convert Unix timestamp to ISO format
-            iso_timestamp = datetime.fromtimestamp(int(timestamp)).isoformat()
-
-            protocol_versions = {"3": "3.1", "4": "3.1.1", "5": "5.0"}
-
-            event = MQTTEvent(
-                id=str(uuid.uuid4()),
-                timestamp=iso_timestamp,
-                event_type="Client Connection",
-                client_id=client_id,
-                details=f"Connected from {ip}:{port}",
-                status="success",
-                protocol_level=f"MQTT v{protocol_versions.get(protocol, 'unknown')}",
-                clean_session=clean == "1",
-                keep_alive=int(keep_alive),
-                username=username,
-                ip_address=ip,
-                port=int(port),
+        if entry.kind == log_classifier.CONNECT:
+            event = EventRecord(
+                ts=entry.ts,
+                event_type=event_type,
+                client_id=entry.client_id,
+                details=f"Connected from {data['ip_address']}:{data['port']}",
+                status=status,
+                protocol_level=f"MQTT v{PROTOCOL_VERSIONS.get(data['protocol'], 'unknown')}",
+                clean_session=data["clean_session"],
+                keep_alive=data["keep_alive"],
+                username=data["username"],
+                ip_address=data["ip_address"],
+                port=data["port"],
             )
+            self.connected_clients[entry.client_id] = event
+            self.analytics.on_connect(entry.ts, entry.client_id, data["ip_address"])
+            return self.record(event, "open")
 
-            print(f"Created event: {event.dict()}")
-            self.connected_clients[client_id] = event
-            self.events.append(event)
-            return event
+        # Other events carry the session details of the client's connection, when known
+        session_change = None
+        if entry.kind in log_classifier.SESSION_END_KINDS:
+            connected = self.connected_clients.pop(entry.client_id, None)
+            session_change = "close"
+            self.analytics.on_session_end(entry.ts, entry.kind, connected.ts if connected else None)
         else:
-            print("No connection match found")
-            return None
-
-    def parse_disconnection_log(self, log_line: str) -> MQTTEvent:
-        print(f"Processing disconnection line: {log_line}")
-
-        # Regular expression to match disconnection log entries with timestamp
-        pattern = r"(\d+): Client (\S+) disconnected"
-        match = re.match(pattern, log_line)
-
-        if match:
-            print(f"Found disconnection match: {match.groups()}")
-            timestamp, client_id = match.groups()
-
-            if client_id in self.connected_clients:
-                connected_event = self.connected_clients[client_id]
-                iso_timestamp = datetime.fromtimestamp(int(timestamp)).isoformat()
-
-                event = MQTTEvent(
-                    id=str(uuid.uuid4()),
-                    timestamp=iso_timestamp,
-                    event_type="Client Disconnection",
-                    client_id=client_id,
-                    details=f"Disconnected from {connected_event.ip_address}:{connected_event.port}",
-                    status="warning",
-                    protocol_level=connected_event.protocol_level,
-                    clean_session=connected_event.clean_session,
-                    keep_alive=connected_event.keep_alive,
-                    username=connected_event.username,
-                    ip_address=connected_event.ip_address,
-                    port=connected_event.port,
-                )
-
-                print(f"Created disconnection event: {event.dict()}")
-                del self.connected_clients[client_id]
-                self.events.append(event)
-                return event
-            else:
-                print(f"No connection record found for client {client_id}")
+            connected = self.connected_clients.get(entry.client_id)
+
+        if entry.kind == log_classifier.SUBSCRIBE:
+            details = f"Subscribed to {data['topic']} (QoS {data['qos']})"
+        elif entry.kind == log_classifier.UNSUBSCRIBE:
+            details = f"Unsubscribed from {data['topic']}"
+        elif connected is not None and entry.kind == log_classifier.DISCONNECT:
+            details = f"Disconnected from {connected.ip_address}:{connected.port}"
         else:
-            print("No disconnection match found")
-            return None
+            details = data.get("reason", "").capitalize()
+
+        event = EventRecord(
+            ts=entry.ts,
+            event_type=event_type,
+            client_id=entry.client_id,
+            details=details,
+            status=status,
+            protocol_level=connected.protocol_level if connected else "unknown",
+            clean_session=connected.clean_session if connected else False,
+            keep_alive=connected.keep_alive if connected else 0,
+            username=connected.username if connected else "",
+            ip_address=connected.ip_address if connected else "",
+            port=connected.port if connected else 0,
+        )
+        return self.record(event, session_change)
+
+
+# Delay (seconds) used to coalesce bursts of events before pushing them to streams
+EVENT_STREAM_DEBOUNCE = float(os.getenv("EVENT_STREAM_DEBOUNCE", "0.1"))
+# Interval (seconds) between keep-alive comments on idle event streams
+EVENT_STREAM_KEEPALIVE = float(os.getenv("EVENT_STREAM_KEEPALIVE", "15"))
+# Most events sent in one catch-up read from the store
+EVENT_STREAM_BATCH = 500
 
+def _format_events(events: List[EventRecord]) -> bytes:
+    """Server-Sent Events frames, with the sequence number as event id for resume"""
+    return "".join(
+        f"id: {event.seq}\ndata: {json.dumps(event.to_dict(), separators=(',', ':'))}\n\n"
+        for event in events
+    ).encode()
+
+class EventBroadcaster:
+    """Push newly parsed events to Server-Sent Events subscribers.
+
+    Events are recorded on the log follower thread; notify() hands the wakeup
+    to the event loop, where bursts are coalesced. Each new batch is
+    serialized once and queued for every subscriber, together with its
+    sequence range. A subscriber that resumes from an older sequence number,
+    or whose queue overflowed, catches up by reading the store directly.
+    """
+
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._published_seq = -1
+        self._publish_scheduled = False
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._published_seq = mqtt_monitor.events.last_seq
+
+    def notify(self):
+        """Signal that events were recorded. Safe to call from any thread."""
+        if self._loop is None or not self._subscribers:
+            return
+        self._loop.call_soon_threadsafe(self._schedule_publish)
+
+    def _schedule_publish(self):
+        if self._publish_scheduled:
+            return
+        self._publish_scheduled = True
+        self._loop.call_later(EVENT_STREAM_DEBOUNCE, self._publish)
+
+    def _publish(self):
+        self._publish_scheduled = False
+        events = mqtt_monitor.events.since(self._published_seq, mqtt_monitor.events.capacity)
+        if not events:
+            return
+        batch = (events[0].seq, events[-1].seq, _format_events(events))
+        self._published_seq = events[-1].seq
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                # The subscriber catches up from the store once it drains its queue
+                pass
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if not self._subscribers:
+            # Nothing was published while idle; new subscribers read older events from the store
+            self._published_seq = mqtt_monitor.events.last_seq
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+event_broadcaster = EventBroadcaster()
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost").split(",")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    event_broadcaster.attach_loop(asyncio.get_running_loop())
+    yield
+
 # Initialize FastAPI app with versioning
 app = FastAPI(
     title="Mosquitto Management API",
     version="1.0.0",
     docs_url="/docs",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -161,22 +277,31 @@ app.add_middleware(
 # Trusted Host middleware
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
 
-# Initialize MQTT monitor
-mqtt_monitor = MQTTMonitor()
+# Initialize MQTT monitor, backed by the on-disk event history
+event_history = EventHistory()
+mqtt_monitor = MQTTMonitor(event_history)
 
-def execute_mosquitto_command(command: list) -> None:
-    """Execute a mosquitto_ctrl command with the base configuration"""
+# Optional broker-driven presence tracking; when enabled it is authoritative for connected clients
+presence_engine = (
+    PresenceEngine(MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD)
+    if PRESENCE_ENABLED else None
+)
+
+async def execute_dynsec_command(command: str, **params) -> None:
+    """Execute a dynamic-security command over the persistent control connection"""
     try:
-        full_command = MOSQUITTO_BASE_COMMAND + command
-        subprocess.run(full_command, check=True)
-    except subprocess.CalledProcessError as e:
+        responses = await dynsec_client.execute_async([{"command": command, **params}])
+    except DynsecError as e:
         raise HTTPException(status_code=500, detail=f"Command failed: {str(e)}")
+    success, result = response_result(responses[0])
+    if not success:
+        raise HTTPException(status_code=500, detail=f"Command failed: {result}")
 
 # Updated endpoint paths to match the frontend expectations
 @app.post("/api/v1/enable/{username}")
 async def enable_client(username: str):
     try:
-        execute_mosquitto_command(["enableClient", username])
+        await execute_dynsec_command("enableClient", username=username)
         return {"status": "success", "message": f"Client {username} Enabled"}
     except HTTPException:
         raise
@@ -186,7 +311,7 @@ async def enable_client(username: str):
 @app.post("/api/v1/disable/{username}")
 async def disable_client(username: str):
     try:
-        execute_mosquitto_command(["disableClient", username])
+        await execute_dynsec_command("disableClient", username=username)
         return {"status": "success", "message": f"Client {username} Disabled"}
     except HTTPException:
         raise
@@ -194,43 +319,236 @@ async def disable_client(username: str):
         raise HTTPException(status_code=500, detail=f"Failed to disable client: {str(e)}")
 
 @app.get("/api/v1/events")  # Changed to match frontend expectation
-async def get_mqtt_events():
-    print(f"Current events in memory: {len(mqtt_monitor.events)}")
-    sorted_events = sorted(mqtt_monitor.events, key=lambda x: x.timestamp, reverse=True)[:100]
-    return {"events": [event.dict() for event in sorted_events]}
+async def get_mqtt_events(
+    limit: int = Query(100, ge=1, le=1000),
+    client_id: Optional[str] = None,
+    username: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    since: int = Query(-1, ge=-1, description="Only events after this sequence number"),
+):
+    """Newest events first, optionally for a single client_id, username or IP.
+
+    Pass the returned last_seq back as `since` to receive only new events.
+    With `since`, events come oldest first from the cursor on; when there are
+    more than `limit`, last_seq is the last one returned, so the next call
+    continues from there instead of skipping them.
+    """
+    # Read last_seq first so events recorded meanwhile are returned next time
+    last_seq = mqtt_monitor.events.last_seq
+    # A cursor from before a restart is ahead of the store: start over from the newest events
+    reset = since > last_seq
+    if reset:
+        since = -1
+    if client_id:
+        field, key = "client_id", client_id
+    elif username:
+        field, key = "username", username
+    elif ip_address:
+        field, key = "ip_address", ip_address
+    else:
+        field, key = None, None
+    if since >= 0:
+        if field:
+            events = mqtt_monitor.events.since_by(field, key, since, limit)
+        else:
+            events = mqtt_monitor.events.since(since, limit)
+        events = [event for event in events if event.seq <= last_seq]
+        if len(events) == limit:
+            last_seq = events[-1].seq
+    else:
+        if field:
+            events = mqtt_monitor.events.newest_by(field, key, limit)
+        else:
+            events = mqtt_monitor.events.newest(limit)
+        events = [event for event in events if event.seq <= last_seq]
+    return {"events": [event.to_dict() for event in events], "last_seq": last_seq, "reset": reset}
+
+@app.get("/api/v1/events/stream")
+async def stream_mqtt_events(
+    request: Request,
+    since: Optional[int] = Query(None, ge=-1, description="Resume after this sequence number"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """Stream newly parsed events as Server-Sent Events.
+
+    Each event carries its sequence number as the SSE id, so a reconnecting
+    EventSource resumes through Last-Event-ID and only receives what it
+    missed. Without either, or with a negative since, the stream starts with
+    the next event. A "reset" event reports events that were evicted from
+    memory before they could be sent, or a resume point from before a
+    restart, which is ahead of the store; the stream then starts with the
+    next event and reports its last_seq.
+    """
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    store = mqtt_monitor.events
+    queue = event_broadcaster.subscribe()
+    last = store.last_seq if since is None or since < 0 else since
+    restarted = last > store.last_seq
+    if restarted:
+        last = store.last_seq
+    logger.debug(f"Event stream opened at seq {last}, {event_broadcaster.subscriber_count} subscriber(s)")
+
+    def catch_up() -> Tuple[List[EventRecord], int]:
+        missed = max(0, store.first_seq - (last + 1))
+        return store.since(last, EVENT_STREAM_BATCH), missed
+
+    async def event_stream():
+        nonlocal last
+        try:
+            if restarted:
+                yield f"event: reset\ndata: {json.dumps({'missed': 0, 'last_seq': last})}\n\n".encode()
+            while True:
+                events, missed = catch_up()
+                if missed:
+                    yield f"event: reset\ndata: {json.dumps({'missed': missed})}\n\n".encode()
+                if events:
+                    last = events[-1].seq
+                    yield _format_events(events)
+                    continue
+                try:
+                    first, batch_last, message = await asyncio.wait_for(queue.get(), timeout=EVENT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+                    continue
+                if batch_last <= last:
+                    continue
+                if first == last + 1:
+                    # Contiguous with what was sent so far: reuse the shared serialization
+                    last = batch_last
+                    yield message
+                # Otherwise loop round and read the gap from the store
+        finally:
+            event_broadcaster.unsubscribe(queue)
+            logger.debug(f"Event stream closed, {event_broadcaster.subscriber_count} subscriber(s)")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+def _presence_client(record: Dict) -> Dict:
+    """A presence table record in the connected-clients shape, with log details when known"""
+    logged = mqtt_monitor.connected_clients.get(record["client_id"])
+    if logged is not None:
+        return logged.to_dict()
+    return {
+        "seq": -1,
+        "id": record["client_id"],
+        "timestamp": datetime.fromtimestamp(record["connected_at"]).isoformat(),
+        "event_type": "Client Connection",
+        "client_id": record["client_id"],
+        "details": f"Connected from {record['ip_address']}:{record['port']}" if record["ip_address"] else "Connected",
+        "status": "success",
+        "protocol_level": "unknown",
+        "clean_session": False,
+        "keep_alive": 0,
+        "username": record["username"],
+        "ip_address": record["ip_address"],
+        "port": record["port"],
+    }
 
 @app.get("/api/v1/connected-clients")
 async def get_connected_clients():
+    if presence_engine is not None and presence_engine.active:
+        print(f"Current connected clients (presence): {presence_engine.count}")
+        return {"clients": [_presence_client(record) for record in presence_engine.table.records()]}
     print(f"Current connected clients: {len(mqtt_monitor.connected_clients)}")
-    return {"clients": [client.dict() for client in mqtt_monitor.connected_clients.values()]}
+    return {"clients": [client.to_dict() for client in list(mqtt_monitor.connected_clients.values())]}
 
-def monitor_mosquitto_logs():
-    print("Starting mosquitto log monitoring...")
-    process = subprocess.Popen(
-        ["tail", "-f", "/var/log/mosquitto/mosquitto.log"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True
+@app.get("/api/v1/presence")
+async def get_presence(client_id: Optional[str] = None):
+    """Presence engine status, connected-client count and an optional single-client lookup"""
+    if presence_engine is None:
+        return {"enabled": False, "count": len(mqtt_monitor.connected_clients)}
+    result = {"enabled": True, "active": presence_engine.active, "count": presence_engine.count, **presence_engine.stats}
+    if client_id:
+        result["client"] = presence_engine.table.get(client_id)
+    return result
+
+@app.get("/api/v1/analytics/sessions")
+async def get_session_analytics(top: int = Query(10, ge=1, le=100), client_id: Optional[str] = None):
+    """Reconnect rate, noisiest clients and IPs, flapping clients and session durations"""
+    snapshot = mqtt_monitor.analytics.snapshot(top)
+    if client_id:
+        snapshot["client"] = {
+            "client_id": client_id,
+            "connects_in_window": mqtt_monitor.analytics.client_connects(client_id),
+        }
+    return snapshot
+
+def _time_range(start: Optional[int], end: Optional[int], hours: float):
+    """Resolve optional epoch-second bounds, defaulting to the last `hours` hours"""
+    end = int(time.time()) if end is None else end
+    start = end - int(hours * 3600) if start is None else start
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+@app.get("/api/v1/history/events")
+async def get_event_history(
+    start: Optional[int] = Query(None, description="Epoch seconds; defaults to end minus hours"),
+    end: Optional[int] = Query(None, description="Epoch seconds; defaults to now"),
+    hours: float = Query(24, gt=0),
+    client_id: Optional[str] = None,
+    username: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Persisted events in a time range, newest first, optionally for one client or username"""
+    start, end = _time_range(start, end, hours)
+    events = await asyncio.to_thread(
+        event_history.events, start, end, client_id=client_id, username=username, limit=limit
     )
-    print("Mosquitto log monitoring process started")
-    
-    while True:
-        line = process.stdout.readline()
-        if line:
-            line = line.strip()
-            event = mqtt_monitor.parse_connection_log(line)
-            if not event:
-                event = mqtt_monitor.parse_disconnection_log(line)
+    return {"start": start, "end": end, "events": events}
+
+@app.get("/api/v1/history/sessions/{client_id}")
+async def get_client_sessions(
+    client_id: str,
+    start: Optional[int] = Query(None, description="Epoch seconds; defaults to end minus hours"),
+    end: Optional[int] = Query(None, description="Epoch seconds; defaults to now"),
+    hours: float = Query(24, gt=0),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Sessions of a client overlapping a time range, newest first"""
+    start, end = _time_range(start, end, hours)
+    sessions = await asyncio.to_thread(event_history.sessions, client_id, start, end, limit)
+    return {"client_id": client_id, "start": start, "end": end, "sessions": sessions}
+
+def process_log_lines(lines: List[str]):
+    """Handle a batch of mosquitto log lines from the follower"""
+    mqtt_monitor.process_lines(lines)
+
+def monitor_mosquitto_logs() -> LogTailer:
+    print("Starting mosquitto log monitoring...")
+    tailer = LogTailer(MOSQUITTO_LOG_PATH, process_log_lines, offset_path=LOG_OFFSET_PATH)
+    tailer.start()
+    print("Mosquitto log monitoring started")
+    return tailer
 
 if __name__ == "__main__":
-    # Start log monitoring in a separate thread
-    import threading
-    log_thread = threading.Thread(target=monitor_mosquitto_logs, daemon=True)
-    log_thread.start()
+    # Restore state from the history database before following the log again
+    mqtt_monitor.restore()
+    event_history.start()
+
+    # Follow the mosquitto log in a background thread
+    log_tailer = monitor_mosquitto_logs()
+
+    if presence_engine is not None:
+        presence_engine.start()
     
     # Start the FastAPI server without SSL
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=1002
-    )
\ No newline at end of file
+    )
+    log_tailer.stop()
+    if presence_engine is not None:
+        presence_engine.stop()
+    event_history.close()
\ No newline at end of file
@@ -0,0 +1,362 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/presence.py
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+# Track presence from broker notifications instead of (or alongside) the log.
+# The Mosquitto 2.0 shipped in this image publishes neither the notifications nor answers
+# listClients, so this needs a broker that does (EMQX publishes the default topic layout)
+# or a Mosquitto plugin publishing to topics configured below. Until a notification or a
+# reconciliation arrives, counts keep coming from the log and $SYS.
+PRESENCE_ENABLED = os.getenv("PRESENCE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Topics the broker (or a broker plugin) publishes per-client connect/disconnect notifications on.
+# The defaults use EMQX's $SYS/brokers/<node>/clients/<client id>/<event> layout.
+PRESENCE_CONNECTED_TOPIC = os.getenv("PRESENCE_CONNECTED_TOPIC", "$SYS/brokers/+/clients/+/connected")
+PRESENCE_DISCONNECTED_TOPIC = os.getenv("PRESENCE_DISCONNECTED_TOPIC", "$SYS/brokers/+/clients/+/disconnected")
+# Control API used to list connected clients when reconciling
+PRESENCE_CONTROL_TOPIC = os.getenv("PRESENCE_CONTROL_TOPIC", "$CONTROL/broker/v1")
+PRESENCE_LIST_COMMAND = os.getenv("PRESENCE_LIST_COMMAND", "listClients")
+# Seconds between reconciliations against the broker's client list (0 disables them)
+PRESENCE_RECONCILE_INTERVAL = float(os.getenv("PRESENCE_RECONCILE_INTERVAL", "60"))
+# Seconds to wait for the client list before giving up on a reconciliation
+PRESENCE_RECONCILE_TIMEOUT = float(os.getenv("PRESENCE_RECONCILE_TIMEOUT", "10"))
+
+
+class PresenceTable:
+    """Compact table of connected clients with O(1) lookup, insert and delete.
+
+    A dict maps each client id to a slot in parallel arrays. Connect times
+    and ports are stored unboxed in typed arrays, and usernames and IP
+    addresses are interned, so clients sharing a username or IP share one
+    string. Freed slots are reused, so memory follows the peak number of
+    concurrent clients.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._usernames: List[str] = []
+        self._ips: List[str] = []
+        self._ports = array("H")
+        self._connected_at = array("d")
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self._slots
+
+    def connect(self, client_id: str, username: str = "", ip_address: str = "", port: int = 0,
+                connected_at: Optional[float] = None) -> bool:
+        """Record a connected client; returns True if it was not present before"""
+        connected_at = time.time() if connected_at is None else connected_at
+        username = sys.intern(username or "")
+        ip_address = sys.intern(ip_address or "")
+        with self._lock:
+            slot = self._slots.get(client_id)
+            added = slot is None
+            if added:
+                if self._free:
+                    slot = self._free.pop()
+                    self._ids[slot] = client_id
+                else:
+                    slot = len(self._ids)
+                    self._ids.append(client_id)
+                    self._usernames.append("")
+                    self._ips.append("")
+                    self._ports.append(0)
+                    self._connected_at.append(0.0)
+                self._slots[client_id] = slot
+            self._usernames[slot] = username
+            self._ips[slot] = ip_address
+            self._ports[slot] = port & 0xFFFF
+            self._connected_at[slot] = connected_at
+            return added
+
+    def disconnect(self, client_id: str) -> bool:
+        """Remove a client; returns True if it was present"""
+        with self._lock:
+            slot = self._slots.pop(client_id, None)
+            if slot is None:
+                return False
+            self._ids[slot] = None
+            self._usernames[slot] = ""
+            self._ips[slot] = ""
+            self._free.append(slot)
+            return True
+
+    def _record(self, slot: int) -> Dict[str, Any]:
+        return {
+            "client_id": self._ids[slot],
+            "username": self._usernames[slot],
+            "ip_address": self._ips[slot],
+            "port": self._ports[slot],
+            "connected_at": self._connected_at[slot],
+        }
+
+    def get(self, client_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            slot = self._slots.get(client_id)
+            return None if slot is None else self._record(slot)
+
+    def records(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            slots = list(self._slots.values())
+            end = None if limit is None else offset + limit
+            return [self._record(slot) for slot in slots[offset:end]]
+
+    def client_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._slots)
+
+
+def _notification_client_id(topic: str, payload: Dict[str, Any]) -> Optional[str]:
+    client_id = payload.get("clientid") or payload.get("client_id") or payload.get("id")
+    if client_id:
+        return str(client_id)
+    # .../clients/<client id>/connected
+    levels = topic.split("/")
+    return levels[-2] if len(levels) >= 2 else None
+
+
+def _listed_client_id(item: Any) -> Optional[str]:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        client_id = item.get("clientid") or item.get("client_id") or item.get("id")
+        return str(client_id) if client_id else None
+    return None
+
+
+class PresenceEngine:
+    """Track connected clients from broker-generated presence notifications.
+
+    The engine keeps its own MQTT connection, subscribed to the connect and
+    disconnect notification topics, and applies each notification to a
+    PresenceTable. Notifications can be lost, e.g. while this service is
+    disconnected from the broker. The table is therefore reconciled
+    periodically against the client list returned by the broker's control
+    API. Changes that arrive while a reconciliation is in flight win over
+    the (older) list. on_change, if given, is called with the client count
+    whenever it changes. The engine only becomes `active` with the first
+    notification or successful reconciliation; until then the broker may
+    not publish presence at all, and callers should keep their own counts.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 on_change: Optional[Callable[[int], None]] = None):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.on_change = on_change
+        self.table = PresenceTable()
+        self._client = None
+        self._stop = threading.Event()
+        self._reconcile_thread: Optional[threading.Thread] = None
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_started: Optional[float] = None
+        self._reconcile_response = threading.Event()
+        self._reconcile_correlation: Optional[str] = None
+        self._changed_during_reconcile: Set[str] = set()
+        self._reconcile_supported = True
+        self.active = False
+        self.stats: Dict[str, Any] = {
+            "connects": 0,
+            "disconnects": 0,
+            "reconciliations": 0,
+            "reconcile_added": 0,
+            "reconcile_removed": 0,
+            "last_reconciled": None,
+        }
+
+    @property
+    def count(self) -> int:
+        return len(self.table)
+
+    def _create_client(self):
+        client_id = f"bunkerm-presence-{secrets.token_hex(4)}"
+        try:
+            client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id=client_id)
+        except AttributeError:
+            # Fall back to older MQTT client if necessary
+            client = mqtt_client.Client(client_id=client_id)
+        client.username_pw_set(self.username, self.password)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=10)
+        return client
+
+    def start(self):
+        self._client = self._create_client()
+        logger.info(f"Connecting presence client to {self.host}:{self.port}")
+        self._client.connect_async(self.host, self.port, 60)
+        self._client.loop_start()
+        if PRESENCE_RECONCILE_INTERVAL > 0:
+            self._reconcile_thread = threading.Thread(
+                target=self._reconcile_loop, name="presence-reconcile", daemon=True
+            )
+            self._reconcile_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+            self._client = None
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code == 0:
+            client.subscribe([
+                (PRESENCE_CONNECTED_TOPIC, 1),
+                (PRESENCE_DISCONNECTED_TOPIC, 1),
+                (f"{PRESENCE_CONTROL_TOPIC}/response", 1),
+            ])
+            logger.info("Presence client connected")
+        else:
+            logger.error(f"Presence client failed to connect: {reason_code}")
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload) if msg.payload else {}
+        except ValueError:
+            payload = {}
+        if not isinstance(payload, dict):
+            payload = {}
+
+        if msg.topic == f"{PRESENCE_CONTROL_TOPIC}/response":
+            self._on_control_response(payload)
+        elif mqtt_client.topic_matches_sub(PRESENCE_CONNECTED_TOPIC, msg.topic):
+            self._on_presence(msg.topic, payload, connected=True)
+        elif mqtt_client.topic_matches_sub(PRESENCE_DISCONNECTED_TOPIC, msg.topic):
+            self._on_presence(msg.topic, payload, connected=False)
+
+    def _on_presence(self, topic: str, payload: Dict[str, Any], connected: bool):
+        client_id = _notification_client_id(topic, payload)
+        if not client_id:
+            return
+        if connected:
+            connected_at = payload.get("connected_at")
+            if isinstance(connected_at, (int, float)) and connected_at > 1e11:
+                # Milliseconds since the epoch
+                connected_at /= 1000
+            changed = self.table.connect(
+                client_id,
+                username=str(payload.get("username") or ""),
+                ip_address=str(payload.get("ipaddress") or payload.get("ip_address") or ""),
+                port=int(payload.get("port") or 0),
+                connected_at=connected_at if isinstance(connected_at, (int, float)) else None,
+            )
+            self.stats["connects"] += 1
+        else:
+            changed = self.table.disconnect(client_id)
+            self.stats["disconnects"] += 1
+        with self._reconcile_lock:
+            if self._reconcile_started is not None:
+                self._changed_during_reconcile.add(client_id)
+        self._changed(changed)
+
+    def _changed(self, changed: bool):
+        """Report the count when it changed, or when presence data arrives for the first time"""
+        if not self.active:
+            self.active = True
+            logger.info("Presence data received, using it for connected clients")
+            changed = True
+        if changed and self.on_change is not None:
+            self.on_change(self.count)
+
+    # Reconciliation
+
+    def _reconcile_loop(self):
+        while not self._stop.wait(PRESENCE_RECONCILE_INTERVAL):
+            if self._reconcile_supported:
+                self.reconcile()
+
+    def reconcile(self) -> bool:
+        """Ask the broker for its client list and correct the table; returns True on success"""
+        client = self._client
+        if client is None or not client.is_connected():
+            return False
+        correlation = secrets.token_hex(8)
+        with self._reconcile_lock:
+            self._reconcile_started = time.time()
+            self._reconcile_correlation = correlation
+            self._changed_during_reconcile = set()
+            self._reconcile_response.clear()
+        client.publish(
+            PRESENCE_CONTROL_TOPIC,
+            json.dumps({"commands": [{"command": PRESENCE_LIST_COMMAND, "correlationData": correlation}]}),
+            qos=1,
+        )
+        answered = self._reconcile_response.wait(PRESENCE_RECONCILE_TIMEOUT)
+        with self._reconcile_lock:
+            self._reconcile_started = None
+            self._reconcile_correlation = None
+        if not answered and self.stats["reconciliations"] == 0:
+            # Never answered: the broker has no such control API, rely on notifications alone
+            self._reconcile_supported = False
+            logger.warning(
+                f"No answer to {PRESENCE_LIST_COMMAND} on {PRESENCE_CONTROL_TOPIC}, "
+                "presence reconciliation disabled"
+            )
+        return answered
+
+    def _on_control_response(self, payload: Dict[str, Any]):
+        with self._reconcile_lock:
+            correlation = self._reconcile_correlation
+            started = self._reconcile_started
+            changed = self._changed_during_reconcile
+        if correlation is None:
+            return
+
+        for response in payload.get("responses", []):
+            if response.get("correlationData") != correlation:
+                continue
+            if response.get("error"):
+                logger.error(f"Presence reconciliation failed: {response['error']}")
+                self._reconcile_response.set()
+                return
+            listed = set()
+            for item in (response.get("data") or {}).get("clients", []):
+                client_id = _listed_client_id(item)
+                if client_id:
+                    listed.add(client_id)
+            self._apply_client_list(listed, started, changed)
+            self._reconcile_response.set()
+            return
+
+    def _apply_client_list(self, listed: Set[str], started: float, changed: Set[str]):
+        current = self.table.client_ids()
+        added = removed = 0
+        for client_id in listed - current:
+            if client_id not in changed and self.table.connect(client_id, connected_at=started):
+                added += 1
+        for client_id in current - listed:
+            if client_id not in changed and self.table.disconnect(client_id):
+                removed += 1
+        self.stats["reconciliations"] += 1
+        self.stats["reconcile_added"] += added
+        self.stats["reconcile_removed"] += removed
+        self.stats["last_reconciled"] = started
+        if added or removed:
+            logger.info(f"Presence reconciled: {added} missing clients added, {removed} stale clients removed")
+        self._changed(bool(added or removed))
@@ -0,0 +1,275 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/clientlogs/session_analytics.py
+import heapq
+import os
+import threading
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Sliding window over which reconnects are counted, split into buckets
+ANALYTICS_WINDOW_SECONDS = int(os.getenv("ANALYTICS_WINDOW_SECONDS", "300"))
+ANALYTICS_BUCKET_SECONDS = int(os.getenv("ANALYTICS_BUCKET_SECONDS", "10"))
+# Keys tracked per bucket by the heavy-hitter summaries
+ANALYTICS_TOP_K = int(os.getenv("ANALYTICS_TOP_K", "100"))
+# Count-min sketch size; estimates overcount by at most ~2/width of the window's connects
+ANALYTICS_SKETCH_WIDTH = int(os.getenv("ANALYTICS_SKETCH_WIDTH", "4096"))
+ANALYTICS_SKETCH_DEPTH = int(os.getenv("ANALYTICS_SKETCH_DEPTH", "4"))
+# A client that connects this many times within the window is flapping
+FLAP_THRESHOLD = int(os.getenv("FLAP_THRESHOLD", "5"))
+# Most flapping clients remembered at once
+FLAP_MAX_CLIENTS = int(os.getenv("FLAP_MAX_CLIENTS", "1000"))
+# Most recently connected clients whose last connect times are kept for flap detection
+FLAP_TRACKED_CLIENTS = int(os.getenv("FLAP_TRACKED_CLIENTS", "50000"))
+
+# Upper bounds (seconds) of the session duration histogram buckets
+DURATION_BOUNDS = (1, 5, 10, 30, 60, 300, 900, 3600, 21600, 86400)
+
+
+class CountMinSketch:
+    """Fixed-size frequency sketch; estimates never undercount"""
+
+    def __init__(self, width: int = ANALYTICS_SKETCH_WIDTH, depth: int = ANALYTICS_SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = array("L", bytes(array("L").itemsize * width * depth))
+
+    def positions(self, key: str) -> List[int]:
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hash(key)
+        h2 = hash((key, 1)) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, positions: List[int], count: int = 1):
+        table = self.table
+        for pos in positions:
+            table[pos] += count
+
+    def estimate(self, positions: List[int]) -> int:
+        table = self.table
+        return min(table[pos] for pos in positions)
+
+    def subtract(self, other: "CountMinSketch"):
+        table = self.table
+        for i, value in enumerate(other.table):
+            if value:
+                table[i] -= value
+
+    def clear(self):
+        self.table = array("L", bytes(len(self.table) * self.table.itemsize))
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary over at most `capacity` keys.
+
+    Any key whose true count exceeds total / capacity is guaranteed to be
+    tracked. The count of each tracked key overestimates the true count by at
+    most its recorded error. The minimum is found through a heap with lazy
+    deletion, which is compacted once stale entries dominate it.
+    """
+
+    def __init__(self, capacity: int = ANALYTICS_TOP_K):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str, count: int = 1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            # Replace the current minimum, inheriting its count as error
+            heap = self._heap
+            while True:
+                minimum, victim = heapq.heappop(heap)
+                if counts.get(victim) == minimum:
+                    break
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = minimum + count
+            self.errors[key] = minimum
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, k) for k, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def clear(self):
+        self.counts.clear()
+        self.errors.clear()
+        self._heap = []
+
+
+class _Bucket:
+    __slots__ = ("index", "connects", "sketch", "clients", "ips")
+
+    def __init__(self):
+        self.index = -1
+        self.connects = 0
+        self.sketch = CountMinSketch()
+        self.clients = SpaceSaving()
+        self.ips = SpaceSaving()
+
+    def reset(self, index: int):
+        self.index = index
+        self.connects = 0
+        self.sketch.clear()
+        self.clients.clear()
+        self.ips.clear()
+
+
+class SessionAnalytics:
+    """Incremental session and reconnect analytics over connection events.
+
+    Connects are counted in a ring of time buckets covering the sliding
+    window. Each bucket has a count-min sketch and Space-Saving summaries of
+    client ids and IPs. A running sum of the bucket sketches gives any
+    client's reconnect count over the whole window in `depth` lookups.
+    Flapping is decided exactly rather than from the sketch, which
+    overcounts under heavy load. The last FLAP_THRESHOLD connect times are
+    kept for the FLAP_TRACKED_CLIENTS most recently connected clients. A
+    client whose oldest kept connect is still inside the window is
+    flapping; a client reconnecting that often never ages out of the LRU.
+    Time follows the log timestamps, not the wall clock, so
+    replayed logs produce the same results.
+
+    Each event costs a constant number of operations plus a heap operation
+    of O(log K) in the heavy-hitter summaries. Memory is fixed by the window,
+    sketch and top-K settings, whatever the number of distinct clients.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int = ANALYTICS_WINDOW_SECONDS,
+        bucket_seconds: int = ANALYTICS_BUCKET_SECONDS,
+        flap_threshold: int = FLAP_THRESHOLD,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(1, window_seconds // bucket_seconds)
+        self.window_seconds = self.num_buckets * bucket_seconds
+        self.flap_threshold = flap_threshold
+        self._buckets = [_Bucket() for _ in range(self.num_buckets)]
+        self._window_sketch = CountMinSketch()
+        self._current = -1
+        self._latest_ts = 0
+        self._flapping: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._recent: "OrderedDict[str, deque]" = OrderedDict()
+        self._durations = [0] * (len(DURATION_BOUNDS) + 1)
+        self._duration_total = 0
+        self._sessions = 0
+        self._totals: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _advance(self, ts: int) -> _Bucket:
+        index = ts // self.bucket_seconds
+        if index > self._current:
+            # Expire every bucket that has fallen out of the window
+            first = max(self._current + 1, index - self.num_buckets + 1)
+            for i in range(first, index + 1):
+                bucket = self._buckets[i % self.num_buckets]
+                if bucket.index >= 0 and bucket.connects:
+                    self._window_sketch.subtract(bucket.sketch)
+                bucket.reset(i)
+            self._current = index
+        if ts > self._latest_ts:
+            self._latest_ts = ts
+        # Late events are counted in the current bucket
+        return self._buckets[self._current % self.num_buckets]
+
+    def on_connect(self, ts: int, client_id: str, ip_address: str):
+        with self._lock:
+            self._totals["connects"] = self._totals.get("connects", 0) + 1
+            bucket = self._advance(ts)
+            bucket.connects += 1
+            bucket.clients.add(client_id)
+            if ip_address:
+                bucket.ips.add(ip_address)
+
+            positions = bucket.sketch.positions(client_id)
+            bucket.sketch.add(positions)
+            self._window_sketch.add(positions)
+
+            recent = self._recent.pop(client_id, None)
+            if recent is None:
+                recent = deque(maxlen=self.flap_threshold)
+                if len(self._recent) >= FLAP_TRACKED_CLIENTS:
+                    self._recent.popitem(last=False)
+            recent.append(ts)
+            self._recent[client_id] = recent
+            if len(recent) == self.flap_threshold and ts - recent[0] < self.window_seconds:
+                self._mark_flapping(ts, client_id, ip_address, self._window_sketch.estimate(positions))
+
+    def _mark_flapping(self, ts: int, client_id: str, ip_address: str, estimate: int):
+        entry = self._flapping.pop(client_id, None)
+        if entry is None:
+            entry = {"client_id": client_id, "first_seen": ts}
+        entry.update(last_seen=ts, ip_address=ip_address, connects_in_window=estimate)
+        self._flapping[client_id] = entry
+        if len(self._flapping) > FLAP_MAX_CLIENTS:
+            self._flapping.popitem(last=False)
+
+    def on_session_end(self, ts: int, kind: str, connected_ts: Optional[int]):
+        with self._lock:
+            self._totals[kind] = self._totals.get(kind, 0) + 1
+            if connected_ts is None:
+                return
+            duration = max(0, ts - connected_ts)
+            slot = len(DURATION_BOUNDS)
+            for i, bound in enumerate(DURATION_BOUNDS):
+                if duration <= bound:
+                    slot = i
+                    break
+            self._durations[slot] += 1
+            self._duration_total += duration
+            self._sessions += 1
+
+    def client_connects(self, client_id: str) -> int:
+        """Estimated connects of one client within the window (never an undercount)"""
+        with self._lock:
+            return self._window_sketch.estimate(self._window_sketch.positions(client_id))
+
+    @staticmethod
+    def _top(summaries: List[SpaceSaving], field: str, limit: int) -> List[Dict[str, Any]]:
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for summary in summaries:
+            for key, count in summary.counts.items():
+                counts[key] = counts.get(key, 0) + count
+                errors[key] = errors.get(key, 0) + summary.errors[key]
+        top = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+        return [{field: key, "connects": count, "max_overcount": errors[key]} for key, count in top]
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            live = [b for b in self._buckets if b.index > self._current - self.num_buckets and b.index >= 0]
+            connects = sum(b.connects for b in live)
+            cutoff = self._latest_ts - self.window_seconds
+            flapping = [dict(e) for e in reversed(self._flapping.values()) if e["last_seen"] > cutoff]
+            labels = [f"<={b}s" for b in DURATION_BOUNDS] + [f">{DURATION_BOUNDS[-1]}s"]
+            return {
+                "window_seconds": self.window_seconds,
+                "latest_event_ts": self._latest_ts or None,
+                "connects_in_window": connects,
+                "reconnect_rate_per_second": round(connects / self.window_seconds, 3),
+                "top_clients": self._top([b.clients for b in live], "client_id", top),
+                "top_ips": self._top([b.ips for b in live], "ip_address", top),
+                "flapping_threshold": self.flap_threshold,
+                "flapping_clients": flapping[:top],
+                "flapping_count": len(flapping),
+                "session_durations": {
+                    "count": self._sessions,
+                    "mean_seconds": round(self._duration_total / self._sessions, 1) if self._sessions else None,
+                    "histogram": dict(zip(labels, self._durations)),
+                },
+                "totals": dict(self._totals),
+            }
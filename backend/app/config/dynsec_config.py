@@ -6,15 +6,20 @@
 # Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
 #
 # backend/app/config/dynsec_config.py
+import codecs
 import json
 import logging
 import os
 import shutil
+import tempfile
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, BinaryIO, List
 from fastapi import APIRouter, HTTPException, Depends, Security, UploadFile, File, status, Response
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
+from blocking_io import run_blocking
+from json_stream import TopLevelJsonStream
+from reload_manager import mark_restart_required
 
 # Router setup
 router = APIRouter(tags=["dynsec_config"])
@@ -26,6 +31,10 @@ logger = logging.getLogger(__name__)
 API_KEY = os.getenv("API_KEY")
 DYNSEC_JSON_PATH = os.getenv("DYNSEC_JSON_PATH", "/var/lib/mosquitto/dynamic-security.json")
 BACKUP_DIR = os.getenv("DYNSEC_BACKUP_DIR", "/tmp/dynsec_backups")
+# Largest dynamic security JSON upload accepted, in bytes
+DYNSEC_UPLOAD_MAX_BYTES = int(os.getenv("DYNSEC_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Uploads are read and parsed in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # Security
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
@@ -162,40 +171,117 @@ def validate_dynsec_json(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return data
 
-def merge_dynsec_configs(imported_config: Dict[str, Any]) -> Dict[str, Any]:
+class UploadTooLarge(ValueError):
+    pass
+
+
+def stream_dynsec_upload(upload: BinaryIO) -> Dict[str, Any]:
     """
-    Merge imported config with default config to preserve critical components
+    Parse an uploaded dynamic security JSON file chunk by chunk.
+
+    Entries are validated as they are parsed and spooled to temporary files, one
+    per line, so memory does not grow with the file. The admin user and role are
+    dropped since the defaults replace them. Returns the spools and the number of
+    entries in each; raises ValueError if the file is invalid and UploadTooLarge
+    if it exceeds DYNSEC_UPLOAD_MAX_BYTES.
     """
-    # Start with a deep copy of the default config
-    merged_config = DEFAULT_CONFIG.copy()
-    
-    # Copy defaultACLAccess from default config (must be preserved)
-    # merged_config["defaultACLAccess"] = DEFAULT_CONFIG["defaultACLAccess"]
-    
-    # Keep admin user and add other users from imported config
-    admin_user = DEFAULT_CONFIG["clients"][0]
-    
-    # Get all non-admin users from imported config
-    non_admin_users = [user for user in imported_config.get("clients", []) 
-                       if "username" in user and user["username"] != "bunker"]
-    
-    # Combine admin user with non-admin users
-    merged_config["clients"] = [admin_user] + non_admin_users
-    
-    # Keep admin role and add other roles from imported config
-    admin_role = DEFAULT_CONFIG["roles"][0]
-    
-    # Get all non-admin roles from imported config
-    non_admin_roles = [role for role in imported_config.get("roles", []) 
-                       if "rolename" in role and role["rolename"] != "admin"]
-    
-    # Combine admin role with non-admin roles
-    merged_config["roles"] = [admin_role] + non_admin_roles
-    
-    # Import groups from imported config
-    merged_config["groups"] = imported_config.get("groups", [])
-    
-    return merged_config
+    spools = {kind: tempfile.TemporaryFile("w+") for kind in ("clients", "groups", "roles")}
+    counts = {kind: 0 for kind in spools}
+    values = {}
+
+    def on_item(key, item):
+        if key not in spools:
+            return
+        if not isinstance(item, dict):
+            raise ValueError(f"Entries of '{key}' must be objects")
+        # The admin user and role are preserved from DEFAULT_CONFIG
+        if key == "clients" and ("username" not in item or item["username"] == "bunker"):
+            return
+        if key == "roles" and ("rolename" not in item or item["rolename"] == "admin"):
+            return
+        spools[key].write(json.dumps(item))
+        spools[key].write("\n")
+        counts[key] += 1
+
+    def on_value(key, value):
+        if key in spools:
+            raise ValueError(f"'{key}' must be a list")
+        values[key] = value
+
+    try:
+        stream = TopLevelJsonStream(on_item, on_value)
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        size = 0
+        while True:
+            chunk = upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > DYNSEC_UPLOAD_MAX_BYTES:
+                raise UploadTooLarge(f"File is larger than {DYNSEC_UPLOAD_MAX_BYTES} bytes")
+            stream.feed(decoder.decode(chunk))
+        stream.feed(decoder.decode(b"", final=True))
+        stream.close()
+
+        # The lists themselves were only counted, validate the skeleton
+        skeleton = dict(values)
+        skeleton.update({key: [] for key in stream.arrays})
+        if not isinstance(skeleton.get("defaultACLAccess", {}), dict):
+            raise ValueError("'defaultACLAccess' must be an object")
+        validate_dynsec_json(skeleton)
+    except BaseException:
+        for spool in spools.values():
+            spool.close()
+        raise
+
+    for spool in spools.values():
+        spool.seek(0)
+    return {"spools": spools, "counts": counts}
+
+
+def write_merged_dynsec_json(spools: Dict[str, Any]) -> bool:
+    """
+    Write the default configuration merged with spooled entries from an upload.
+
+    The file is assembled in a temporary file next to DYNSEC_JSON_PATH and renamed
+    over it, so the broker never sees a partially written configuration.
+    """
+    directory = os.path.dirname(DYNSEC_JSON_PATH) or "."
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", buffering=1024 * 1024) as f:
+            f.write('{\n    "defaultACLAccess": ')
+            f.write(json.dumps(DEFAULT_CONFIG["defaultACLAccess"]))
+            for kind in ("clients", "groups", "roles"):
+                f.write(f',\n    "{kind}": [')
+                separator = "\n        "
+                # The admin user and role always come first
+                for entry in DEFAULT_CONFIG[kind] if kind != "groups" else []:
+                    f.write(separator)
+                    f.write(json.dumps(entry))
+                    separator = ",\n        "
+                for line in spools[kind]:
+                    f.write(separator)
+                    f.write(line.rstrip("\n"))
+                    separator = ",\n        "
+                f.write("\n    ]")
+            f.write("\n}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(DYNSEC_JSON_PATH):
+            st = os.stat(DYNSEC_JSON_PATH)
+            os.chmod(temp_path, st.st_mode & 0o7777)
+            try:
+                os.chown(temp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(temp_path, DYNSEC_JSON_PATH)
+        return True
+    except Exception as e:
+        logger.error(f"Error writing dynamic security JSON: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
 
 
 def create_backup() -> str:
@@ -224,7 +310,7 @@ async def get_dynsec_json(api_key: str = Security(get_api_key)):
     Get the current dynamic security JSON configuration
     """
     try:
-        data = read_dynsec_json()
+        data = await run_blocking(read_dynsec_json)
         
         if not data:
             return {
@@ -251,7 +337,7 @@ async def export_dynsec_json(api_key: str = Security(get_api_key)):
     """
     try:
         logger.info("Export request received")
-        data = read_dynsec_json()
+        data = await run_blocking(read_dynsec_json)
         
         if not data:
             logger.error("Failed to read dynamic security JSON file")
@@ -278,7 +364,7 @@ async def export_dynsec_json(api_key: str = Security(get_api_key)):
             ]
         
         # Create a JSON response with a filename for download
-        content = json.dumps(export_data, indent=4)
+        content = await run_blocking(json.dumps, export_data, indent=4)
         filename = f"dynamic-security-export-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
         
         logger.info(f"Preparing export response with filename: {filename}")
@@ -315,44 +401,47 @@ async def import_dynsec_json(
     Import a dynamic security JSON file
     """
     try:
-        # Read the uploaded file
-        content = await file.read()
-        
+        # Parse and validate the upload while it is read
         try:
-            # Parse the JSON content
-            imported_data = json.loads(content)
-            logger.info(f"Successfully parsed JSON from uploaded file: {file.filename}")
-        except json.JSONDecodeError:
+            imported = await run_blocking(stream_dynsec_upload, file.file)
+            logger.info(f"Successfully parsed and validated uploaded file: {file.filename}")
+        except UploadTooLarge as e:
+            logger.error(f"Uploaded file {file.filename} is too large")
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        except UnicodeDecodeError:
             logger.error(f"Invalid JSON format in uploaded file: {file.filename}")
             return {
                 "success": False,
                 "message": "The uploaded file is not valid JSON"
             }
-        
-        # Validate the imported JSON structure
-        try:
-            imported_data = validate_dynsec_json(imported_data)
-            logger.info("JSON validation successful")
         except ValueError as e:
             logger.error(f"Validation error: {str(e)}")
             return {
                 "success": False,
                 "message": f"Invalid dynamic security JSON format: {str(e)}"
             }
-        
-        # Create a backup of the current configuration
-        backup_path = create_backup()
-        logger.info(f"Created backup at: {backup_path}")
-        
-        # Merge imported config with default config to preserve critical components
-        merged_config = merge_dynsec_configs(imported_data)
-        logger.info("Successfully merged configuration")
-        
-        # Write the merged configuration
-        if write_dynsec_json(merged_config):
-            user_count = len(merged_config["clients"]) - 1  # Subtract admin user
-            group_count = len(merged_config["groups"])
-            role_count = len(merged_config["roles"]) - 1    # Subtract admin role
+
+        spools = imported["spools"]
+        try:
+            # Create a backup of the current configuration
+            backup_path = await run_blocking(create_backup)
+            logger.info(f"Created backup at: {backup_path}")
+
+            # Merge imported config with default config to preserve critical components
+            written = await run_blocking(write_merged_dynsec_json, spools)
+        finally:
+            for spool in spools.values():
+                spool.close()
+
+        if written:
+            # The dynsec plugin only reads its file at startup
+            await run_blocking(mark_restart_required, "Imported dynamic security configuration")
+            user_count = imported["counts"]["clients"]
+            group_count = imported["counts"]["groups"]
+            role_count = imported["counts"]["roles"]
             
             logger.info(f"Successfully imported configuration with {user_count} users, {group_count} groups, {role_count} roles")
             return {
@@ -373,6 +462,8 @@ async def import_dynsec_json(
                 "message": "Failed to write dynamic security configuration"
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error importing dynamic security JSON: {str(e)}")
         raise HTTPException(
@@ -387,10 +478,11 @@ async def reset_dynsec_json(api_key: str = Security(get_api_key)):
     """
     try:
         # Create a backup of the current configuration
-        backup_path = create_backup()
+        backup_path = await run_blocking(create_backup)
         
         # Write the default configuration
-        if write_dynsec_json(DEFAULT_CONFIG):
+        if await run_blocking(write_dynsec_json, DEFAULT_CONFIG):
+            await run_blocking(mark_restart_required, "Reset dynamic security configuration")
             return {
                 "success": True,
                 "message": "Successfully reset dynamic security configuration to default",
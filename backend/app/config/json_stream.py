@@ -0,0 +1,164 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/config/json_stream.py
+import json
+import re
+from typing import Any, Callable, Dict, Optional
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# What may follow a number that was cut off by the end of a chunk
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+
+# Parser states
+(_START, _FIRST_KEY, _KEY, _COLON, _VALUE,
+ _FIRST_ITEM, _ITEM, _ITEM_END, _MEMBER_END, _END) = range(10)
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class TopLevelJsonStream:
+    """Incremental parser for a JSON document whose top level is an object.
+
+    Text is fed in chunks of any size. Top-level members whose value is an
+    array are not decoded as a whole. Each element is decoded on its own and
+    passed to on_item(key, element) as soon as it is complete, and
+    `arrays` counts the elements per key. Any other value is passed to
+    on_value(key, value). Only the element being decoded
+    is buffered, so memory depends on the largest element (bounded by
+    max_item_chars), not on the document size. Syntax errors are raised as
+    JsonStreamError as soon as they can be told apart from a truncated
+    chunk.
+    """
+
+    def __init__(
+        self,
+        on_item: Callable[[str, Any], None],
+        on_value: Callable[[str, Any], None],
+        max_item_chars: int = 16 * 1024 * 1024,
+    ):
+        self.on_item = on_item
+        self.on_value = on_value
+        self.max_item_chars = max_item_chars
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = _START
+        self._key: Optional[str] = None
+        self._consumed = 0
+        self.arrays: Dict[str, int] = {}
+
+    def _error(self, message: str):
+        raise JsonStreamError(f"{message} at char {self._consumed + self._pos}")
+
+    def _skip_whitespace(self) -> bool:
+        """Move past whitespace; False if the buffer is exhausted"""
+        self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        return self._pos < len(self._buf)
+
+    def _decode(self, final: bool):
+        """Decode the value at the current position, or return None if it may still be incomplete"""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise JsonStreamError(f"{e.msg} at char {self._consumed + e.pos}")
+            # Most likely a truncated value; the next chunk decides
+            if len(self._buf) - self._pos > self.max_item_chars:
+                self._error("Value too large or invalid")
+            return None
+        if (not final and isinstance(value, (int, float)) and not isinstance(value, bool)
+                and _NUMBER_TAIL.match(self._buf, end)):
+            # The number could continue in the next chunk
+            return None
+        self._pos = end
+        return (value,)
+
+    def _expect(self, char: str) -> bool:
+        if self._buf[self._pos] != char:
+            self._error(f"Expected '{char}'")
+        self._pos += 1
+        return True
+
+    def _run(self, final: bool):
+        while self._skip_whitespace():
+            state = self._state
+            char = self._buf[self._pos]
+            if state == _START:
+                self._expect("{")
+                self._state = _FIRST_KEY
+            elif state in (_FIRST_KEY, _KEY):
+                if char == "}" and state == _FIRST_KEY:
+                    self._pos += 1
+                    self._state = _END
+                    continue
+                if char != '"':
+                    self._error("Expected a member name")
+                decoded = self._decode(final)
+                if decoded is None:
+                    return
+                self._key = decoded[0]
+                self._state = _COLON
+            elif state == _COLON:
+                self._expect(":")
+                self._state = _VALUE
+            elif state == _VALUE:
+                if char == "[":
+                    self._pos += 1
+                    self.arrays[self._key] = 0
+                    self._state = _FIRST_ITEM
+                    continue
+                decoded = self._decode(final)
+                if decoded is None:
+                    return
+                self.on_value(self._key, decoded[0])
+                self._state = _MEMBER_END
+            elif state in (_FIRST_ITEM, _ITEM):
+                if char == "]" and state == _FIRST_ITEM:
+                    self._pos += 1
+                    self._state = _MEMBER_END
+                    continue
+                decoded = self._decode(final)
+                if decoded is None:
+                    return
+                self.arrays[self._key] += 1
+                self.on_item(self._key, decoded[0])
+                self._state = _ITEM_END
+            elif state == _ITEM_END:
+                self._pos += 1
+                if char == ",":
+                    self._state = _ITEM
+                elif char == "]":
+                    self._state = _MEMBER_END
+                else:
+                    self._pos -= 1
+                    self._error("Expected ',' or ']'")
+            elif state == _MEMBER_END:
+                self._pos += 1
+                if char == ",":
+                    self._state = _KEY
+                elif char == "}":
+                    self._state = _END
+                else:
+                    self._pos -= 1
+                    self._error("Expected ',' or '}'")
+            else:
+                self._error("Extra data")
+
+    def feed(self, text: str):
+        self._buf = self._buf[self._pos:] + text
+        self._consumed += self._pos
+        self._pos = 0
+        self._run(final=False)
+
+    def close(self):
+        """Parse what is left; raises JsonStreamError if the document is incomplete"""
+        self._run(final=True)
+        if self._state != _END:
+            self._error("Unexpected end of document")
@@ -20,6 +20,7 @@ import uvicorn
 # Import the mosquitto_config router
 from mosquitto_config import router as mosquitto_config_router
 from dynsec_config import router as dynsec_config_router
+from blocking_io import blocking_executor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -98,7 +99,8 @@ async def health_check(request: Request):
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
-        "service": "mosquitto-config-api"
+        "service": "mosquitto-config-api",
+        "blocking_io": blocking_executor.stats(),
     }
 
 if __name__ == "__main__":
@@ -17,6 +17,8 @@ from typing import Dict, Any, List, Optional
 from fastapi import APIRouter, HTTPException, Depends, Security, status
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
+from blocking_io import run_blocking
+from reload_manager import RELOAD, RESTART, conf_snapshot, required_action
 
 # Router setup
 router = APIRouter(tags=["mosquitto_config"])
@@ -190,13 +192,44 @@ def generate_mosquitto_conf(
     return "\n".join(lines)
 
 
+def write_mosquitto_conf(content: str) -> str:
+    """
+    Back up mosquitto.conf and replace it with content. Returns the backup path
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_path = os.path.join(BACKUP_DIR, f"mosquitto.conf.bak.{timestamp}")
+
+    if os.path.exists(MOSQUITTO_CONF_PATH):
+        shutil.copy2(MOSQUITTO_CONF_PATH, backup_path)
+        logger.info(f"Created backup of Mosquitto configuration at {backup_path}")
+    else:
+        backup_path = ""
+
+    with open(MOSQUITTO_CONF_PATH, "w") as f:
+        f.write(content)
+
+    # Set proper permissions
+    os.chmod(MOSQUITTO_CONF_PATH, 0o644)
+    return backup_path
+
+
+def update_mosquitto_conf(content: str) -> Optional[str]:
+    """
+    Write mosquitto.conf like write_mosquitto_conf. Returns what applying the change
+    takes: RELOAD (a SIGHUP), RESTART, or None if no setting changed
+    """
+    before = conf_snapshot(MOSQUITTO_CONF_PATH)
+    write_mosquitto_conf(content)
+    return required_action(before, conf_snapshot(MOSQUITTO_CONF_PATH))
+
+
 @router.get("/mosquitto-config")
 async def get_mosquitto_config(api_key: str = Security(get_api_key)):
     """
     Get the current Mosquitto configuration
     """
     try:
-        config_data = parse_mosquitto_conf()
+        config_data = await run_blocking(parse_mosquitto_conf)
 
         if not config_data["config"]:
             return {
@@ -237,7 +270,7 @@ async def save_mosquitto_config(
             )
 
         # Validate listeners for duplicate ports
-        current_config = parse_mosquitto_conf()
+        current_config = await run_blocking(parse_mosquitto_conf)
         is_valid, error_message = validate_listeners(current_config.get("listeners", []), listeners_list)
         
         if not is_valid:
@@ -247,29 +280,18 @@ async def save_mosquitto_config(
                 "message": error_message
             }
 
-        # Create backup of current configuration
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"mosquitto.conf.bak.{timestamp}")
-
-        if os.path.exists(MOSQUITTO_CONF_PATH):
-            shutil.copy2(MOSQUITTO_CONF_PATH, backup_path)
-            logger.info(f"Created backup of Mosquitto configuration at {backup_path}")
-
         # Generate new configuration content
         new_config_content = generate_mosquitto_conf(config.config, listeners_list)
 
-        # Write new configuration
-        with open(MOSQUITTO_CONF_PATH, "w") as f:
-            f.write(new_config_content)
-
-        # Set proper permissions
-        os.chmod(MOSQUITTO_CONF_PATH, 0o644)
+        # Back up the current configuration and write the new one
+        action = await run_blocking(update_mosquitto_conf, new_config_content)
 
         logger.info(f"Mosquitto configuration saved successfully")
         return {
             "success": True,
             "message": "Mosquitto configuration saved successfully",
-            "need_restart": True,
+            "need_restart": action == RESTART,
+            "need_reload": action == RELOAD,
         }
 
     except Exception as e:
@@ -286,26 +308,15 @@ async def reset_mosquitto_config(api_key: str = Security(get_api_key)):
     Reset Mosquitto configuration to default
     """
     try:
-        # Create backup of current configuration
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"mosquitto.conf.bak.{timestamp}")
-
-        if os.path.exists(MOSQUITTO_CONF_PATH):
-            shutil.copy2(MOSQUITTO_CONF_PATH, backup_path)
-            logger.info(f"Created backup of Mosquitto configuration at {backup_path}")
-
-        # Write default configuration
-        with open(MOSQUITTO_CONF_PATH, "w") as f:
-            f.write(DEFAULT_CONFIG)
-
-        # Set proper permissions
-        os.chmod(MOSQUITTO_CONF_PATH, 0o644)
+        # Back up the current configuration and write the default one
+        action = await run_blocking(update_mosquitto_conf, DEFAULT_CONFIG)
 
         logger.info(f"Mosquitto configuration reset to default")
         return {
             "success": True,
             "message": "Mosquitto configuration reset to default",
-            "need_restart": True,
+            "need_restart": action == RESTART,
+            "need_reload": action == RELOAD,
         }
 
     except Exception as e:
@@ -333,7 +344,7 @@ async def remove_mosquitto_listener(
             )
 
         # Read current configuration
-        config_data = parse_mosquitto_conf()
+        config_data = await run_blocking(parse_mosquitto_conf)
         config_dict = config_data["config"]
         listeners_list = config_data["listeners"]
         
@@ -351,29 +362,18 @@ async def remove_mosquitto_listener(
                 detail=f"Listener with port {port} not found in configuration",
             )
         
-        # Create backup of current configuration
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(BACKUP_DIR, f"mosquitto.conf.bak.{timestamp}")
-
-        if os.path.exists(MOSQUITTO_CONF_PATH):
-            shutil.copy2(MOSQUITTO_CONF_PATH, backup_path)
-            logger.info(f"Created backup of Mosquitto configuration at {backup_path}")
-
         # Generate new configuration content
         new_config_content = generate_mosquitto_conf(config_dict, listeners_list)
 
-        # Write new configuration
-        with open(MOSQUITTO_CONF_PATH, "w") as f:
-            f.write(new_config_content)
-
-        # Set proper permissions
-        os.chmod(MOSQUITTO_CONF_PATH, 0o644)
+        # Back up the current configuration and write the new one
+        action = await run_blocking(update_mosquitto_conf, new_config_content)
 
         logger.info(f"Listener on port {port} removed from Mosquitto configuration")
         return {
             "success": True,
             "message": f"Listener on port {port} removed from Mosquitto configuration",
-            "need_restart": True,
+            "need_restart": action == RESTART,
+            "need_reload": action == RELOAD,
         }
 
     except HTTPException:
@@ -0,0 +1,450 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/dynsec/dynsec_state.py
+import bisect
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from dynsec_client import DynsecClient, DynsecError, response_result
+
+logger = logging.getLogger(__name__)
+
+DYNSEC_PATH = os.getenv("DYNSEC_PATH", "/var/lib/mosquitto/dynamic-security.json")
+# When the JSON file is not readable the model is loaded from the broker and
+# refreshed after this many seconds, since there is no file to watch
+DYNSEC_CACHE_TTL = float(os.getenv("DYNSEC_CACHE_TTL", "30"))
+# Largest page the list endpoints will return
+DYNSEC_MAX_PAGE_SIZE = int(os.getenv("DYNSEC_MAX_PAGE_SIZE", "1000"))
+
+
+def page_names(
+    names: List[str],
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+    search: Optional[str] = None,
+    descending: bool = False,
+    exclude: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """Return one page of an already sorted list of names.
+
+    Unfiltered and prefix queries bisect the sorted list, so a page costs
+    O(log n + limit). A substring search has to scan the (prefix-narrowed)
+    range. With a cursor, the page starts after that name and offset is
+    ignored. Names in exclude are left out of the page and the total.
+    """
+    limit = max(1, min(limit, DYNSEC_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
+    lo, hi = 0, len(names)
+    if prefix:
+        lo = bisect.bisect_left(names, prefix)
+        # Every name starting with the prefix sorts before prefix + U+10FFFF
+        hi = bisect.bisect_left(names, prefix + "\U0010ffff", lo)
+
+    if search:
+        needle = search.lower()
+        matches = [name for name in names[lo:hi] if needle in name.lower()]
+        names, lo, hi = matches, 0, len(matches)
+
+    # Positions of the excluded names; paging works on the positions left over
+    skipped = []
+    for name in set(exclude or ()):
+        i = bisect.bisect_left(names, name, lo, hi)
+        if i < hi and names[i] == name:
+            skipped.append(i)
+    skipped.sort()
+
+    def logical(pos: int) -> int:
+        return pos - lo - bisect.bisect_left(skipped, pos)
+
+    def physical(index: int) -> int:
+        pos = lo + index
+        for skip in skipped:
+            if skip > pos:
+                break
+            pos += 1
+        return pos
+
+    total = hi - lo - len(skipped)
+    if cursor is not None:
+        if descending:
+            end = logical(bisect.bisect_left(names, cursor, lo, hi))
+            start = max(0, end - limit)
+        else:
+            start = logical(bisect.bisect_right(names, cursor, lo, hi))
+            end = min(total, start + limit)
+        offset = (total - end) if descending else start
+    elif descending:
+        end = max(0, total - offset)
+        start = max(0, end - limit)
+    else:
+        start = min(total, offset)
+        end = min(total, start + limit)
+
+    items = []
+    if start < end:
+        excluded = {names[i] for i in skipped}
+        items = [
+            name for name in names[physical(start):physical(end - 1) + 1]
+            if name not in excluded
+        ]
+    if descending:
+        items.reverse()
+    has_more = start > 0 if descending else end < total
+    return {
+        "items": items,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_cursor": items[-1] if items and has_more else None,
+    }
+
+
+class DynsecState:
+    """In-process model of dynsec clients, groups and roles.
+
+    The model is loaded from dynamic-security.json (or from a verbose
+    listClients/listGroups/listRoles dump when the file is not available),
+    kept up to date with the API's own mutations, and reloaded when the
+    file's mtime, size or inode changes underneath it.
+    """
+
+    def __init__(self, dynsec_client: DynsecClient, path: str = DYNSEC_PATH):
+        self.dynsec_client = dynsec_client
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._loaded_from_broker_at = 0.0
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.roles: Dict[str, Dict[str, Any]] = {}
+        # Sorted names per kind, kept in step with the dicts above
+        self._index: Dict[str, List[str]] = {"clients": [], "groups": [], "roles": []}
+
+    # Loading
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load_from_file(self) -> bool:
+        signature = self._file_signature()
+        if signature is None:
+            return False
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading dynsec state from {self.path}: {str(e)}")
+            return False
+
+        self._set_data(data.get("clients", []), data.get("groups", []), data.get("roles", []))
+        self._signature = signature
+        logger.info(
+            f"Loaded dynsec state from file: {len(self.clients)} clients, "
+            f"{len(self.groups)} groups, {len(self.roles)} roles"
+        )
+        return True
+
+    def _load_from_broker(self) -> bool:
+        commands = [
+            {"command": name, "verbose": True, "count": -1, "offset": 0}
+            for name in ("listClients", "listGroups", "listRoles")
+        ]
+        try:
+            responses = self.dynsec_client.execute(commands)
+        except DynsecError as e:
+            logger.error(f"Error loading dynsec state from broker: {str(e)}")
+            return False
+
+        results = [response_result(response) for response in responses]
+        if not all(success for success, _ in results):
+            logger.error(f"Error loading dynsec state from broker: {results}")
+            return False
+
+        clients, groups, roles = (
+            data.get(key, []) for (_, data), key in zip(results, ("clients", "groups", "roles"))
+        )
+        self._set_data(clients, groups, roles)
+        self._loaded_from_broker_at = time.monotonic()
+        logger.info(f"Loaded dynsec state from broker: {len(self.clients)} clients")
+        return True
+
+    def _set_data(self, clients: List[Dict], groups: List[Dict], roles: List[Dict]):
+        self.clients = {}
+        for client in clients:
+            username = client.get("username")
+            if username is None:
+                continue
+            self.clients[username] = {
+                "username": username,
+                "clientid": client.get("clientid", ""),
+                "textname": client.get("textname", ""),
+                "disabled": client.get("disabled", False),
+                "roles": [dict(role) for role in client.get("roles", [])],
+                # Filled from the groups below; the file only stores membership on groups
+                "groups": [],
+            }
+
+        self.groups = {}
+        for group in groups:
+            groupname = group.get("groupname")
+            if groupname is None:
+                continue
+            self.groups[groupname] = {
+                "groupname": groupname,
+                "textname": group.get("textname", ""),
+                "roles": [dict(role) for role in group.get("roles", [])],
+                "clients": [dict(member) for member in group.get("clients", [])],
+            }
+            for member in group.get("clients", []):
+                client = self.clients.get(member.get("username"))
+                if client is not None:
+                    entry = {"groupname": groupname}
+                    if "priority" in member:
+                        entry["priority"] = member["priority"]
+                    client["groups"].append(entry)
+
+        self.roles = {}
+        for role in roles:
+            rolename = role.get("rolename")
+            if rolename is None:
+                continue
+            self.roles[rolename] = {
+                "rolename": rolename,
+                "textname": role.get("textname", ""),
+                "acls": [dict(acl) for acl in role.get("acls", [])],
+            }
+
+        self._index = {
+            "clients": sorted(self.clients),
+            "groups": sorted(self.groups),
+            "roles": sorted(self.roles),
+        }
+        self._loaded = True
+
+    def _index_add(self, kind: str, name: str):
+        names = self._index[kind]
+        i = bisect.bisect_left(names, name)
+        if i == len(names) or names[i] != name:
+            names.insert(i, name)
+
+    def _index_remove(self, kind: str, name: str):
+        names = self._index[kind]
+        i = bisect.bisect_left(names, name)
+        if i < len(names) and names[i] == name:
+            del names[i]
+
+    def ensure_fresh(self) -> bool:
+        """Reload the model if it is missing or stale. Returns False if unavailable."""
+        with self._lock:
+            signature = self._file_signature()
+            if signature is not None:
+                if self._loaded and signature == self._signature:
+                    return True
+                return self._load_from_file()
+
+            if self._loaded and time.monotonic() - self._loaded_from_broker_at < DYNSEC_CACHE_TTL:
+                return True
+            return self._load_from_broker()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def mark_synced(self):
+        """Adopt the file's current signature after an own mutation was applied.
+
+        The dynsec plugin saves its file before replying to a command, so the
+        file now matches the model and does not need to be reloaded.
+        """
+        with self._lock:
+            if self._loaded and self._signature is not None:
+                self._signature = self._file_signature()
+
+    # Reads
+
+    def list_clients(self) -> List[str]:
+        with self._lock:
+            return list(self._index["clients"])
+
+    def list_groups(self) -> List[str]:
+        with self._lock:
+            return list(self._index["groups"])
+
+    def list_roles(self) -> List[str]:
+        with self._lock:
+            return list(self._index["roles"])
+
+    def page(self, kind: str, limit: int, **options) -> Dict[str, Any]:
+        """One page of client, group or role names; see page_names for options"""
+        with self._lock:
+            return page_names(self._index[kind], limit, **options)
+
+    def get_client(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.clients.get(username))
+
+    def get_group(self, groupname: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.groups.get(groupname))
+
+    def get_role(self, rolename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.roles.get(rolename))
+
+    # Mutations
+
+    def apply(self, command: Dict[str, Any]):
+        """Apply a successful dynsec command to the model"""
+        with self._lock:
+            if not self._loaded:
+                return
+            handler = getattr(self, f"_apply_{command['command']}", None)
+            if handler is None:
+                # Not modelled (or read-only): nothing to do for reads, reload otherwise
+                if not command["command"].startswith(("list", "get")):
+                    self._loaded = False
+                return
+            try:
+                handler(command)
+            except KeyError as e:
+                logger.warning(f"Dynsec state out of sync applying {command['command']}: {e}")
+                self._loaded = False
+
+    def _apply_createClient(self, command):
+        self._index_add("clients", command["username"])
+        self.clients[command["username"]] = {
+            "username": command["username"],
+            "clientid": command.get("clientid", ""),
+            "textname": command.get("textname", ""),
+            "disabled": False,
+            "roles": [],
+            "groups": [],
+        }
+
+    def _apply_deleteClient(self, command):
+        username = command["username"]
+        client = self.clients.pop(username)
+        self._index_remove("clients", username)
+        for entry in client["groups"]:
+            group = self.groups.get(entry["groupname"])
+            if group is not None:
+                group["clients"] = [c for c in group["clients"] if c.get("username") != username]
+
+    def _apply_setClientPassword(self, command):
+        # Password hashes are not kept in the model
+        pass
+
+    def _apply_enableClient(self, command):
+        self.clients[command["username"]]["disabled"] = False
+
+    def _apply_disableClient(self, command):
+        self.clients[command["username"]]["disabled"] = True
+
+    def _apply_addClientRole(self, command):
+        client = self.clients[command["username"]]
+        client["roles"] = [r for r in client["roles"] if r["rolename"] != command["rolename"]]
+        entry = {"rolename": command["rolename"]}
+        if command.get("priority") is not None:
+            entry["priority"] = command["priority"]
+        client["roles"].append(entry)
+
+    def _apply_removeClientRole(self, command):
+        client = self.clients[command["username"]]
+        client["roles"] = [r for r in client["roles"] if r["rolename"] != command["rolename"]]
+
+    def _apply_createGroup(self, command):
+        self._index_add("groups", command["groupname"])
+        self.groups[command["groupname"]] = {
+            "groupname": command["groupname"],
+            "textname": command.get("textname", ""),
+            "roles": [],
+            "clients": [],
+        }
+
+    def _apply_deleteGroup(self, command):
+        groupname = command["groupname"]
+        group = self.groups.pop(groupname)
+        self._index_remove("groups", groupname)
+        for member in group["clients"]:
+            client = self.clients.get(member.get("username"))
+            if client is not None:
+                client["groups"] = [g for g in client["groups"] if g["groupname"] != groupname]
+
+    def _apply_addGroupRole(self, command):
+        group = self.groups[command["groupname"]]
+        group["roles"] = [r for r in group["roles"] if r["rolename"] != command["rolename"]]
+        entry = {"rolename": command["rolename"]}
+        if command.get("priority") is not None:
+            entry["priority"] = command["priority"]
+        group["roles"].append(entry)
+
+    def _apply_removeGroupRole(self, command):
+        group = self.groups[command["groupname"]]
+        group["roles"] = [r for r in group["roles"] if r["rolename"] != command["rolename"]]
+
+    def _apply_addGroupClient(self, command):
+        group = self.groups[command["groupname"]]
+        client = self.clients[command["username"]]
+        member = {"username": command["username"]}
+        entry = {"groupname": command["groupname"]}
+        if command.get("priority") is not None:
+            member["priority"] = entry["priority"] = command["priority"]
+        group["clients"] = [c for c in group["clients"] if c.get("username") != command["username"]]
+        group["clients"].append(member)
+        client["groups"] = [g for g in client["groups"] if g["groupname"] != command["groupname"]]
+        client["groups"].append(entry)
+
+    def _apply_removeGroupClient(self, command):
+        group = self.groups[command["groupname"]]
+        client = self.clients[command["username"]]
+        group["clients"] = [c for c in group["clients"] if c.get("username") != command["username"]]
+        client["groups"] = [g for g in client["groups"] if g["groupname"] != command["groupname"]]
+
+    def _apply_createRole(self, command):
+        self._index_add("roles", command["rolename"])
+        self.roles[command["rolename"]] = {
+            "rolename": command["rolename"],
+            "textname": command.get("textname", ""),
+            "acls": [],
+        }
+
+    def _apply_deleteRole(self, command):
+        rolename = command["rolename"]
+        del self.roles[rolename]
+        self._index_remove("roles", rolename)
+        for holder in list(self.clients.values()) + list(self.groups.values()):
+            holder["roles"] = [r for r in holder["roles"] if r["rolename"] != rolename]
+
+    def _apply_addRoleACL(self, command):
+        role = self.roles[command["rolename"]]
+        role["acls"].append({
+            "acltype": command["acltype"],
+            "topic": command["topic"],
+            "priority": command.get("priority", 0),
+            "allow": command.get("allow", False),
+        })
+
+    def _apply_removeRoleACL(self, command):
+        role = self.roles[command["rolename"]]
+        role["acls"] = [
+            acl for acl in role["acls"]
+            if not (acl["acltype"] == command["acltype"] and acl["topic"] == command["topic"])
+        ]
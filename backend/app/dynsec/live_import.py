@@ -0,0 +1,310 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/dynsec/live_import.py
+import asyncio
+import itertools
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from blocking_io import run_blocking
+from dynsec_client import DynsecClient
+
+logger = logging.getLogger(__name__)
+
+# Where live import jobs keep their username lists and checkpoints
+DYNSEC_IMPORT_JOB_DIR = os.getenv("DYNSEC_IMPORT_JOB_DIR", "/tmp/mosquitto_uploads/jobs")
+# Upper bound on createClient commands sent per second by a live import
+DYNSEC_IMPORT_RATE = float(os.getenv("DYNSEC_IMPORT_RATE", "1000"))
+# Commands sent between two checkpoints of a live import
+DYNSEC_IMPORT_WINDOW = int(os.getenv("DYNSEC_IMPORT_WINDOW", "1000"))
+# Resume jobs that were running when the service stopped
+DYNSEC_IMPORT_AUTO_RESUME = os.getenv("DYNSEC_IMPORT_AUTO_RESUME", "true").lower() in ("1", "true", "yes")
+# Failed usernames kept in a job's status for display
+DYNSEC_IMPORT_MAX_ERRORS = 100
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+INTERRUPTED = "interrupted"
+COMPLETED = "completed"
+
+
+class ImportJob:
+    """Progress of one live import, persisted as a checkpoint after every window"""
+
+    def __init__(self, job_id: str, total: int, created_at: Optional[float] = None):
+        self.id = job_id
+        self.total = total
+        self.created_at = created_at or time.time()
+        self.state = QUEUED
+        self.processed = 0
+        self.created = 0
+        self.existing = 0
+        self.failed = 0
+        self.errors: List[Dict[str, str]] = []
+        self.last_error: Optional[str] = None
+        # Created past the resume point of an interrupted window; not counted again when resent
+        self.ahead: List[str] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.run_started_at: Optional[float] = None
+        self.run_processed = 0
+        self.pause_requested = False
+
+    @property
+    def users_path(self) -> str:
+        return os.path.join(DYNSEC_IMPORT_JOB_DIR, f"{self.id}.users")
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(DYNSEC_IMPORT_JOB_DIR, f"{self.id}.json")
+
+    def to_dict(self) -> Dict[str, Any]:
+        rate = 0.0
+        if self.state == RUNNING and self.run_started_at:
+            elapsed = time.time() - self.run_started_at
+            rate = self.run_processed / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.processed
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "processed": self.processed,
+            "created": self.created,
+            "existing": self.existing,
+            "failed": self.failed,
+            "progress": round(100.0 * self.processed / self.total, 1) if self.total else 100.0,
+            "rate_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate) if rate else None,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_error": self.last_error,
+            "errors": self.errors,
+        }
+
+    def save(self):
+        """Write the checkpoint atomically so a crash never leaves a torn file"""
+        data = self.to_dict()
+        data.pop("rate_per_second")
+        data.pop("eta_seconds")
+        data["ahead"] = self.ahead
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    @classmethod
+    def load(cls, path: str) -> "ImportJob":
+        with open(path) as f:
+            data = json.load(f)
+        job = cls(data["job_id"], data["total"], data["created_at"])
+        for key in ("state", "processed", "created", "existing", "failed", "errors",
+                    "last_error", "started_at", "finished_at"):
+            setattr(job, key, data[key])
+        job.ahead = data.get("ahead", [])
+        return job
+
+
+def _write_usernames(path: str, usernames: Iterable[str]) -> int:
+    count = 0
+    with open(path, "w") as f:
+        for username in usernames:
+            f.write(username)
+            f.write("\n")
+            count += 1
+    return count
+
+
+def _read_window(f, size: int) -> List[str]:
+    return [line.rstrip("\n") for line in itertools.islice(f, size)]
+
+
+def _skip_lines(f, count: int):
+    for _ in itertools.islice(f, count):
+        pass
+
+
+class LiveImporter:
+    """Create clients on the running broker through dynsec control commands.
+
+    Instead of rewriting dynamic-security.json and restarting mosquitto,
+    which drops every connection, each username becomes a createClient
+    command. The commands are sent with DynsecClient.execute_pipelined in
+    windows of DYNSEC_IMPORT_WINDOW and throttled to DYNSEC_IMPORT_RATE per
+    second. Connected clients are not affected. The usernames are written
+    to a job file and a checkpoint is saved after every window, so an
+    interrupted job (lost broker connection, pause, service restart)
+    resumes where it stopped. Clients that already exist are counted, not
+    treated as failures, which makes repeating a window harmless. Jobs run
+    one at a time in the order they were started.
+    """
+
+    def __init__(self, client: DynsecClient, on_applied: Callable[[List[Dict[str, Any]]], None],
+                 rate: float = DYNSEC_IMPORT_RATE, window: int = DYNSEC_IMPORT_WINDOW):
+        self.client = client
+        self.on_applied = on_applied
+        self.rate = rate
+        self.window = max(1, window)
+        self.jobs: Dict[str, ImportJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._run_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    def load(self) -> List[ImportJob]:
+        """Load the saved jobs; unfinished ones that were not paused are marked interrupted and returned"""
+        os.makedirs(DYNSEC_IMPORT_JOB_DIR, exist_ok=True)
+        interrupted = []
+        for name in sorted(os.listdir(DYNSEC_IMPORT_JOB_DIR)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = ImportJob.load(os.path.join(DYNSEC_IMPORT_JOB_DIR, name))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Skipping unreadable import job {name}: {e}")
+                continue
+            if job.state in (QUEUED, RUNNING, INTERRUPTED):
+                job.state = INTERRUPTED
+                interrupted.append(job)
+            self.jobs[job.id] = job
+        if interrupted:
+            logger.info(f"Found {len(interrupted)} interrupted live import jobs")
+        return interrupted
+
+    def create(self, usernames: Iterable[str]) -> ImportJob:
+        """Write the usernames to a new job. Blocking; the job is not started."""
+        os.makedirs(DYNSEC_IMPORT_JOB_DIR, exist_ok=True)
+        job = ImportJob(secrets.token_hex(8), 0)
+        job.total = _write_usernames(job.users_path, usernames)
+        job.save()
+        self.jobs[job.id] = job
+        return job
+
+    def start(self, job: ImportJob):
+        """Schedule a job on the running event loop (also used to resume one)"""
+        task = self._tasks.get(job.id)
+        if task is not None and not task.done():
+            return
+        if self._run_lock is None:
+            self._run_lock = asyncio.Lock()
+        job.state = QUEUED
+        job.pause_requested = False
+        self._tasks[job.id] = asyncio.get_running_loop().create_task(self._run(job))
+
+    def pause(self, job: ImportJob):
+        """Stop a job after its current window; it can be resumed with start()"""
+        job.pause_requested = True
+
+    async def stop(self):
+        """Stop all jobs after their current window, at shutdown; they stay resumable"""
+        self._stopping = True
+        for job in self.jobs.values():
+            job.pause_requested = True
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=30)
+
+    def _paused_state(self) -> str:
+        # Jobs stopped by a shutdown are resumed at the next start
+        return INTERRUPTED if self._stopping else PAUSED
+
+    async def _run(self, job: ImportJob):
+        async with self._run_lock:
+            if job.pause_requested:
+                job.state = self._paused_state()
+                await run_blocking(job.save)
+                return
+            job.state = RUNNING
+            job.started_at = job.started_at or time.time()
+            job.run_started_at = time.time()
+            job.run_processed = 0
+            logger.info(f"Live import {job.id}: resuming at {job.processed} of {job.total}")
+            try:
+                await self._process(job)
+            except Exception as e:
+                job.state = INTERRUPTED
+                job.last_error = str(e)
+                logger.error(f"Live import {job.id} interrupted: {e}")
+            await run_blocking(job.save)
+            logger.info(
+                f"Live import {job.id} {job.state}: {job.created} created, "
+                f"{job.existing} existing, {job.failed} failed of {job.total}"
+            )
+
+    async def _process(self, job: ImportJob):
+        f = await run_blocking(open, job.users_path)
+        try:
+            await run_blocking(_skip_lines, f, job.processed)
+            while True:
+                if job.pause_requested:
+                    job.state = self._paused_state()
+                    return
+                usernames = await run_blocking(_read_window, f, self.window)
+                if not usernames:
+                    job.state = COMPLETED
+                    job.finished_at = time.time()
+                    return
+
+                started = time.monotonic()
+                commands = [{"command": "createClient", "username": username} for username in usernames]
+                responses = await self.client.execute_pipelined(commands)
+                applied = []
+                ahead = set(job.ahead)
+                # Position of the first undelivered command; the job resumes from there
+                rewind = None
+                for command, response in zip(commands, responses):
+                    username = command["username"]
+                    error = response.get("error")
+                    if response.get("undelivered"):
+                        if rewind is None:
+                            rewind = job.processed
+                            job.last_error = error
+                    elif not error:
+                        job.created += 1
+                        applied.append(command)
+                        if rewind is not None:
+                            # Sent again on resume, where its "already exists" is not counted
+                            ahead.add(username)
+                    elif rewind is not None:
+                        # Sent again on resume and counted then
+                        pass
+                    elif "already exists" in error.lower():
+                        if username in ahead:
+                            ahead.discard(username)
+                        else:
+                            job.existing += 1
+                    else:
+                        job.failed += 1
+                        if len(job.errors) < DYNSEC_IMPORT_MAX_ERRORS:
+                            job.errors.append({"username": username, "error": error})
+                    job.processed += 1
+                    job.run_processed += 1
+                if rewind is not None:
+                    job.run_processed -= job.processed - rewind
+                    job.processed = rewind
+                    job.state = INTERRUPTED
+                job.ahead = sorted(ahead)
+                if applied:
+                    self.on_applied(applied)
+                await run_blocking(job.save)
+                if job.state == INTERRUPTED:
+                    logger.warning(f"Live import {job.id} interrupted at {job.processed}: {job.last_error}")
+                    return
+
+                # Throttle to the configured command rate
+                if self.rate > 0:
+                    delay = len(commands) / self.rate - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+        finally:
+            f.close()
@@ -7,7 +7,7 @@
 #
 # app/dynsec/main.py
 import logging
-from fastapi import FastAPI, HTTPException, Security, Depends, Request, status, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Security, Depends, Request, status, UploadFile, File, Form, Query
 from fastapi.security.api_key import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
@@ -18,7 +18,6 @@ from slowapi.errors import RateLimitExceeded
 from fastapi.responses import JSONResponse """
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-import subprocess
 import os
 import json
 import ssl
@@ -28,8 +27,13 @@ from datetime import datetime, timedelta
 import secrets
 from logging.handlers import RotatingFileHandler
 from pydantic import BaseModel, Field
-from password_import import router as password_import_router
+from password_import import router as password_import_router, set_live_importer
+from dynsec_client import DynsecClient, DynsecError, response_result
+from dynsec_state import DynsecState, DYNSEC_MAX_PAGE_SIZE, page_names
+from live_import import LiveImporter, DYNSEC_IMPORT_AUTO_RESUME
+from blocking_io import blocking_executor, run_blocking
 import uvicorn
+from contextlib import asynccontextmanager
 # Load environment variables from .env file
 load_dotenv()
 
@@ -50,21 +54,47 @@ logger.addHandler(handler)
 # Environment variables
 MOSQUITTO_ADMIN_USERNAME = os.getenv("MOSQUITTO_ADMIN_USERNAME")
 MOSQUITTO_ADMIN_PASSWORD = os.getenv("MOSQUITTO_ADMIN_PASSWORD")
-MOSQUITTO_IP = os.getenv("MOSQUITTO_IP")
-MOSQUITTO_PORT = os.getenv("MOSQUITTO_PORT")
+MOSQUITTO_IP = os.getenv("MOSQUITTO_IP", "127.0.0.1")
+MOSQUITTO_PORT = int(os.getenv("MOSQUITTO_PORT", "1900"))
 API_KEY = os.getenv("API_KEY")
+# Page size used by the list endpoints when filtering without an explicit limit
+DYNSEC_DEFAULT_PAGE_SIZE = int(os.getenv("DYNSEC_DEFAULT_PAGE_SIZE", "100"))
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost").split(",")
 
-# Base command for mosquitto_ctrl
-DYNSEC_BASE_COMMAND = [
-    "mosquitto_ctrl",
-    "-h", os.getenv("MOSQUITTO_IP"),
-    "-p", os.getenv("MOSQUITTO_PORT"),
-    "-u", os.getenv("MOSQUITTO_ADMIN_USERNAME"),
-    "-P", os.getenv("MOSQUITTO_ADMIN_PASSWORD"),
-    "dynsec"
-]
+# Persistent connection to the dynamic-security control topic
+dynsec_client = DynsecClient(
+    MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD
+)
+
+# In-memory model of clients, groups and roles used by the list/get endpoints
+dynsec_state = DynsecState(dynsec_client)
+
+
+def _apply_to_state(commands: List[Dict[str, Any]]):
+    """Record successful mutations in the cached dynsec state"""
+    for command in commands:
+        dynsec_state.apply(command)
+    dynsec_state.mark_synced()
+
+
+# Password imports that create clients on the running broker
+live_importer = LiveImporter(dynsec_client, _apply_to_state)
+set_live_importer(live_importer)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    dynsec_client.start()
+    interrupted = await run_blocking(live_importer.load)
+    if DYNSEC_IMPORT_AUTO_RESUME:
+        for job in interrupted:
+            live_importer.start(job)
+    yield
+    await live_importer.stop()
+    dynsec_client.stop()
+    blocking_executor.shutdown()
+
 
 # Initialize FastAPI app with versioning
 app = FastAPI(
@@ -72,6 +102,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -178,33 +209,137 @@ class ACLRequest(BaseModel):
     permission: str = Field(..., description="Permission (allow or deny)")
 
 
-# Mosquitto command execution with logging
-def execute_mosquitto_command(command: list, input_data: str = None) -> tuple[bool, str]:
-    try:
-        full_command = DYNSEC_BASE_COMMAND + command
-        logger.debug(f"Executing command: {' '.join(full_command)}")
-        process = subprocess.Popen(
-            full_command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+# Models for bulk operations
+class BulkOperationType(str, Enum):
+    CREATE_CLIENT = "create_client"
+    SET_PASSWORD = "set_password"
+    ADD_CLIENT_ROLE = "add_client_role"
+    ADD_GROUP_CLIENT = "add_group_client"
+    ADD_ROLE_ACL = "add_role_acl"
+
+
+class RollbackMode(str, Enum):
+    NONE = "none"  # Keep whatever succeeded
+    CLIENT = "client"  # Delete clients created here if any of their operations failed
+    ALL = "all"  # Undo every successful operation if anything failed
+
 
-        stdout, stderr = process.communicate(input=input_data)
+class BulkOperation(BaseModel):
+    op: BulkOperationType
+    username: Optional[str] = None
+    password: Optional[str] = None
+    role_name: Optional[str] = None
+    group_name: Optional[str] = None
+    priority: Optional[int] = None
+    topic: Optional[str] = None
+    aclType: Optional[str] = None
+    permission: Optional[str] = None
 
-        if process.returncode == 0:
-            logger.debug(f"Command succeeded: {stdout.strip()}")
-            return True, stdout.strip()
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation]
+    rollback: RollbackMode = RollbackMode.CLIENT
+
+
+# Dynsec command execution with logging
+async def execute_dynsec_command(command: str, **params) -> tuple[bool, Any]:
+    """Run one dynamic-security command over the persistent control connection.
+
+    Returns (success, data) where data is the structured response payload on
+    success and the broker's error message on failure.
+    """
+    try:
+        logger.debug(f"Executing dynsec command: {command}")
+        responses = await dynsec_client.execute_async([{"command": command, **params}])
+        success, result = response_result(responses[0])
+
+        if success:
+            logger.debug(f"Command succeeded: {command}")
+            _apply_to_state([{"command": command, **params}])
         else:
-            logger.error(f"Command failed: {stderr.strip()}")
-            return False, stderr.strip()
+            logger.error(f"Command failed: {result}")
+        return success, result
 
-    except Exception as e:
+    except DynsecError as e:
         logger.error(f"Error executing command: {str(e)}")
         return False, str(e)
 
 
+async def _state_ready() -> bool:
+    """Make sure the cached dynsec state is current (file stat/reload off the loop)"""
+    return await run_blocking(dynsec_state.ensure_fresh)
+
+
+async def _list_names(kind: str, command: str) -> List[str]:
+    """All client, group or role names, sorted"""
+    if await _state_ready():
+        return getattr(dynsec_state, f"list_{kind}")()
+    success, result = await execute_dynsec_command(
+        command, verbose=False, count=-1, offset=0
+    )
+    if not success:
+        logger.error(f"Failed to list {kind}: {result}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
+    return sorted(result.get(kind, []))
+
+
+async def _name_page(kind: str, command: str, limit: Optional[int], **options) -> Dict[str, Any]:
+    """One page of client, group or role names, served from the state index when possible"""
+    limit = limit or DYNSEC_DEFAULT_PAGE_SIZE
+    if await _state_ready():
+        return dynsec_state.page(kind, limit, **options)
+    return page_names(await _list_names(kind, command), limit, **options)
+
+
+def _priority(entry: Dict[str, Any]) -> str:
+    """Priority as shown by mosquitto_ctrl (-1 when unset)"""
+    return str(entry.get("priority", -1))
+
+
+def _client_info(client: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "username": client.get("username", ""),
+        "clientid": client.get("clientid", ""),
+        "disabled": client.get("disabled", False),
+        "roles": [
+            {"name": role["rolename"], "priority": _priority(role)}
+            for role in client.get("roles", [])
+        ],
+        "groups": [
+            {"name": group["groupname"], "priority": _priority(group)}
+            for group in client.get("groups", [])
+        ],
+    }
+
+
+def _group_info(group: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": group.get("groupname", ""),
+        "roles": [
+            {"name": role["rolename"], "priority": _priority(role)}
+            for role in group.get("roles", [])
+        ],
+        "clients": [client["username"] for client in group.get("clients", [])],
+    }
+
+
+def _role_acls(role: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "topic": acl["topic"],
+            "aclType": acl["acltype"],
+            "permission": "allow" if acl.get("allow") else "deny",
+            "priority": int(acl.get("priority", 0)),
+        }
+        for acl in role.get("acls", [])
+    ]
+
+
 # Client management endpoints
 @app.post("/api/v1/clients", response_model=ClientResponse)
 async def create_client(
@@ -218,11 +353,10 @@ async def create_client(
     logger.info(f"Creating new client with username: {client.username}")
 
     try:
-        # Command to create the client
-        command = ["createClient", client.username]
-
-        # Execute the createClient command
-        success, result = execute_mosquitto_command(command)
+        # Create the client with its password in a single command
+        success, result = await execute_dynsec_command(
+            "createClient", username=client.username, password=client.password
+        )
 
         if not success:
             logger.error(f"Error creating client {client.username}: {result}")
@@ -231,25 +365,6 @@ async def create_client(
                 detail=f"Error creating client: {result}",
             )
 
-        # Command to set the client password
-        set_password_command = ["setClientPassword", client.username, client.password]
-
-        # Execute the setClientPassword command
-        success, result = execute_mosquitto_command(set_password_command)
-
-        if not success:
-            logger.error(
-                f"Error setting password for client {client.username}: {result}"
-            )
-            # Try to cleanup the created client if password setting fails
-            cleanup_command = ["deleteClient", client.username]
-            execute_mosquitto_command(cleanup_command)
-
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Error setting password: {result}",
-            )
-
         logger.info(f"Successfully created client: {client.username}")
         return ClientResponse(
             username=client.username,
@@ -263,8 +378,7 @@ async def create_client(
         logger.error(f"Unexpected error creating client {client.username}: {str(e)}")
         # Attempt cleanup on unexpected error
         try:
-            cleanup_command = ["deleteClient", client.username]
-            execute_mosquitto_command(cleanup_command)
+            await execute_dynsec_command("deleteClient", username=client.username)
         except:
             pass
 
@@ -282,6 +396,15 @@ async def list_clients(
     timestamp: Optional[
         int
     ] = None,  # Make timestamp optional and ensure it's an integer
+    limit: Optional[int] = Query(
+        None, ge=1, le=DYNSEC_MAX_PAGE_SIZE, description="Page size; enables paged JSON output"
+    ),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Return names after this one"),
+    prefix: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Case-insensitive substring match"),
+    exclude: Optional[List[str]] = Query(None, description="Usernames to leave out of the page"),
+    sort: SortOrder = SortOrder.ASC,
     api_key: str = Security(get_api_key),
 ):
     """List all clients"""
@@ -289,15 +412,25 @@ async def list_clients(
     logger.info(f"Listing clients. Nonce: {nonce}, Timestamp: {timestamp}")
 
     try:
-        command = ["listClients"]
-
-        success, result = execute_mosquitto_command(command)
-        if not success:
-            logger.error(f"Failed to list clients: {result}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
-
-        logger.info("Successfully retrieved client list")
-        return {"clients": result}
+        if limit is None and cursor is None and prefix is None and search is None and exclude is None:
+            # Without paging parameters keep the original newline-joined format
+            names = await _list_names("clients", "listClients")
+            logger.info("Successfully retrieved client list")
+            return {"clients": "\n".join(names)}
+
+        page = await _name_page(
+            "clients",
+            "listClients",
+            limit,
+            offset=offset,
+            cursor=cursor,
+            prefix=prefix,
+            search=search,
+            exclude=exclude,
+            descending=sort == SortOrder.DESC,
+        )
+        logger.info(f"Successfully retrieved client page: {len(page['items'])} of {page['total']}")
+        return page
 
     except Exception as e:
         logger.error(f"Unexpected error listing clients: {str(e)}")
@@ -318,51 +451,22 @@ async def get_client(
     logger.info(f"Fetching details for client: {username}")
 
     try:
-        command = ["getClient", username]
-        success, result = execute_mosquitto_command(command)
+        if await _state_ready():
+            client = dynsec_state.get_client(username)
+        else:
+            success, result = await execute_dynsec_command("getClient", username=username)
+            client = result["client"] if success else None
 
-        if not success:
+        if client is None:
             logger.error(f"Client not found: {username}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Client {username} not found",
             )
 
-        # Parse the output
+        # Convert the structured response to the API format
         try:
-            lines = result.split("\n")
-            client_info = {"username": "", "clientid": "", "roles": [], "groups": []}
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith("Username:"):
-                    client_info["username"] = line.split("Username:")[1].strip()
-                elif line.startswith("Clientid:"):
-                    client_info["clientid"] = line.split("Clientid:")[1].strip()
-                elif line.startswith("Roles:"):
-                    role_info = line.split("Roles:")[1].strip()
-                    if role_info:
-                        role_parts = role_info.split("(")
-                        role_name = role_parts[0].strip()
-                        priority = (
-                            role_parts[1].split(")")[0].replace("priority:", "").strip()
-                        )
-                        client_info["roles"].append(
-                            {"name": role_name, "priority": priority}
-                        )
-                elif "priority:" in line:
-                    if "(" in line and ")" in line:
-                        parts = line.strip().split("(")
-                        name = parts[0].strip()
-                        priority = (
-                            parts[1].split(")")[0].replace("priority:", "").strip()
-                        )
-                        if name:
-                            if "Groups:" in line:
-                                client_info["groups"] = []
-                            client_info["groups"].append(
-                                {"name": name, "priority": priority}
-                            )
+            client_info = _client_info(client)
 
             logger.info(f"Successfully retrieved details for client: {username}")
             return {"client": client_info}
@@ -396,9 +500,7 @@ async def enable_client(
     logger.info(f"Enabling client: {username}")
 
     try:
-        command = ["enableClient", username]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("enableClient", username=username)
         if not success:
             logger.error(f"Failed to enable client {username}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -428,9 +530,7 @@ async def disable_client(
     logger.info(f"Disabling client: {username}")
 
     try:
-        command = ["disableClient", username]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("disableClient", username=username)
         if not success:
             logger.error(f"Failed to disable client {username}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -460,9 +560,7 @@ async def remove_client(
     logger.info(f"Removing client: {username}")
 
     try:
-        command = ["deleteClient", username]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("deleteClient", username=username)
         if not success:
             logger.error(f"Failed to remove client {username}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -496,9 +594,7 @@ async def create_role(
     logger.info(f"Creating new role: {role.name}")
 
     try:
-        command = ["createRole", role.name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("createRole", rolename=role.name)
         if not success:
             logger.error(f"Failed to create role {role.name}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -524,6 +620,14 @@ async def list_roles(
     timestamp: Optional[
         int
     ] = None,  # Make timestamp optional and ensure it's an integer
+    limit: Optional[int] = Query(
+        None, ge=1, le=DYNSEC_MAX_PAGE_SIZE, description="Page size; enables paged JSON output"
+    ),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Return names after this one"),
+    prefix: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Case-insensitive substring match"),
+    sort: SortOrder = SortOrder.ASC,
     api_key: str = Security(get_api_key),
 ):
     """List all clients"""
@@ -531,15 +635,24 @@ async def list_roles(
     logger.info(f"Listing clients. Nonce: {nonce}, Timestamp: {timestamp}")
 
     try:
-        command = ["listRoles"]
-
-        success, result = execute_mosquitto_command(command)
-        if not success:
-            logger.error(f"Failed to list roles: {result}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
-
-        logger.info("Successfully retrieved role list")
-        return {"roles": result}
+        if limit is None and cursor is None and prefix is None and search is None:
+            # Without paging parameters keep the original newline-joined format
+            names = await _list_names("roles", "listRoles")
+            logger.info("Successfully retrieved role list")
+            return {"roles": "\n".join(names)}
+
+        page = await _name_page(
+            "roles",
+            "listRoles",
+            limit,
+            offset=offset,
+            cursor=cursor,
+            prefix=prefix,
+            search=search,
+            descending=sort == SortOrder.DESC,
+        )
+        logger.info(f"Successfully retrieved role page: {len(page['items'])} of {page['total']}")
+        return page
 
     except Exception as e:
         logger.error(f"Unexpected error listing roles: {str(e)}")
@@ -561,10 +674,13 @@ async def get_role(
     logger.info(f"Fetching details for role: {role_name}")
 
     try:
-        command = ["getRole", role_name]
+        if await _state_ready():
+            role = dynsec_state.get_role(role_name)
+        else:
+            success, result = await execute_dynsec_command("getRole", rolename=role_name)
+            role = result["role"] if success else None
 
-        success, result = execute_mosquitto_command(command)
-        if not success:
+        if role is None:
             logger.error(f"Role not found: {role_name}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -572,44 +688,7 @@ async def get_role(
             )
 
         try:
-            lines = result.split("\n")
-            acls = []
-
-            for line in lines:
-                line = line.strip()
-                if "ACLs:" in line or any(
-                    acl_type in line
-                    for acl_type in ["publishClientSend", "subscribeLiteral"]
-                ):
-                    acl_info = (
-                        line.split("ACLs:")[1].strip()
-                        if "ACLs:" in line
-                        else line.strip()
-                    )
-
-                    parts = [p.strip() for p in acl_info.split(":")]
-                    if len(parts) >= 3:
-                        acl_type = parts[0].strip()
-                        permission = parts[1].strip()
-                        topic_and_priority = parts[2].strip()
-
-                        topic = topic_and_priority.split("(")[0].strip()
-                        priority = "0"
-                        if "(priority:" in topic_and_priority:
-                            priority = (
-                                topic_and_priority.split("priority:")[1]
-                                .strip(")")
-                                .strip()
-                            )
-
-                        acls.append(
-                            {
-                                "topic": topic,
-                                "aclType": acl_type,
-                                "permission": permission,
-                                "priority": int(priority),
-                            }
-                        )
+            acls = _role_acls(role)
 
             logger.info(f"Successfully retrieved details for role: {role_name}")
             return {"role": role_name, "acls": acls}
@@ -619,7 +698,7 @@ async def get_role(
             return {
                 "role": role_name,
                 "acls": [],
-                "raw_output": result,
+                "raw_output": json.dumps(role),
                 "error": str(parse_error),
             }
 
@@ -646,9 +725,7 @@ async def add_client_role(
     logger.info(f"Assigning role {role.role_name} to client {username}")
 
     try:
-        command = ["addClientRole", username, role.role_name, "1"]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("addClientRole", username=username, rolename=role.role_name, priority=1)
         if not success:
             logger.error(
                 f"Failed to assign role {role.role_name} to client {username}: {result}"
@@ -681,9 +758,7 @@ async def remove_client_role(
     logger.info(f"Removing role {role_name} from client {username}")
 
     try:
-        command = ["removeClientRole", username, role_name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("removeClientRole", username=username, rolename=role_name)
         if not success:
             logger.error(
                 f"Failed to remove role {role_name} from client {username}: {result}"
@@ -716,9 +791,7 @@ async def add_group_role(
     logger.info(f"Assigning role {role.role_name} to group {group_name}")
 
     try:
-        command = ["addGroupRole", group_name, role.role_name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("addGroupRole", groupname=group_name, rolename=role.role_name)
         if not success:
             logger.error(
                 f"Failed to assign role {role.role_name} to group {group_name}: {result}"
@@ -753,9 +826,7 @@ async def remove_group_role(
     logger.info(f"Removing role {role_name} from group {group_name}")
 
     try:
-        command = ["removeGroupRole", group_name, role_name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("removeGroupRole", groupname=group_name, rolename=role_name)
         if not success:
             logger.error(
                 f"Failed to remove role {role_name} from group {group_name}: {result}"
@@ -787,9 +858,7 @@ async def create_group(
     logger.info(f"Creating new group: {group.name}")
 
     try:
-        command = ["createGroup", group.name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("createGroup", groupname=group.name)
         if not success:
             logger.error(f"Failed to create group {group.name}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -810,6 +879,14 @@ async def create_group(
 @app.get("/api/v1/groups")
 async def list_groups(
     request: Request,
+    limit: Optional[int] = Query(
+        None, ge=1, le=DYNSEC_MAX_PAGE_SIZE, description="Page size; enables paged JSON output"
+    ),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Return names after this one"),
+    prefix: Optional[str] = None,
+    search: Optional[str] = Query(None, description="Case-insensitive substring match"),
+    sort: SortOrder = SortOrder.ASC,
     api_key: str = Security(get_api_key),
 ):
     """List all groups"""
@@ -817,15 +894,24 @@ async def list_groups(
     logger.info("Fetching list of all groups")
 
     try:
-        command = ["listGroups"]
-
-        success, result = execute_mosquitto_command(command)
-        if not success:
-            logger.error(f"Failed to list groups: {result}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
-
-        logger.info("Successfully retrieved group list")
-        return {"groups": result}
+        if limit is None and cursor is None and prefix is None and search is None:
+            # Without paging parameters keep the original newline-joined format
+            names = await _list_names("groups", "listGroups")
+            logger.info("Successfully retrieved group list")
+            return {"groups": "\n".join(names)}
+
+        page = await _name_page(
+            "groups",
+            "listGroups",
+            limit,
+            offset=offset,
+            cursor=cursor,
+            prefix=prefix,
+            search=search,
+            descending=sort == SortOrder.DESC,
+        )
+        logger.info(f"Successfully retrieved group page: {len(page['items'])} of {page['total']}")
+        return page
 
     except Exception as e:
         logger.error(f"Unexpected error listing groups: {str(e)}")
@@ -846,10 +932,13 @@ async def get_group(
     logger.info(f"Fetching details for group: {group_name}")
 
     try:
-        command = ["getGroup", group_name]
+        if await _state_ready():
+            group = dynsec_state.get_group(group_name)
+        else:
+            success, result = await execute_dynsec_command("getGroup", groupname=group_name)
+            group = result["group"] if success else None
 
-        success, result = execute_mosquitto_command(command)
-        if not success:
+        if group is None:
             logger.error(f"Group not found: {group_name}")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -857,36 +946,8 @@ async def get_group(
             )
 
         try:
-            # Parse the output
-            lines = result.split("\n")
-            group_info = {"name": "", "roles": [], "clients": []}
-
-            for line in lines:
-                line = line.strip()
-                if line.startswith("Groupname:"):
-                    group_info["name"] = line.split("Groupname:")[1].strip()
-                elif line.startswith("Roles:"):
-                    role_info = line.split("Roles:")[1].strip()
-                    if role_info:
-                        role_parts = role_info.split("(")
-                        role_name = role_parts[0].strip()
-                        priority = (
-                            role_parts[1].split(")")[0].replace("priority:", "").strip()
-                        )
-                        group_info["roles"].append(
-                            {"name": role_name, "priority": priority}
-                        )
-                elif (
-                    line
-                    and not line.startswith("Groupname:")
-                    and not line.startswith("Roles:")
-                ):
-                    if line.startswith("Clients:"):
-                        client = line.split("Clients:")[1].strip()
-                        if client:
-                            group_info["clients"].append(client)
-                    else:
-                        group_info["clients"].append(line.strip())
+            # Convert the structured response to the API format
+            group_info = _group_info(group)
 
             logger.info(f"Successfully retrieved details for group: {group_name}")
             return {"group": group_info}
@@ -919,9 +980,7 @@ async def delete_group(
     logger.info(f"Deleting group: {group_name}")
 
     try:
-        command = ["deleteGroup", group_name]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("deleteGroup", groupname=group_name)
         if not success:
             logger.error(f"Failed to delete group {group_name}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -962,12 +1021,12 @@ async def add_client_to_group(
     logger.info(f"Adding client {username} to group {group_name}")
 
     try:
-        command = ["addGroupClient", group_name, username]
+        params = {"groupname": group_name, "username": username}
 
         if priority:
-            command.extend(["--priority", str(priority)])
+            params["priority"] = int(priority)
 
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("addGroupClient", **params)
         if not success:
             logger.error(
                 f"Failed to add client {username} to group {group_name}: {result}"
@@ -1001,9 +1060,7 @@ async def remove_client_from_group(
     logger.info(f"Removing client {username} from group {group_name}")
 
     try:
-        command = ["removeGroupClient", group_name, username]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command("removeGroupClient", groupname=group_name, username=username)
         if not success:
             logger.error(
                 f"Failed to remove client {username} from group {group_name}: {result}"
@@ -1054,9 +1111,13 @@ async def add_role_acl(
                 detail="Invalid permission. Must be 'allow' or 'deny'",
             )
 
-        command = ["addRoleACL", role_name, acl.aclType, acl.topic, acl.permission]
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command(
+            "addRoleACL",
+            rolename=role_name,
+            acltype=acl.aclType,
+            topic=acl.topic,
+            allow=acl.permission == "allow",
+        )
         if not success:
             logger.error(f"Failed to add ACL to role {role_name}: {result}")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result)
@@ -1085,8 +1146,7 @@ async def add_role_acl(
 # remove role
 @app.delete("/api/v1/roles/{role_name}")
 async def delete_role(role_name: str, api_key: str = Security(get_api_key)):
-    command = ["deleteRole", role_name]
-    success, result = execute_mosquitto_command(command)
+    success, result = await execute_dynsec_command("deleteRole", rolename=role_name)
     if not success:
         raise HTTPException(status_code=400, detail=result)
     return {"message": f"Role {role_name} deleted successfully"}
@@ -1099,11 +1159,9 @@ async def remove_role_acl(
     try:
         logger.debug(f"Removing ACL from role {role_name}: {acl_type=}, {topic=}")
 
-        command = ["removeRoleACL", role_name, str(acl_type.value), topic]
-
-        logger.debug(f"Executing command: {' '.join(command)}")
-
-        success, result = execute_mosquitto_command(command)
+        success, result = await execute_dynsec_command(
+            "removeRoleACL", rolename=role_name, acltype=acl_type.value, topic=topic
+        )
         if not success:
             logger.error(f"Command failed: {result}")
             raise HTTPException(status_code=400, detail=result)
@@ -1115,6 +1173,171 @@ async def remove_role_acl(
         raise HTTPException(status_code=500, detail=f"Failed to remove ACL: {str(e)}")
 
 
+def _bulk_command(op: BulkOperation) -> Dict[str, Any]:
+    """Build the dynsec command for a bulk operation, raising ValueError if invalid"""
+
+    def require(*fields):
+        missing = [field for field in fields if getattr(op, field) is None]
+        if missing:
+            raise ValueError(f"Missing field(s) for {op.op.value}: {', '.join(missing)}")
+
+    if op.op == BulkOperationType.CREATE_CLIENT:
+        require("username", "password")
+        return {"command": "createClient", "username": op.username, "password": op.password}
+    if op.op == BulkOperationType.SET_PASSWORD:
+        require("username", "password")
+        return {"command": "setClientPassword", "username": op.username, "password": op.password}
+    if op.op == BulkOperationType.ADD_CLIENT_ROLE:
+        require("username", "role_name")
+        return {
+            "command": "addClientRole",
+            "username": op.username,
+            "rolename": op.role_name,
+            "priority": op.priority if op.priority is not None else 1,
+        }
+    if op.op == BulkOperationType.ADD_GROUP_CLIENT:
+        require("username", "group_name")
+        command = {"command": "addGroupClient", "groupname": op.group_name, "username": op.username}
+        if op.priority is not None:
+            command["priority"] = op.priority
+        return command
+    if op.op == BulkOperationType.ADD_ROLE_ACL:
+        require("role_name", "topic", "aclType", "permission")
+        if op.aclType not in ["publishClientSend", "subscribeLiteral"]:
+            raise ValueError("Invalid aclType. Must be 'publishClientSend' or 'subscribeLiteral'")
+        if op.permission not in ["allow", "deny"]:
+            raise ValueError("Invalid permission. Must be 'allow' or 'deny'")
+        return {
+            "command": "addRoleACL",
+            "rolename": op.role_name,
+            "acltype": op.aclType,
+            "topic": op.topic,
+            "allow": op.permission == "allow",
+        }
+    raise ValueError(f"Unsupported operation: {op.op}")
+
+
+def _bulk_undo_command(op: BulkOperation) -> Optional[Dict[str, Any]]:
+    """Command that reverts a successful bulk operation (None if it cannot be undone)"""
+    if op.op == BulkOperationType.CREATE_CLIENT:
+        return {"command": "deleteClient", "username": op.username}
+    if op.op == BulkOperationType.ADD_CLIENT_ROLE:
+        return {"command": "removeClientRole", "username": op.username, "rolename": op.role_name}
+    if op.op == BulkOperationType.ADD_GROUP_CLIENT:
+        return {"command": "removeGroupClient", "groupname": op.group_name, "username": op.username}
+    if op.op == BulkOperationType.ADD_ROLE_ACL:
+        return {
+            "command": "removeRoleACL",
+            "rolename": op.role_name,
+            "acltype": op.aclType,
+            "topic": op.topic,
+        }
+    # A previous password cannot be restored
+    return None
+
+
+# Bulk operations endpoint
+@app.post("/api/v1/bulk")
+async def bulk_operations(
+    bulk: BulkRequest,
+    request: Request,
+    api_key: str = Security(get_api_key),
+):
+    """Apply many client/role/group operations in pipelined dynsec batches.
+
+    Operations run in the given order. Each item gets its own result, and
+    failures are rolled back according to the requested rollback mode.
+    """
+    await log_request(request)
+    logger.info(
+        f"Bulk request with {len(bulk.operations)} operations, rollback={bulk.rollback.value}"
+    )
+
+    try:
+        results = [
+            {"index": i, "op": op.op.value, "success": False, "rolled_back": False}
+            for i, op in enumerate(bulk.operations)
+        ]
+
+        # Validate everything first; invalid items are never sent
+        commands = []
+        command_indexes = []
+        for i, op in enumerate(bulk.operations):
+            try:
+                commands.append(_bulk_command(op))
+                command_indexes.append(i)
+            except ValueError as e:
+                results[i]["error"] = str(e)
+
+        responses = await dynsec_client.execute_pipelined(commands)
+        applied = []
+        for i, command, response in zip(command_indexes, commands, responses):
+            success, result = response_result(response)
+            results[i]["success"] = success
+            if success:
+                applied.append(command)
+            else:
+                results[i]["error"] = result
+        _apply_to_state(applied)
+
+        failed = [r for r in results if not r["success"]]
+
+        # Work out which successful operations to revert
+        to_undo: List[int] = []
+        if failed and bulk.rollback == RollbackMode.ALL:
+            to_undo = [r["index"] for r in results if r["success"]]
+        elif failed and bulk.rollback == RollbackMode.CLIENT:
+            failed_users = {bulk.operations[r["index"]].username for r in failed}
+            to_undo = [
+                r["index"] for r in results
+                if r["success"]
+                and bulk.operations[r["index"]].op == BulkOperationType.CREATE_CLIENT
+                and bulk.operations[r["index"]].username in failed_users
+            ]
+
+        undo_indexes = []
+        undo_commands = []
+        for i in reversed(to_undo):
+            command = _bulk_undo_command(bulk.operations[i])
+            if command is not None:
+                undo_indexes.append(i)
+                undo_commands.append(command)
+
+        if undo_commands:
+            logger.warning(f"Rolling back {len(undo_commands)} bulk operations")
+            undo_responses = await dynsec_client.execute_pipelined(undo_commands)
+            undone = []
+            for i, command, response in zip(undo_indexes, undo_commands, undo_responses):
+                success, result = response_result(response)
+                results[i]["rolled_back"] = success
+                if success:
+                    undone.append(command)
+                else:
+                    results[i]["rollback_error"] = result
+                    logger.error(f"Failed to roll back bulk operation {i}: {result}")
+            _apply_to_state(undone)
+
+        rolled_back = sum(1 for r in results if r["rolled_back"])
+        logger.info(
+            f"Bulk request finished: {len(results) - len(failed)} succeeded, "
+            f"{len(failed)} failed, {rolled_back} rolled back"
+        )
+        return {
+            "total": len(results),
+            "succeeded": len(results) - len(failed),
+            "failed": len(failed),
+            "rolled_back": rolled_back,
+            "results": results,
+        }
+
+    except Exception as e:
+        logger.error(f"Unexpected error processing bulk request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}",
+        )
+
+
 # Add a health check endpoint
 @app.get("/api/v1/health")
 async def health_check(request: Request):
@@ -1124,6 +1347,7 @@ async def health_check(request: Request):
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
+        "blocking_io": blocking_executor.stats(),
     }
 
 
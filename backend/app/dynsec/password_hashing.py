@@ -0,0 +1,101 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/dynsec/password_hashing.py
+import base64
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# PBKDF2 iterations for new password hashes (the dynsec plugin's default is 101)
+DYNSEC_HASH_ITERATIONS = int(os.getenv("DYNSEC_HASH_ITERATIONS", "101"))
+# Processes used to hash passwords in bulk (0 uses one per core)
+DYNSEC_HASH_WORKERS = int(os.getenv("DYNSEC_HASH_WORKERS", "0"))
+# Passwords hashed per task sent to a worker process
+DYNSEC_HASH_BATCH = 500
+
+# Sizes used by the dynsec plugin and mosquitto_passwd
+SALT_LEN = 12
+HASH_LEN = 64
+
+
+def hash_password(password: str, iterations: int = DYNSEC_HASH_ITERATIONS,
+                  salt: Optional[bytes] = None) -> Dict[str, Any]:
+    """PBKDF2-SHA512 hash of a password as the password/salt/iterations fields of a dynsec client"""
+    salt = os.urandom(SALT_LEN) if salt is None else salt
+    digest = hashlib.pbkdf2_hmac("sha512", password.encode("utf-8"), salt, iterations, HASH_LEN)
+    return {
+        "password": base64.b64encode(digest).decode("ascii"),
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "iterations": iterations,
+    }
+
+
+def passwd_hash_fields(password_hash: str) -> Optional[Dict[str, Any]]:
+    """Dynsec password fields for a mosquitto_passwd "$7$" hash, or None for other formats.
+
+    "$7$<iterations>$<salt>$<hash>" is PBKDF2-SHA512 with a base64 salt and
+    hash, the same scheme the dynsec plugin uses, so it carries over as is.
+    """
+    parts = password_hash.split("$")
+    if len(parts) != 5 or parts[1] != "7":
+        return None
+    try:
+        iterations = int(parts[2])
+        if len(base64.b64decode(parts[4], validate=True)) != HASH_LEN:
+            return None
+        base64.b64decode(parts[3], validate=True)
+    except ValueError:
+        return None
+    return {"password": parts[4], "salt": parts[3], "iterations": iterations}
+
+
+def _hash_batch(batch: List[Tuple[Any, str]], iterations: int) -> List[Tuple[Any, Dict[str, Any]]]:
+    return [(key, hash_password(password, iterations)) for key, password in batch]
+
+
+def _batches(items: Iterable[Tuple[Any, str]], size: int) -> Iterator[List[Tuple[Any, str]]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class PasswordHasher:
+    """Hash many passwords in a pool of worker processes.
+
+    hashlib releases the GIL inside PBKDF2, but the encoding and base64
+    work around each hash does not. Worker processes keep all of it out of
+    the API process, which stays responsive, and scale with the number of
+    cores. Passwords are sent in batches of DYNSEC_HASH_BATCH and only a
+    few batches per worker are in flight at a time, so a large input is
+    never held in memory as a whole. Results come back in input order. The
+    pool uses spawn, since forking the threaded API process is unsafe.
+    """
+
+    def __init__(self, workers: int = DYNSEC_HASH_WORKERS, iterations: int = DYNSEC_HASH_ITERATIONS):
+        self.workers = workers or os.cpu_count() or 1
+        self.iterations = iterations
+
+    def hash_many(self, items: Iterable[Tuple[Any, str]]) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """Yield (key, password fields) for each (key, password); the key is passed through"""
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as executor:
+            inflight = deque()
+            for batch in _batches(items, DYNSEC_HASH_BATCH):
+                inflight.append(executor.submit(_hash_batch, batch, self.iterations))
+                if len(inflight) >= 2 * self.workers:
+                    yield from inflight.popleft().result()
+            while inflight:
+                yield from inflight.popleft().result()
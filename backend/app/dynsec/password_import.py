@@ -12,13 +12,20 @@ import re
 import shutil
 import subprocess
 import json
-import random
-import string
-import time
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Security, status
+import tempfile
+import codecs
+import csv
+import io
+import secrets
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Security, status
 from fastapi.security.api_key import APIKeyHeader
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from enum import Enum
+from typing import Optional, Dict, Any, BinaryIO, Iterable, Iterator, List, Tuple
+from blocking_io import run_blocking
+from live_import import COMPLETED, LiveImporter
+from password_hashing import PasswordHasher, passwd_hash_fields
+from reload_manager import RELOAD, RESTART, ReloadManager, mark_restart_required
 
 # Router setup
 router = APIRouter(tags=["password_import"])
@@ -31,6 +38,62 @@ API_KEY = os.getenv("API_KEY")
 MOSQUITTO_PASSWD_PATH = "/etc/mosquitto/mosquitto_passwd"
 DYNSEC_PATH = os.getenv("DYNSEC_PATH", "/var/lib/mosquitto/dynamic-security.json")
 UPLOAD_DIR = "/tmp/mosquitto_uploads"
+IMPORT_REPORT_DIR = os.path.join(UPLOAD_DIR, "reports")
+# Largest mosquitto_passwd upload accepted, in bytes
+PASSWD_UPLOAD_MAX_BYTES = int(os.getenv("PASSWD_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Uploads are read and validated in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Existing clients are re-serialized this many at a time when the dynsec file is rewritten
+DYNSEC_WRITE_CHUNK = 1000
+# Per-user results of this many recent imports are kept for paging
+PASSWD_IMPORT_REPORTS_KEPT = int(os.getenv("PASSWD_IMPORT_REPORTS_KEPT", "10"))
+# Invalid provisioning rows reported individually
+PASSWD_IMPORT_MAX_ERRORS = 100
+# Largest page of per-user import results returned at once
+PASSWD_IMPORT_MAX_DETAILS = int(os.getenv("PASSWD_IMPORT_MAX_DETAILS", "1000"))
+
+# Restarts mosquitto when a change cannot be applied with SIGHUP
+RESTART_SCRIPT = """
+# Kill existing mosquitto process
+pkill mosquitto
+
+# Wait for process to terminate
+sleep 1
+
+# Start mosquitto with config file
+/usr/sbin/mosquitto -c /etc/mosquitto/mosquitto.conf -d
+
+# Check if mosquitto started successfully
+sleep 2
+if pgrep mosquitto > /dev/null; then
+    echo "Mosquitto restarted successfully"
+    exit 0
+else
+    echo "Failed to restart Mosquitto"
+    exit 1
+fi
+"""
+
+# Set by main once the dynsec control client exists
+live_importer: Optional[LiveImporter] = None
+
+class ImportMode(str, Enum):
+    FILE = "file"  # Rewrite dynamic-security.json; takes effect after a broker restart
+    LIVE = "live"  # Create the clients on the running broker through dynsec commands
+
+def set_live_importer(importer: LiveImporter):
+    global live_importer
+    live_importer = importer
+
+def _restart_broker() -> Tuple[bool, str]:
+    try:
+        result = subprocess.run(["/bin/bash", "-c", RESTART_SCRIPT], capture_output=True, text=True, timeout=10)
+    except subprocess.TimeoutExpired:
+        return False, "Timeout while restarting Mosquitto"
+    logger.info(f"Restart output: {result.stdout}")
+    return result.returncode == 0, (result.stdout if result.returncode == 0 else result.stderr).strip()
+
+reload_manager = ReloadManager(restart=_restart_broker)
 
 # Security
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=True)
@@ -46,128 +109,449 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         )
     return api_key_header
 
-def validate_mosquitto_passwd_file(file_path: str) -> tuple[bool, str, list]:
+PASSWD_LINE_PATTERN = re.compile(r'^[^:]+:\$\d+\$[^:]+$')
+
+def iter_passwd_file(file_path: str) -> Iterator[Tuple[int, str, str, bool]]:
     """
-    Validates if a file has the correct mosquitto_passwd format.
-    Returns (success, message, users)
+    Stream (line number, username, password hash, valid) for each non-blank line of a
+    mosquitto_passwd file. Only one line is held in memory at a time.
     """
-    users = []
-    try:
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            
-        if not lines:
-            return False, "File is empty", []
-            
-        valid_pattern = re.compile(r'^[^:]+:\$\d+\$[^:]+$')
-        
-        for i, line in enumerate(lines):
+    with open(file_path, 'r', errors='replace') as f:
+        for line_no, line in enumerate(f, 1):
             line = line.strip()
             if not line:
                 continue
-                
-            if not valid_pattern.match(line):
-                return False, f"Invalid format at line {i+1}: {line}", []
-                
-            username = line.split(':')[0]
-            users.append(username)
-            
-        return True, f"Valid mosquitto_passwd file with {len(users)} users", users
-    except Exception as e:
-        logger.error(f"Error validating mosquitto_passwd file: {str(e)}")
-        return False, f"Error reading file: {str(e)}", []
+            username, _, password_hash = line.partition(':')
+            yield line_no, username, password_hash, bool(PASSWD_LINE_PATTERN.match(line))
+
+class UploadTooLarge(ValueError):
+    pass
+
+def receive_passwd_upload(upload: BinaryIO, file_path: str) -> tuple[bool, str, int]:
+    """
+    Copy an uploaded mosquitto_passwd file to file_path in chunks, validating each
+    line as it arrives. Stops at the first invalid line. Memory use does not depend
+    on the size of the file. Raises UploadTooLarge past PASSWD_UPLOAD_MAX_BYTES.
+    Returns (success, message, user_count)
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    partial = ''
+    line_no = 0
+    count = 0
+    size = 0
+    with open(file_path, 'wb') as out:
+        while True:
+            chunk = upload.read(UPLOAD_CHUNK_SIZE)
+            size += len(chunk)
+            if size > PASSWD_UPLOAD_MAX_BYTES:
+                raise UploadTooLarge(f"File is larger than {PASSWD_UPLOAD_MAX_BYTES} bytes")
+            out.write(chunk)
+            lines = (partial + decoder.decode(chunk, final=not chunk)).split('\n')
+            # The last piece may be cut off by the chunk boundary
+            partial = lines.pop() if chunk else ''
+            for line in lines:
+                line_no += 1
+                line = line.strip()
+                if not line:
+                    continue
+                if not PASSWD_LINE_PATTERN.match(line):
+                    return False, f"Invalid format at line {line_no}: {line.split(':', 1)[0]}:...", 0
+                count += 1
+            if not chunk:
+                break
+
+    if not count:
+        return False, "File is empty", 0
+
+    return True, f"Valid mosquitto_passwd file with {count} users", count
 
 def generate_random_salt(length=16):
     """Generate a random salt for dynamic security users"""
-    return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
+    return os.urandom(length).hex()[:length]
+
+def _write_atomic(path: str, write):
+    """
+    Write a file through write(f) into a temporary file next to it, fsync it and rename
+    it over the original, so readers only ever see the old or the complete new file
+    """
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', buffering=1 << 20) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            st = os.stat(path)
+            os.chmod(temp_path, st.st_mode & 0o7777)
+            try:
+                os.chown(temp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _write_dynsec_file(dynsec_data: Dict[str, Any], clients: List[Dict[str, Any]], new_entries: Iterable[str]):
+    """
+    Atomically rewrite the dynsec file with `clients` followed by new client entries given
+    as serialized JSON objects. The file is written compactly, with the existing entries
+    re-serialized in chunks rather than as one document.
+    """
+    def write(f):
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        f.write('{')
+        keys = list(dynsec_data)
+        if 'clients' not in dynsec_data:
+            keys.append('clients')
+        for i, key in enumerate(keys):
+            if i:
+                f.write(',')
+            f.write(dumps(key))
+            f.write(':')
+            if key != 'clients':
+                f.write(dumps(dynsec_data[key]))
+                continue
+            f.write('[')
+            separator = ''
+            for start in range(0, len(clients), DYNSEC_WRITE_CHUNK):
+                f.write(separator)
+                f.write(dumps(clients[start:start + DYNSEC_WRITE_CHUNK])[1:-1])
+                separator = ','
+            for entry in new_entries:
+                f.write(separator)
+                f.write(entry)
+                separator = ','
+            f.write(']')
+        f.write('}')
+
+    _write_atomic(DYNSEC_PATH, write)
 
-def update_dynsec_with_passwd_users(usernames: List[str]) -> tuple[bool, str, int]:
+def _backup_dynsec_file(timestamp: str) -> str:
     """
-    Update dynamic-security.json file with users from mosquitto_passwd
+    Keep the current dynsec file as a backup. The new file is renamed into place,
+    so a hard link to the old inode is a complete backup without copying it.
     """
+    backup_path = f"{DYNSEC_PATH}.bak.{timestamp}"
+    try:
+        os.link(DYNSEC_PATH, backup_path)
+    except OSError:
+        shutil.copy2(DYNSEC_PATH, backup_path)
+    logger.info(f"Created backup of dynamic security file at {backup_path}")
+    return backup_path
+
+def _report_path(import_id: str) -> str:
+    return os.path.join(IMPORT_REPORT_DIR, f"{import_id}.jsonl")
+
+def _prune_reports():
+    reports = sorted(
+        (entry for entry in os.scandir(IMPORT_REPORT_DIR) if entry.name.endswith(".jsonl")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in reports[:-PASSWD_IMPORT_REPORTS_KEPT or None]:
+        os.remove(entry.path)
+
+def read_import_details(import_id: str, offset: int = 0, limit: int = 100) -> Optional[Dict[str, Any]]:
+    """
+    One page of the per-user results of an import, streamed from its report file.
+    Returns None if the report does not exist (or was pruned).
+    """
+    if not re.fullmatch(r'[0-9a-f]{16}', import_id):
+        return None
+    path = _report_path(import_id)
+    if not os.path.exists(path):
+        return None
+    limit = max(0, min(limit, PASSWD_IMPORT_MAX_DETAILS))
+    details = []
+    total = 0
+    with open(path, 'r') as f:
+        for total, line in enumerate(f, 1):
+            if offset < total <= offset + limit:
+                details.append(json.loads(line))
+    return {"import_id": import_id, "offset": offset, "limit": limit, "total": total, "details": details}
+
+def update_dynsec_with_passwd_users(
+    passwd_path: str = MOSQUITTO_PASSWD_PATH,
+    import_id: Optional[str] = None
+) -> tuple[bool, str, Dict[str, Any]]:
+    """
+    Add the users of a mosquitto_passwd file to dynamic-security.json.
+
+    The passwd file is streamed and each username is checked against an index of the
+    existing usernames. New clients take over "$7$" (PBKDF2-SHA512) hashes; other hash
+    formats cannot be converted, so those clients get no password. The file is then
+    rewritten with _write_dynsec_file.
+    When an import_id is given, one JSON line per user is written to its report file
+    for paging through the details later. Returns (success, message, summary).
+    """
+    summary = {"total": 0, "added": 0, "existing": 0, "duplicates": 0, "invalid": 0, "sample": []}
     try:
         # Check if dynsec file exists
         if not os.path.exists(DYNSEC_PATH):
-            return False, f"Dynamic security file not found at {DYNSEC_PATH}", 0
-            
+            return False, f"Dynamic security file not found at {DYNSEC_PATH}", summary
+
         # Read the current dynsec file
         with open(DYNSEC_PATH, 'r') as f:
             dynsec_data = json.load(f)
-            
-        # Initialize clients array if it doesn't exist
-        if 'clients' not in dynsec_data:
-            dynsec_data['clients'] = []
-            
-        # Get the current list of clients
-        current_clients = dynsec_data.get('clients', [])
-        current_usernames = {client.get('username') for client in current_clients}
-        
-        # Track added users
-        added_users = []
-        
-        # For each username from passwd file, add to dynsec if not exists
-        for username in usernames:
-            if username not in current_usernames:
-                # Create a new client entry without password
-                # Following the exact format seen in after.json
-                new_client = {
-                    "username": username,
-                    "roles": [],  # Always include an empty roles array
-                    "salt": generate_random_salt(),
-                    "iterations": 101
-                }
-                
-                # Add to clients list
-                current_clients.append(new_client)
-                current_usernames.add(username)
-                added_users.append(username)
-                
+
+        current_clients = dynsec_data.get('clients') or []
+        existing = {client.get('username') for client in current_clients}
+        seen = set()
+        new_clients = []
+
+        report = None
+        if import_id:
+            os.makedirs(IMPORT_REPORT_DIR, exist_ok=True)
+            report = open(_report_path(import_id), 'w')
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+        try:
+            for line_no, username, password_hash, valid in iter_passwd_file(passwd_path):
+                summary["total"] += 1
+                if not valid:
+                    summary["invalid"] += 1
+                    outcome, message = "FAILED", f"Invalid format at line {line_no}"
+                elif username in seen:
+                    summary["duplicates"] += 1
+                    outcome, message = "SKIPPED", f"Duplicate entry at line {line_no}"
+                else:
+                    seen.add(username)
+                    if len(summary["sample"]) < 10:
+                        summary["sample"].append(username)
+                    if username in existing:
+                        summary["existing"] += 1
+                        outcome, message = "SUCCESS", "User imported, already in dynamic security"
+                    else:
+                        summary["added"] += 1
+                        new_clients.append((username, password_hash))
+                        outcome, message = "SUCCESS", "User imported and added to dynamic security"
+                if report is not None:
+                    report.write(dumps({"username": username, "status": outcome, "message": message}))
+                    report.write('\n')
+        finally:
+            if report is not None:
+                report.close()
+                _prune_reports()
+
         # Only update the file if changes were made
-        if added_users:
-            # Make sure we maintain the exact structure of the file
-            dynsec_data['clients'] = current_clients
-            
-            # Create a backup of the dynsec file
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = f"{DYNSEC_PATH}.bak.{timestamp}"
-            shutil.copy2(DYNSEC_PATH, backup_path)
-            logger.info(f"Created backup of dynamic security file at {backup_path}")
-            
-            # Write the updated dynsec file
-            with open(DYNSEC_PATH, 'w') as f:
-                json.dump(dynsec_data, f, indent="\t")
-                
-            logger.info(f"Updated dynamic security file with {len(added_users)} users: {', '.join(added_users)}")
-            return True, f"Added {len(added_users)} users to dynamic security", len(added_users)
-        else:
-            return True, "No new users to add to dynamic security", 0
-            
+        if not new_clients:
+            return True, "No new users to add to dynamic security", summary
+
+        def new_entries():
+            dumps = json.JSONEncoder(separators=(',', ':')).encode
+            for username, password_hash in new_clients:
+                # "$7$" hashes are PBKDF2-SHA512 like dynsec's and carry over as they are
+                fields = passwd_hash_fields(password_hash)
+                if fields is None:
+                    # A new client entry without password
+                    fields = {"salt": generate_random_salt(), "iterations": 101}
+                yield dumps({"username": username, "roles": [], **fields})
+
+        _backup_dynsec_file(datetime.now().strftime("%Y%m%d_%H%M%S"))
+        _write_dynsec_file(dynsec_data, current_clients, new_entries())
+        mark_restart_required(f"Added {summary['added']} passwd users to {DYNSEC_PATH}")
+
+        logger.info(f"Updated dynamic security file with {summary['added']} users")
+        return True, f"Added {summary['added']} users to dynamic security", summary
+
     except Exception as e:
         logger.error(f"Error updating dynamic security with passwd users: {str(e)}")
-        return False, f"Error updating dynamic security: {str(e)}", 0
+        return False, f"Error updating dynamic security: {str(e)}", summary
+
+def _read_provisioning_csv(upload: BinaryIO, summary: Dict[str, Any], skip: set) -> Iterator[Tuple[tuple, str]]:
+    """
+    Stream ((username, textname, clientid), password) from a provisioning CSV with rows
+    "username,password[,textname[,clientid]]" and an optional header row. Invalid and
+    duplicate rows and usernames in `skip` are counted in summary and left out.
+    """
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    try:
+        seen = set()
+        for row_no, row in enumerate(csv.reader(text), 1):
+            if not row or not any(field.strip() for field in row):
+                continue
+            if row_no == 1 and [field.strip().lower() for field in row[:2]] == ['username', 'password']:
+                continue
+            summary["total"] += 1
+            username = row[0].strip()
+            password = row[1] if len(row) > 1 else ''
+            if not username or not password or ':' in username:
+                summary["invalid"] += 1
+                if len(summary["errors"]) < PASSWD_IMPORT_MAX_ERRORS:
+                    summary["errors"].append({"row": row_no, "error": "A username and password are required"})
+                continue
+            if username in seen:
+                summary["duplicates"] += 1
+                continue
+            seen.add(username)
+            if username in skip:
+                summary["existing"] += 1
+                continue
+            textname = row[2].strip() if len(row) > 2 else ''
+            clientid = row[3].strip() if len(row) > 3 else ''
+            yield (username, textname, clientid), password
+    finally:
+        # Leave the upload open for its owner
+        text.detach()
+
+def provision_dynsec_clients(
+    upload: BinaryIO,
+    rolename: Optional[str] = None,
+    update_existing: bool = False,
+    hasher: Optional[PasswordHasher] = None
+) -> tuple[bool, str, Dict[str, Any]]:
+    """
+    Create complete dynsec client records, password hashes included, from a CSV upload.
+
+    Passwords are hashed with PBKDF2-SHA512 in a pool of worker processes instead of
+    one by one by the broker. New records are spooled to a temporary file as the hashes
+    come back and appended to the dynsec file by _write_dynsec_file; with update_existing,
+    existing clients get the new password hash in place. Returns (success, message, summary).
+    """
+    summary = {"total": 0, "created": 0, "updated": 0, "existing": 0, "duplicates": 0,
+               "invalid": 0, "errors": []}
+    try:
+        if not os.path.exists(DYNSEC_PATH):
+            return False, f"Dynamic security file not found at {DYNSEC_PATH}", summary
+
+        with open(DYNSEC_PATH, 'r') as f:
+            dynsec_data = json.load(f)
+
+        if rolename and not any(role.get('rolename') == rolename for role in dynsec_data.get('roles') or []):
+            return False, f"Role {rolename} does not exist", summary
+
+        current_clients = dynsec_data.get('clients') or []
+        existing = {client.get('username') for client in current_clients}
+        roles = [{"rolename": rolename}] if rolename else []
+        hasher = hasher or PasswordHasher()
+        updates: Dict[str, Dict[str, Any]] = {}
+
+        dumps = json.JSONEncoder(separators=(',', ':')).encode
+        rows = _read_provisioning_csv(upload, summary, set() if update_existing else existing)
+        with tempfile.TemporaryFile('w+') as spool:
+            for (username, textname, clientid), fields in hasher.hash_many(rows):
+                if username in existing:
+                    updates[username] = fields
+                    summary["updated"] += 1
+                    continue
+                record = {"username": username}
+                if textname:
+                    record["textname"] = textname
+                if clientid:
+                    record["clientid"] = clientid
+                record.update(fields)
+                record["roles"] = roles
+                spool.write(dumps(record))
+                spool.write('\n')
+                summary["created"] += 1
+
+            if not summary["created"] and not updates:
+                return True, "No clients to provision", summary
+
+            if updates:
+                current_clients = [
+                    {**client, **updates[client.get('username')]} if client.get('username') in updates else client
+                    for client in current_clients
+                ]
+            spool.seek(0)
+            _backup_dynsec_file(datetime.now().strftime("%Y%m%d_%H%M%S"))
+            _write_dynsec_file(dynsec_data, current_clients, (line.rstrip('\n') for line in spool))
+            mark_restart_required(f"Provisioned clients in {DYNSEC_PATH}")
+
+        message = f"Provisioned {summary['created']} new clients"
+        if summary["updated"]:
+            message += f" and updated {summary['updated']} passwords"
+        logger.info(message)
+        return True, message, summary
+
+    except Exception as e:
+        logger.error(f"Error provisioning dynsec clients: {str(e)}")
+        return False, f"Error provisioning clients: {str(e)}", summary
+
+def _dynsec_usernames() -> set:
+    """Usernames in the dynsec file, or an empty set if it cannot be read"""
+    try:
+        with open(DYNSEC_PATH, 'r') as f:
+            return {client.get('username') for client in json.load(f).get('clients') or []}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not index existing dynsec clients: {str(e)}")
+        return set()
+
+def _pending_usernames(passwd_path: str) -> Iterator[str]:
+    """Valid usernames of a passwd file that are not dynsec clients yet, without duplicates"""
+    seen = _dynsec_usernames()
+    for _, username, _, valid in iter_passwd_file(passwd_path):
+        if valid and username not in seen:
+            seen.add(username)
+            yield username
+
+def _require_live_importer() -> LiveImporter:
+    if live_importer is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Live import is not available"
+        )
+    return live_importer
+
+async def _start_live_import(passwd_path: str) -> Dict[str, Any]:
+    importer = _require_live_importer()
+    job = await run_blocking(importer.create, _pending_usernames(passwd_path))
+    importer.start(job)
+    logger.info(f"Started live import {job.id} of {job.total} clients")
+    return job.to_dict()
+
+def _install_passwd_file(temp_file_path: str, timestamp: str):
+    """Back up the current password file and replace it with the uploaded one"""
+    if os.path.exists(MOSQUITTO_PASSWD_PATH):
+        backup_path = f"{MOSQUITTO_PASSWD_PATH}.bak.{timestamp}"
+        shutil.copy2(MOSQUITTO_PASSWD_PATH, backup_path)
+        logger.info(f"Created backup of existing password file at {backup_path}")
+
+    # Import the file to the destination
+    shutil.copy2(temp_file_path, MOSQUITTO_PASSWD_PATH)
+
+    # Ensure proper permissions - using 644 to match your Dockerfile configuration
+    # This allows owner read/write and everyone else read access
+    os.chmod(MOSQUITTO_PASSWD_PATH, 0o644)
 
 @router.post("/import-password-file")
 async def import_password_file(
     file: UploadFile = File(...),
+    details_limit: int = Query(100, ge=0, description="Per-user results to include; page the rest via the details endpoint"),
+    mode: ImportMode = Query(ImportMode.FILE, description="How new users are added to dynamic security"),
     api_key: str = Security(get_api_key)
 ):
     """
     Import a mosquitto_passwd file and update dynamic security
     """
+    if mode == ImportMode.LIVE:
+        _require_live_importer()
     logger.info(f"Password file import requested: {file.filename}")
     
     # Create a unique filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     temp_file_path = os.path.join(UPLOAD_DIR, f"{timestamp}_{file.filename}")
+    import_id = secrets.token_hex(8)
     
     try:
-        # Save uploaded file to temporary location
-        with open(temp_file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Validate the file
-        is_valid, message, users = validate_mosquitto_passwd_file(temp_file_path)
+        # Save uploaded file to temporary location, validating it on the way
+        try:
+            is_valid, message, user_count = await run_blocking(
+                receive_passwd_upload, file.file, temp_file_path
+            )
+        except UploadTooLarge as e:
+            logger.warning(f"Password file upload {file.filename} is too large")
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
         
         if not is_valid:
             logger.warning(f"Invalid mosquitto_passwd file: {message}")
@@ -183,55 +567,66 @@ async def import_password_file(
                 }
             }
         
-        # Backup existing file if it exists
-        if os.path.exists(MOSQUITTO_PASSWD_PATH):
-            backup_path = f"{MOSQUITTO_PASSWD_PATH}.bak.{timestamp}"
-            shutil.copy2(MOSQUITTO_PASSWD_PATH, backup_path)
-            logger.info(f"Created backup of existing password file at {backup_path}")
-        
-        # Import the file to the destination
-        shutil.copy2(temp_file_path, MOSQUITTO_PASSWD_PATH)
-        
-        # Ensure proper permissions - using 644 to match your Dockerfile configuration
-        # This allows owner read/write and everyone else read access
-        os.chmod(MOSQUITTO_PASSWD_PATH, 0o644)
+        # Backup the existing file and install the new one
+        await run_blocking(_install_passwd_file, temp_file_path, timestamp)
+
+        if mode == ImportMode.LIVE:
+            # Clients are created in the background; progress is under /password-import-jobs
+            job = await _start_live_import(MOSQUITTO_PASSWD_PATH)
+            # The new password_file only needs a SIGHUP, so clients stay connected
+            reload_manager.request(f"Imported password file {file.filename}")
+            return {
+                "success": True,
+                "message": f"Imported password file with {user_count} users, "
+                           f"creating {job['total']} new clients on the running broker",
+                "need_restart": False,
+                "results": {
+                    "total": user_count,
+                    "imported": user_count,
+                    "skipped": 0,
+                    "failed": 0,
+                    "details": [],
+                    "dynsec_job": job
+                }
+            }
         
         # Update dynamic security with users from the password file
-        dynsec_success, dynsec_message, dynsec_count = update_dynsec_with_passwd_users(users)
-        
-        # Create results for the frontend
-        details = []
-        for username in users:
-            details.append({
-                "username": username,
-                "status": "SUCCESS",
-                "message": "User imported successfully"
-            })
+        dynsec_success, dynsec_message, summary = await run_blocking(
+            update_dynsec_with_passwd_users, MOSQUITTO_PASSWD_PATH, import_id
+        )
         
         # If dynsec update failed, add a warning message
-        result_message = f"Successfully imported password file with {len(users)} users"
+        imported = summary["total"] - summary["duplicates"]
+        result_message = f"Successfully imported password file with {imported} users"
         if dynsec_success:
-            if dynsec_count > 0:
-                result_message += f" and added {dynsec_count} users to dynamic security"
+            if summary["added"] > 0:
+                result_message += f" and added {summary['added']} users to dynamic security"
         else:
             result_message += f" but failed to update dynamic security: {dynsec_message}"
             
         logger.info(result_message)
+
+        page = await run_blocking(read_import_details, import_id, 0, details_limit)
         
         return {
             "success": True, 
             "message": result_message,
             "results": {
-                "total": len(users),
-                "imported": len(users),
-                "skipped": 0,
-                "failed": 0,
-                "details": details,
+                "import_id": import_id,
+                "total": summary["total"],
+                "imported": imported,
+                "skipped": summary["duplicates"],
+                "failed": summary["invalid"],
+                "details": page["details"] if page else [],
+                "details_total": page["total"] if page else 0,
                 "dynsec_updated": dynsec_success,
-                "dynsec_added": dynsec_count
+                "dynsec_added": summary["added"],
+                "dynsec_existing": summary["existing"]
             }
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error importing password file: {str(e)}")
         raise HTTPException(
@@ -243,8 +638,27 @@ async def import_password_file(
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
 
+@router.get("/import-password-file/{import_id}/details")
+async def get_import_details(
+    import_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    api_key: str = Security(get_api_key)
+):
+    """
+    Page through the per-user results of a password file import
+    """
+    page = await run_blocking(read_import_details, import_id, offset, limit)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No results for import {import_id}"
+        )
+    return page
+
 @router.post("/sync-passwd-to-dynsec")
 async def sync_passwd_to_dynsec(
+    mode: ImportMode = Query(ImportMode.FILE, description="How new users are added to dynamic security"),
     api_key: str = Security(get_api_key)
 ):
     """
@@ -259,31 +673,33 @@ async def sync_passwd_to_dynsec(
                 "success": False,
                 "message": "Password file not found"
             }
-            
-        # Extract users from the password file
-        users = []
-        with open(MOSQUITTO_PASSWD_PATH, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and ':' in line:
-                    username = line.split(':')[0]
-                    users.append(username)
+
+        if mode == ImportMode.LIVE:
+            job = await _start_live_import(MOSQUITTO_PASSWD_PATH)
+            return {
+                "success": True,
+                "message": f"Creating {job['total']} new clients on the running broker",
+                "job": job
+            }
                     
-        if not users:
+        # Update dynamic security with the users of the password file
+        success, message, summary = await run_blocking(update_dynsec_with_passwd_users)
+
+        if success and not summary["total"]:
             return {
                 "success": True,
                 "message": "No users found in password file to sync"
             }
-                    
-        # Update dynamic security with these users
-        success, message, count = update_dynsec_with_passwd_users(users)
         
         if success:
+            users = summary["sample"]
+            unique = summary["total"] - summary["duplicates"]
             return {
                 "success": True,
                 "message": message,
-                "count": count,
-                "users": users[:10] + (["..."] if len(users) > 10 else [])  # Show first 10 users
+                "count": summary["added"],
+                "summary": {key: value for key, value in summary.items() if key != "sample"},
+                "users": users + (["..."] if unique > len(users) else [])  # Show first 10 users
             }
         else:
             return {
@@ -291,6 +707,8 @@ async def sync_passwd_to_dynsec(
                 "message": message
             }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error syncing passwd to dynsec: {str(e)}")
         raise HTTPException(
@@ -298,75 +716,118 @@ async def sync_passwd_to_dynsec(
             detail=f"Failed to sync password file to dynamic security: {str(e)}"
         )
 
-@router.post("/restart-mosquitto")
-async def restart_mosquitto(
+@router.post("/provision-clients")
+async def provision_clients(
+    file: UploadFile = File(...),
+    rolename: Optional[str] = Query(None, description="Role given to every new client"),
+    update_existing: bool = Query(False, description="Set the password of clients that already exist"),
     api_key: str = Security(get_api_key)
 ):
     """
-    Restart the Mosquitto broker service
+    Bulk-create dynsec clients with passwords from a CSV file of
+    username,password[,textname[,clientid]] rows. The hashes are computed here
+    in parallel and written to the dynamic security file; restart the broker to load them.
     """
+    logger.info(f"Client provisioning requested: {file.filename}")
     try:
-        logger.info("Restart Mosquitto broker requested")
-        
-        # Execute restart command
-        restart_script = """#!/bin/bash
-# Kill existing mosquitto process
-pkill mosquitto
+        upload = file.file
+        upload.seek(0, os.SEEK_END)
+        size = upload.tell()
+        upload.seek(0)
+        if size > PASSWD_UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File is larger than {PASSWD_UPLOAD_MAX_BYTES} bytes"
+            )
 
-# Wait for process to terminate
-sleep 1
+        success, message, summary = await run_blocking(
+            provision_dynsec_clients, upload, rolename, update_existing
+        )
+        return {
+            "success": success,
+            "message": message,
+            "results": summary,
+            "need_restart": success and bool(summary["created"] or summary["updated"])
+        }
 
-# Start mosquitto with config file
-/usr/sbin/mosquitto -c /etc/mosquitto/mosquitto.conf -d
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error provisioning clients: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to provision clients: {str(e)}"
+        )
+
+@router.get("/password-import-jobs")
+async def list_password_import_jobs(api_key: str = Security(get_api_key)):
+    """
+    List live import jobs, newest first
+    """
+    importer = _require_live_importer()
+    jobs = sorted(importer.jobs.values(), key=lambda job: job.created_at, reverse=True)
+    return {"jobs": [job.to_dict() for job in jobs]}
+
+def _get_job(job_id: str):
+    job = _require_live_importer().jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Import job {job_id} not found"
+        )
+    return job
+
+@router.get("/password-import-jobs/{job_id}")
+async def get_password_import_job(job_id: str, api_key: str = Security(get_api_key)):
+    """
+    Progress of a live import job
+    """
+    return _get_job(job_id).to_dict()
+
+@router.post("/password-import-jobs/{job_id}/pause")
+async def pause_password_import_job(job_id: str, api_key: str = Security(get_api_key)):
+    """
+    Pause a live import job after the commands already in flight
+    """
+    job = _get_job(job_id)
+    live_importer.pause(job)
+    return job.to_dict()
+
+@router.post("/password-import-jobs/{job_id}/resume")
+async def resume_password_import_job(job_id: str, api_key: str = Security(get_api_key)):
+    """
+    Resume a paused or interrupted live import job from its last checkpoint
+    """
+    job = _get_job(job_id)
+    if job.state == COMPLETED:
+        return job.to_dict()
+    live_importer.start(job)
+    return job.to_dict()
+
+@router.post("/restart-mosquitto")
+async def restart_mosquitto(
+    api_key: str = Security(get_api_key)
+):
+    """
+    Apply pending broker configuration changes: a SIGHUP when mosquitto can
+    reload them, a restart only when a change requires one
+    """
+    try:
+        logger.info("Mosquitto reload requested")
+        result = await reload_manager.request_async("Requested via API", RELOAD)
+        if result["success"]:
+            verb = "restarted" if result["action"] == RESTART else "reloaded"
+            return {
+                "success": True,
+                "action": result["action"],
+                "message": f"Mosquitto broker {verb} successfully"
+            }
+        return {
+            "success": False,
+            "action": result["action"],
+            "message": f"Failed to {result['action'] or 'reload'} Mosquitto: {result['message']}"
+        }
 
-# Check if mosquitto started successfully
-sleep 2
-if pgrep mosquitto > /dev/null; then
-    echo "Mosquitto restarted successfully"
-    exit 0
-else
-    echo "Failed to restart Mosquitto"
-    exit 1
-fi
-"""
-        
-        # Write script to temp file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        script_path = os.path.join(UPLOAD_DIR, f"restart_script_{timestamp}.sh")
-        with open(script_path, "w") as f:
-            f.write(restart_script)
-        
-        # Make executable
-        os.chmod(script_path, 0o755)
-        
-        # Execute script
-        try:
-            result = subprocess.run(
-                ["/bin/bash", script_path],
-                check=True,
-                capture_output=True,
-                text=True,
-                timeout=10  # Set a timeout for the restart process
-            )
-            logger.info(f"Restart output: {result.stdout}")
-            
-            if result.returncode == 0:
-                return {"success": True, "message": "Mosquitto broker restarted successfully"}
-            else:
-                logger.error(f"Restart stderr: {result.stderr}")
-                return {"success": False, "message": f"Failed to restart Mosquitto: {result.stderr}"}
-                
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Restart failed: {e.stderr}")
-            return {"success": False, "message": f"Failed to restart Mosquitto: {e.stderr}"}
-        except subprocess.TimeoutExpired:
-            logger.error("Restart timeout expired")
-            return {"success": False, "message": "Timeout while restarting Mosquitto"}
-        finally:
-            # Clean up script
-            if os.path.exists(script_path):
-                os.remove(script_path)
-    
     except Exception as e:
         logger.error(f"Error restarting Mosquitto: {str(e)}")
         raise HTTPException(
@@ -374,6 +835,10 @@ fi
             detail=f"Failed to restart Mosquitto: {str(e)}"
         )
 
+def _count_passwd_lines() -> int:
+    with open(MOSQUITTO_PASSWD_PATH, 'r') as f:
+        return sum(1 for line in f if line.strip())
+
 @router.get("/password-file-status")
 async def check_password_file_status(api_key: str = Security(get_api_key)):
     """
@@ -394,10 +859,7 @@ async def check_password_file_status(api_key: str = Security(get_api_key)):
         # Count users in the file
         user_count = 0
         try:
-            with open(MOSQUITTO_PASSWD_PATH, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        user_count += 1
+            user_count = await run_blocking(_count_passwd_lines)
         except Exception as e:
             logger.warning(f"Error reading password file: {str(e)}")
                 
@@ -0,0 +1,334 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/dynsec/reload_manager.py
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Main broker configuration file
+MOSQUITTO_MAIN_CONF = os.getenv("MOSQUITTO_MAIN_CONF", "/etc/mosquitto/mosquitto.conf")
+# Seconds config changes are collected before the broker is reloaded or restarted
+MOSQUITTO_RELOAD_WINDOW = float(os.getenv("MOSQUITTO_RELOAD_WINDOW", "2"))
+# Command used when a change cannot be applied with SIGHUP
+MOSQUITTO_RESTART_COMMAND = os.getenv("MOSQUITTO_RESTART_COMMAND", "rc-service mosquitto restart")
+# Flag file through which any service can ask for the next apply to be a restart
+MOSQUITTO_RESTART_MARKER = os.getenv("MOSQUITTO_RESTART_MARKER", "/tmp/mosquitto_restart_required")
+# Snapshot of the configuration the broker last applied, shared by every service's manager
+MOSQUITTO_APPLIED_CONFIG = os.getenv("MOSQUITTO_APPLIED_CONFIG", "/tmp/mosquitto_applied_config.json")
+
+RELOAD = "reload"
+RESTART = "restart"
+_ACTION_ORDER = {None: 0, RELOAD: 1, RESTART: 2}
+
+# Options mosquitto does not re-read on SIGHUP (mosquitto.conf(5)); changing one needs a restart
+RESTART_OPTIONS = frozenset({
+    "auth_plugin", "autosave_interval", "autosave_on_changes", "global_plugin", "include_dir",
+    "persistence", "persistence_file", "persistence_location", "pid_file", "plugin",
+    "user", "websockets_log_level",
+})
+# Options that belong to the listener they follow; any change to a listener needs a restart
+LISTENER_OPTIONS = frozenset({
+    "bind_interface", "cafile", "capath", "certfile", "ciphers", "ciphers_tls1.3", "crlfile",
+    "dhparamfile", "http_dir", "keyfile", "max_connections", "max_qos", "max_topic_alias",
+    "mount_point", "protocol", "psk_hint", "require_certificate", "socket_domain", "tls_engine",
+    "tls_engine_kpass_sha1", "tls_keyform", "tls_version", "use_identity_as_username",
+    "use_subject_as_username", "use_username_as_clientid",
+})
+# Files mosquitto re-reads on SIGHUP; a change to their contents needs a reload
+RELOAD_FILE_OPTIONS = ("password_file", "acl_file", "psk_file")
+
+
+def _file_signature(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # A list, so it compares equal after a round trip through JSON
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _parse_file(path: str, snapshot: Dict[str, Any], section: List[Optional[str]]):
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, _, value = line.partition(" ")
+        value = value.strip()
+        if key == "listener":
+            section[0] = f"listener {value}"
+            snapshot["listeners"].setdefault(section[0], [])
+        elif key == "connection":
+            section[0] = f"connection {value}"
+            snapshot["bridges"].setdefault(section[0], [])
+        elif section[0] and section[0].startswith("connection "):
+            # Everything after "connection" configures that bridge
+            snapshot["bridges"][section[0]].append(line)
+        elif section[0] and key in LISTENER_OPTIONS:
+            snapshot["listeners"][section[0]].append(line)
+        else:
+            snapshot["options"].setdefault(key, []).append(value)
+        if key == "include_dir":
+            for included in sorted(glob.glob(os.path.join(value, "*.conf"))):
+                _parse_file(included, snapshot, section)
+
+
+def conf_snapshot(conf_path: str = MOSQUITTO_MAIN_CONF) -> Dict[str, Any]:
+    """Broker settings from a mosquitto.conf and its include_dir files, in a diffable form.
+
+    Like parse_mosquitto_conf in the config service, but options that may
+    repeat keep every value, bridge sections are kept apart, and the files
+    mosquitto re-reads on SIGHUP are fingerprinted so edits to them show.
+    """
+    snapshot: Dict[str, Any] = {"options": {}, "listeners": {}, "bridges": {}, "files": {}}
+    _parse_file(conf_path, snapshot, [None])
+    for key in RELOAD_FILE_OPTIONS:
+        for path in snapshot["options"].get(key, []):
+            snapshot["files"][path] = _file_signature(path)
+    return snapshot
+
+
+def required_action(before: Dict[str, Any], after: Dict[str, Any]) -> Optional[str]:
+    """RESTART, RELOAD or None for the change from one conf_snapshot to another"""
+    if before["listeners"] != after["listeners"] or before["bridges"] != after["bridges"]:
+        return RESTART
+    changed = {
+        key for key in set(before["options"]) | set(after["options"])
+        if before["options"].get(key) != after["options"].get(key)
+    }
+    if any(key in RESTART_OPTIONS or key.startswith("plugin_opt_") for key in changed):
+        return RESTART
+    if changed or before["files"] != after["files"]:
+        return RELOAD
+    return None
+
+
+def _stronger(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    return a if _ACTION_ORDER[a] >= _ACTION_ORDER[b] else b
+
+
+class _SharedStateLock:
+    """Exclusive lock across services on the applied snapshot and the restart marker"""
+
+    def __enter__(self):
+        self._file = open(f"{MOSQUITTO_APPLIED_CONFIG}.lock", "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def _read_applied() -> Optional[Dict[str, Any]]:
+    try:
+        with open(MOSQUITTO_APPLIED_CONFIG, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read the applied broker configuration: {e}")
+        return None
+
+
+def _write_applied(snapshot: Dict[str, Any]):
+    temp_path = f"{MOSQUITTO_APPLIED_CONFIG}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, MOSQUITTO_APPLIED_CONFIG)
+
+
+def mark_restart_required(reason: str):
+    """Make the next apply, by whichever service runs it, a restart.
+
+    For changes no config diff shows, such as a rewritten
+    dynamic-security.json, which the plugin only reads at startup.
+    """
+    try:
+        with _SharedStateLock(), open(MOSQUITTO_RESTART_MARKER, "a") as f:
+            f.write(reason + "\n")
+    except OSError as e:
+        logger.error(f"Could not mark a broker restart as required: {e}")
+
+
+def _take_restart_marker() -> List[str]:
+    """Read and clear the restart marker; the caller holds the shared lock"""
+    try:
+        with open(MOSQUITTO_RESTART_MARKER, "r") as f:
+            reasons = [line.strip() for line in f if line.strip()]
+        os.remove(MOSQUITTO_RESTART_MARKER)
+        return reasons
+    except FileNotFoundError:
+        return []
+    except OSError as e:
+        logger.error(f"Could not read the broker restart marker: {e}")
+        return []
+
+
+def run_restart_command(command: str = MOSQUITTO_RESTART_COMMAND) -> Tuple[bool, str]:
+    try:
+        result = subprocess.run(shlex.split(command), capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    return result.returncode == 0, (result.stdout or result.stderr).strip()
+
+
+class ReloadManager:
+    """Apply broker configuration changes with SIGHUP, restarting only when needed.
+
+    request() does not touch the broker itself. Requests made within
+    `window` seconds of the first one are coalesced, and a timer thread
+    then applies them all at once. The config is diffed against the
+    snapshot taken when it was last applied (or at startup). Changes
+    mosquitto re-reads on SIGHUP, such as password_file, acl_file and most
+    global options, are sent a SIGHUP, which keeps every client connected.
+    Listener, bridge, plugin and persistence changes need a restart, as
+    does anything flagged with mark_restart_required(). Every coalesced
+    request gets the same result.
+
+    The applied snapshot lives in MOSQUITTO_APPLIED_CONFIG, shared by the
+    managers of all services and updated under a file lock. A restart done
+    by one service therefore counts for the others, and a change saved but
+    not yet applied is still pending after a service restart. The first
+    manager to find no snapshot records the current config as applied.
+    """
+
+    def __init__(
+        self,
+        conf_path: str = MOSQUITTO_MAIN_CONF,
+        window: float = MOSQUITTO_RELOAD_WINDOW,
+        restart: Optional[Callable[[], Tuple[bool, str]]] = None,
+    ):
+        self.conf_path = conf_path
+        self.window = window
+        self.restart = restart or run_restart_command
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._reasons: List[str] = []
+        self._minimum: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+        try:
+            with _SharedStateLock():
+                if _read_applied() is None:
+                    _write_applied(conf_snapshot(conf_path))
+        except OSError as e:
+            logger.error(f"Could not record the applied broker configuration: {e}")
+        self.stats = {"requests": 0, "reloads": 0, "restarts": 0, "skipped": 0, "failed": 0}
+
+    def request(self, reason: str, action: Optional[str] = None) -> Future:
+        """Ask for pending changes to be applied; `action` is the least that will be done"""
+        future: Future = Future()
+        with self._lock:
+            self.stats["requests"] += 1
+            self._futures.append(future)
+            self._reasons.append(reason)
+            self._minimum = _stronger(self._minimum, action)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._apply)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    async def request_async(self, reason: str, action: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.wrap_future(self.request(reason, action))
+
+    def _apply(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+            reasons, self._reasons = self._reasons, []
+            minimum, self._minimum = self._minimum, None
+            self._timer = None
+
+        with self._apply_lock:
+            try:
+                with _SharedStateLock():
+                    result = self._apply_changes(minimum, reasons)
+            except Exception as e:
+                logger.error(f"Error applying broker configuration: {e}")
+                result = {"action": None, "success": False, "message": str(e)}
+        result["requests"] = len(futures)
+        for future in futures:
+            future.set_result(result)
+
+    def _apply_changes(self, minimum: Optional[str], reasons: List[str]) -> Dict[str, Any]:
+        current = conf_snapshot(self.conf_path)
+        applied = _read_applied()
+        action = _stronger(minimum, RESTART if applied is None else required_action(applied, current))
+        marked = _take_restart_marker()
+        if marked:
+            action = RESTART
+            reasons = reasons + marked
+
+        if action is None:
+            self.stats["skipped"] += 1
+            return {"action": None, "success": True, "message": "No configuration changes to apply"}
+
+        logger.info(f"Applying broker configuration with a {action} for: {'; '.join(reasons)}")
+        if action == RELOAD:
+            success, message = self._send_sighup(current)
+            if success is None:
+                # The broker is not running, so there is nothing to signal
+                action = RESTART
+        if action == RESTART:
+            success, message = self.restart()
+
+        if success:
+            _write_applied(current)
+            self.stats["reloads" if action == RELOAD else "restarts"] += 1
+        else:
+            self.stats["failed"] += 1
+            if marked:
+                # Keep the restart pending for the next attempt
+                with open(MOSQUITTO_RESTART_MARKER, "a") as f:
+                    f.writelines(reason + "\n" for reason in marked)
+            logger.error(f"Broker {action} failed: {message}")
+        return {"action": action, "success": bool(success), "message": message}
+
+    def _broker_pid(self, snapshot: Dict[str, Any]) -> Optional[int]:
+        for pid_file in snapshot["options"].get("pid_file", []):
+            try:
+                with open(pid_file) as f:
+                    return int(f.read().strip())
+            except (OSError, ValueError):
+                pass
+        try:
+            result = subprocess.run(["pgrep", "-x", "mosquitto"], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        pids = result.stdout.split()
+        return int(pids[0]) if pids else None
+
+    def _send_sighup(self, snapshot: Dict[str, Any]) -> Tuple[Optional[bool], str]:
+        """(True, message) if signalled, (False, error) if that failed, (None, ...) if not running"""
+        pid = self._broker_pid(snapshot)
+        if pid is None:
+            return None, "Mosquitto is not running"
+        try:
+            os.kill(pid, signal.SIGHUP)
+        except ProcessLookupError:
+            return None, "Mosquitto is not running"
+        except PermissionError as e:
+            return False, f"Not allowed to signal mosquitto: {e}"
+        return True, f"Mosquitto (pid {pid}) reloaded its configuration"
@@ -0,0 +1,117 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/monitor/bench_subscriber.py
+"""Throughput benchmark for the sharded # subscriber against a local mosquitto.
+
+Usage:
+    python bench_subscriber.py --username bunker --password bunker --shards 1 2 4 8
+    python bench_subscriber.py --threads --shards 1 2 4
+
+For each shard count a ShardedSubscriber is started and the publisher
+processes flood the broker with QoS 0 messages. The benchmark reports the
+rate at which the shards counted them. Use a broker with
+max_queued_messages raised, otherwise it drops messages instead of queueing
+them for a slow subscriber. The publishers must outrun the subscriber, so
+give them enough processes (--publishers).
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+
+from paho.mqtt import client as mqtt_client
+
+from subscriber_shards import ShardedSubscriber
+
+
+def publish(host: str, port: int, username: str, password: str, count: int, payload_size: int, index: int):
+    client = mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id=f"bench-pub-{index}")
+    client.username_pw_set(username, password)
+    client.max_queued_messages_set(0)
+    client.connect(host, port, 60)
+    client.loop_start()
+    payload = b"x" * payload_size
+    for i in range(count):
+        client.publish(f"bench/{index}/device-{i % 1000}/data", payload, qos=0)
+    time.sleep(1)
+    client.disconnect()
+    client.loop_stop()
+
+
+def run(args, shards: int) -> float:
+    lock = threading.Lock()
+    received = [0, None]
+
+    def on_counts(messages, total_bytes, prefixes):
+        with lock:
+            received[0] += messages
+            received[1] = time.perf_counter()
+
+    subscriber = ShardedSubscriber(
+        args.host, args.port, args.username, args.password, on_counts,
+        shards=shards, processes=not args.threads,
+    )
+    subscriber.start()
+    time.sleep(args.warmup)
+
+    total = args.messages
+    per_publisher = total // args.publishers
+    start = time.perf_counter()
+    publishers = [
+        multiprocessing.Process(
+            target=publish,
+            args=(args.host, args.port, args.username, args.password, per_publisher, args.payload, i),
+        )
+        for i in range(args.publishers)
+    ]
+    for proc in publishers:
+        proc.start()
+
+    # Wait until everything arrived or nothing new arrived for a while
+    last_seen, idle_since = 0, time.perf_counter()
+    while received[0] < per_publisher * args.publishers:
+        time.sleep(0.2)
+        if received[0] != last_seen:
+            last_seen, idle_since = received[0], time.perf_counter()
+        elif time.perf_counter() - idle_since > args.idle_timeout:
+            break
+    for proc in publishers:
+        proc.join()
+    subscriber.stop()
+
+    elapsed = (received[1] or time.perf_counter()) - start
+    rate = received[0] / elapsed if elapsed > 0 else 0.0
+    print(f"{shards:>3} shard(s): {received[0]:>9} of {per_publisher * args.publishers} messages, "
+          f"{rate:,.0f} msg/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1900)
+    parser.add_argument("--username", default="bunker")
+    parser.add_argument("--password", default="bunker")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", action="store_true", help="run shards as threads instead of processes")
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--payload", type=int, default=64, help="payload size in bytes")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to let the shards subscribe")
+    parser.add_argument("--idle-timeout", type=float, default=3.0)
+    args = parser.parse_args()
+
+    results = {shards: run(args, shards) for shards in args.shards}
+    baseline = results[args.shards[0]]
+    if baseline:
+        for shards, rate in results.items():
+            print(f"{shards:>3} shard(s): {rate / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,27 @@
 import json
 from datetime import datetime, timedelta
 import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+# Storage backend selection: "sqlite" (default) or "json" (legacy single-file store)
+HISTORICAL_DATA_BACKEND = os.getenv("HISTORICAL_DATA_BACKEND", "sqlite")
+HISTORICAL_JSON_PATH = os.getenv("HISTORICAL_JSON_PATH", "/app/monitor/data/historical_data.json")
+HISTORICAL_DB_PATH = os.getenv("HISTORICAL_DB_PATH", "/app/monitor/data/historical_data.db")
+# How long byte-rate samples are kept by the SQLite backend
+HISTORICAL_RETENTION_DAYS = int(os.getenv("HISTORICAL_RETENTION_DAYS", "30"))
+# Most byte-rate points returned for the 24h chart; denser samples are averaged together
+HISTORY_CHART_POINTS = int(os.getenv("HISTORY_CHART_POINTS", "480"))
+
+SECONDS_PER_DAY = 86400
+
 
 class HistoricalDataStorage:
-    def __init__(self, filename="/app/monitor/data/historical_data.json"):
+    """Legacy storage backend keeping all history in a single JSON file"""
+
+    def __init__(self, filename=HISTORICAL_JSON_PATH):
         self.filename = filename
         self.max_age_days = 7
         # Ensure the data directory exists
@@ -137,4 +155,237 @@ class HistoricalDataStorage:
             return {
                 'dates': [],
                 'counts': []
-            }
\ No newline at end of file
+            }
+
+
+class SQLiteHistoricalDataStorage:
+    """Append-only time-series storage backed by SQLite in WAL mode.
+
+    Byte-rate samples are written to one segment table per UTC day, keyed by
+    epoch seconds, so time-range queries are primary-key range scans and
+    retention is enforced by dropping whole segment tables.
+    """
+
+    def __init__(
+        self,
+        filename=HISTORICAL_DB_PATH,
+        retention_days: int = HISTORICAL_RETENTION_DAYS,
+        legacy_json_path: Optional[str] = HISTORICAL_JSON_PATH,
+    ):
+        self.filename = filename
+        self.max_age_days = retention_days
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS daily_messages (date TEXT PRIMARY KEY, count INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+        # Day numbers of the segment tables that currently exist
+        self._segments = self._load_segments()
+
+        if legacy_json_path:
+            self.migrate_from_json(legacy_json_path)
+        self.enforce_retention()
+
+    @staticmethod
+    def _segment_table(day: int) -> str:
+        return f"bytes_{day}"
+
+    def _load_segments(self) -> List[int]:
+        rows = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'bytes_%'"
+        ).fetchall()
+        return sorted(int(name.split("_", 1)[1]) for (name,) in rows)
+
+    def _ensure_segment(self, day: int):
+        """Create the segment table for a day if needed. Caller holds the lock."""
+        if day in self._segments:
+            return
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._segment_table(day)} ("
+            "ts INTEGER PRIMARY KEY, bytes_received REAL NOT NULL, bytes_sent REAL NOT NULL)"
+        )
+        self._segments.append(day)
+        self._segments.sort()
+
+    def _insert_sample(self, ts: int, bytes_received: float, bytes_sent: float):
+        """Append a sample. Caller holds the lock and commits."""
+        day = ts // SECONDS_PER_DAY
+        self._ensure_segment(day)
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {self._segment_table(day)} VALUES (?, ?, ?)",
+            (ts, bytes_received, bytes_sent),
+        )
+
+    def migrate_from_json(self, json_path: str):
+        """Import history from the legacy JSON file once, then rename it"""
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error reading legacy data for migration: {e}")
+            return
+        if not isinstance(data, dict):
+            print(f"Skipping migration of {json_path}: unexpected format")
+            return
+
+        with self._lock:
+            for entry in data.get("hourly", []):
+                try:
+                    ts = int(datetime.strptime(entry["timestamp"], "%Y-%m-%d %H:%M").timestamp())
+                    self._insert_sample(
+                        ts, float(entry["bytes_received"]), float(entry["bytes_sent"])
+                    )
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Skipping invalid legacy sample {entry}: {e}")
+            for entry in data.get("daily_messages", []):
+                try:
+                    self._conn.execute(
+                        "INSERT INTO daily_messages (date, count) VALUES (?, ?) "
+                        "ON CONFLICT(date) DO UPDATE SET count = count + excluded.count",
+                        (str(entry["date"]), int(entry["count"])),
+                    )
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Skipping invalid legacy daily count {entry}: {e}")
+            self._conn.commit()
+
+        os.replace(json_path, f"{json_path}.migrated")
+        print(f"Migrated legacy historical data from {json_path} to {self.filename}")
+
+    def enforce_retention(self):
+        """Drop segment tables that are entirely older than the retention window"""
+        cutoff_day = (int(time.time()) - self.max_age_days * SECONDS_PER_DAY) // SECONDS_PER_DAY
+        cutoff_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+        with self._lock:
+            expired = [day for day in self._segments if day < cutoff_day]
+            for day in expired:
+                self._conn.execute(f"DROP TABLE IF EXISTS {self._segment_table(day)}")
+                self._segments.remove(day)
+            self._conn.execute("DELETE FROM daily_messages WHERE date < ?", (cutoff_date,))
+            self._conn.commit()
+
+    def update_daily_messages(self, message_count: int):
+        """Update daily message count"""
+        current_date = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO daily_messages (date, count) VALUES (?, ?) "
+                "ON CONFLICT(date) DO UPDATE SET count = count + excluded.count",
+                (current_date, message_count),
+            )
+            self._conn.commit()
+
+    def add_hourly_data(self, bytes_received: float, bytes_sent: float):
+        """Add hourly byte rate data"""
+        now = int(time.time())
+        with self._lock:
+            new_day = now // SECONDS_PER_DAY not in self._segments
+            self._insert_sample(now, bytes_received, bytes_sent)
+            self._conn.commit()
+        # Retention only changes when a new segment is started
+        if new_day:
+            self.enforce_retention()
+
+    def query_range(self, start_ts: int, end_ts: int) -> List[tuple]:
+        """Return (ts, bytes_received, bytes_sent) samples with start_ts <= ts < end_ts"""
+        first_day = start_ts // SECONDS_PER_DAY
+        last_day = (end_ts - 1) // SECONDS_PER_DAY
+        rows = []
+        with self._lock:
+            for day in self._segments:
+                if first_day <= day <= last_day:
+                    rows.extend(self._conn.execute(
+                        f"SELECT ts, bytes_received, bytes_sent FROM {self._segment_table(day)} "
+                        "WHERE ts >= ? AND ts < ? ORDER BY ts",
+                        (start_ts, end_ts),
+                    ).fetchall())
+        return rows
+
+    def get_hourly_data(self, hours: int = 24, max_points: int = HISTORY_CHART_POINTS):
+        """Get byte rate data for the last `hours` hours, averaged down to at most `max_points`"""
+        now = int(time.time())
+        rows = self.query_range(now - hours * 3600, now + 1)
+        if len(rows) > max_points:
+            rows = _average_buckets(rows, -(-hours * 3600 // max_points))
+        return {
+            'timestamps': [datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M') for ts, _, _ in rows],
+            'bytes_received': [received for _, received, _ in rows],
+            'bytes_sent': [sent for _, _, sent in rows]
+        }
+
+    def get_daily_messages(self):
+        """Get daily message counts for the last 7 days"""
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT date, count FROM (SELECT date, count FROM daily_messages "
+                    "ORDER BY date DESC LIMIT 7) ORDER BY date"
+                ).fetchall()
+            return {
+                'dates': [date for date, _ in rows],
+                'counts': [count for _, count in rows]
+            }
+        except Exception as e:
+            print(f"Error getting daily messages: {e}")
+            return {
+                'dates': [],
+                'counts': []
+            }
+
+    def load_data(self):
+        """Return the last 24 hours in the legacy JSON layout (used by diagnostics)"""
+        hourly = self.get_hourly_data()
+        daily = self.get_daily_messages()
+        return {
+            "daily_messages": [
+                {'date': date, 'count': count}
+                for date, count in zip(daily['dates'], daily['counts'])
+            ],
+            "hourly": [
+                {'timestamp': ts, 'bytes_received': received, 'bytes_sent': sent}
+                for ts, received, sent in zip(
+                    hourly['timestamps'], hourly['bytes_received'], hourly['bytes_sent']
+                )
+            ],
+            "daily": []
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _average_buckets(rows: List[tuple], seconds: int) -> List[tuple]:
+    """Average (ts, received, sent) rows, ordered by ts, into buckets of `seconds`"""
+    result = []
+    bucket = None
+    for ts, received, sent in rows:
+        start = ts - ts % seconds
+        if start != bucket:
+            bucket = start
+            result.append([start, 0.0, 0.0, 0])
+        row = result[-1]
+        row[1] += received
+        row[2] += sent
+        row[3] += 1
+    return [(start, received / n, sent / n) for start, received, sent, n in result]
+
+
+def create_data_storage(backend: Optional[str] = None):
+    """Create the historical data storage backend selected by HISTORICAL_DATA_BACKEND"""
+    backend = (backend or HISTORICAL_DATA_BACKEND).lower()
+    if backend == "json":
+        return HistoricalDataStorage()
+    if backend == "sqlite":
+        return SQLiteHistoricalDataStorage()
+    raise ValueError(f"Unknown historical data backend: {backend}")
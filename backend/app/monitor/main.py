@@ -6,31 +6,39 @@
 # Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
 #
 # app/monitor/main.py
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from paho.mqtt import client as mqtt_client
 import threading
-from typing import Dict, List, Optional
-from collections import deque
+import asyncio
+from typing import Dict, List, Optional, Set
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
+import hashlib
 import os
 import jwt
 import secrets
 import logging
 from logging.handlers import RotatingFileHandler
 import ssl
-from data_storage import HistoricalDataStorage
+from urllib.parse import urlencode
+from data_storage import create_data_storage
+from presence import PRESENCE_ENABLED, PresenceEngine
+from topic_stats import TopicStats
+from subscriber_shards import MONITOR_SUBSCRIBER_SHARDS, ShardedSubscriber
+from sys_counters import UPTIME_TOPIC, SysCounterTracker, parse_uptime
+from rate_history import SAMPLED_COUNTERS, RateHistory, RateSampler
 import socket
 import uvicorn
 from contextlib import asynccontextmanager
+from enum import Enum
 
 # Add this for environment variable loading
 try:
@@ -57,10 +65,32 @@ MOSQUITTO_IP = os.getenv("MOSQUITTO_IP", "127.0.0.1")
 # Convert to int with a default value
 MOSQUITTO_PORT = int(os.getenv("MOSQUITTO_PORT", "1900"))
 
+# How often (seconds) the in-memory message counter is persisted to disk
+MESSAGE_COUNT_FLUSH_INTERVAL = float(os.getenv("MESSAGE_COUNT_FLUSH_INTERVAL", "10"))
+# How often (seconds) a byte-rate sample is written to historical storage
+STORAGE_SAMPLE_INTERVAL = int(os.getenv("STORAGE_SAMPLE_INTERVAL", "60"))
+# How user messages are counted: "subscribe" receives every message on #,
+# "sys" derives the count from a $SYS counter without receiving any payloads
+MONITOR_COUNT_MODE = os.getenv("MONITOR_COUNT_MODE", "subscribe").lower()
+# Cumulative $SYS counter used in "sys" mode
+MONITOR_SYS_COUNT_TOPIC = os.getenv("MONITOR_SYS_COUNT_TOPIC", "$SYS/broker/publish/messages/received")
+# Keep the # subscription in "sys" mode, only for the per-topic breakdown
+MONITOR_TOPIC_BREAKDOWN = os.getenv(
+    "MONITOR_TOPIC_BREAKDOWN", "true" if MONITOR_COUNT_MODE != "sys" else "false"
+).lower() in ("1", "true", "yes")
+# Whether message counts come from the # subscription
+COUNT_FROM_SUBSCRIPTION = MONITOR_COUNT_MODE != "sys"
+# Whether anything needs the # subscription at all
+SUBSCRIBE_ALL_TOPICS = COUNT_FROM_SUBSCRIPTION or MONITOR_TOPIC_BREAKDOWN
+
 # Security settings
 JWT_SECRET = os.getenv("JWT_SECRET", secrets.token_urlsafe(32))
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION = 30  # minutes
+# Seconds a stats stream token can be used to open the stream
+STATS_STREAM_TOKEN_TTL = int(os.getenv("STATS_STREAM_TOKEN_TTL", "60"))
+# Query parameters whose values are never written to the request log
+REDACTED_QUERY_PARAMS = {"api_key", "token"}
 
 # API Key settings
 API_KEY_NAME = "X-API-Key"
@@ -86,6 +116,8 @@ class MQTTStats:
         self.subscriptions = 0
         self.retained_messages = 0
         self.connected_clients = 0
+        # Connected-client count from the presence engine, when enabled
+        self.presence_clients: Optional[int] = None
         self.bytes_received_15min = 0.0
         self.bytes_sent_15min = 0.0
         
@@ -93,19 +125,32 @@ class MQTTStats:
         self.message_counter = MessageCounter()
         
         # Initialize data storage
-        self.data_storage = HistoricalDataStorage()
+        self.data_storage = create_data_storage()
         self.last_storage_update = datetime.now()
         
-        # Message rate tracking
-        self.messages_history = deque(maxlen=15)
-        self.published_history = deque(maxlen=15)
-        self.last_messages_sent = 0
-        self.last_update = datetime.now()
-        
-        # Initialize history with zeros
-        for _ in range(15):
-            self.messages_history.append(0)
-            self.published_history.append(0)
+        # Message and byte counts sampled from $SYS in the background (see RateSampler)
+        self.rate_history = RateHistory()
+
+        # Bumped whenever a $SYS value or the stored history changes, so the
+        # serialized stats snapshot is only rebuilt when something changed
+        self._version = 0
+        self._snapshot_key = None
+        self._snapshot_stats: Dict = {}
+        self._snapshot_body = b""
+        self._snapshot_etag = ""
+        self._snapshot_lock = threading.Lock()
+
+    def set_sys_value(self, attr_name: str, value) -> bool:
+        """Store a value received on a monitored $SYS topic.
+
+        Returns True if the value changed.
+        """
+        with self._lock:
+            if getattr(self, attr_name) != value:
+                setattr(self, attr_name, value)
+                self._version += 1
+                return True
+            return False
 
     def format_number(self, number: int) -> str:
         """Format large numbers with K/M suffix"""
@@ -115,42 +160,45 @@ class MQTTStats:
             return f"{number/1_000:.1f}K"
         return str(number)
 
-    def increment_user_messages(self):
+    def increment_user_messages(self, count: int = 1):
         """Increment the message counter for non-$SYS messages"""
-        with self._lock:
-            self.message_counter.increment_count()
+        # MessageCounter has its own lock, so the stats lock is not needed here
+        self.message_counter.increment_count(count)
 
-    def update_storage(self):
-        """Update storage every 30 minutes"""
+    def update_storage(self) -> bool:
+        """Write a byte-rate sample every STORAGE_SAMPLE_INTERVAL seconds.
+
+        Called by the rate sampler thread, so history is recorded whether or
+        not anyone polls the API. Returns True if a sample was written.
+        """
         now = datetime.now()
-        if (now - self.last_storage_update).total_seconds() >= 180:  # 3 minutes
+        if (now - self.last_storage_update).total_seconds() >= STORAGE_SAMPLE_INTERVAL:
             try:
                 self.data_storage.add_hourly_data(
                     float(self.bytes_received_15min),
                     float(self.bytes_sent_15min)
                 )
                 self.last_storage_update = now
+                with self._lock:
+                    self._version += 1
+                return True
             except Exception as e:
                 logger.error(f"Error updating storage: {e}")
+        return False
 
-    def update_message_rates(self):
-        """Calculate message rates for the last minute"""
-        now = datetime.now()
-        if (now - self.last_update).total_seconds() >= 60:
-            with self._lock:
-                published_rate = max(0, self.messages_sent - self.last_messages_sent)
-                self.published_history.append(published_rate)
-                self.last_messages_sent = self.messages_sent
-                self.last_update = now
+    def on_rate_minute(self):
+        """A minute of rate history completed; the per-minute histories changed"""
+        with self._lock:
+            self._version += 1
 
     def get_stats(self) -> Dict:
         """Get current MQTT statistics"""
-        self.update_message_rates()
-        self.update_storage()
-        
         with self._lock:
             actual_subscriptions = max(0, self.subscriptions - 2)
-            actual_connected_clients = max(0, self.connected_clients - 1)
+            if self.presence_clients is not None:
+                actual_connected_clients = self.presence_clients
+            else:
+                actual_connected_clients = max(0, self.connected_clients - 1)
             
             # Get total messages from last 7 days
             total_messages = self.message_counter.get_total_count()
@@ -164,16 +212,61 @@ class MQTTStats:
                 "total_messages_received": self.format_number(total_messages),
                 "total_subscriptions": actual_subscriptions,
                 "retained_messages": self.retained_messages,
-                "messages_history": list(self.messages_history),
-                "published_history": list(self.published_history),
+                # Messages received and sent per minute over the last 15 minutes
+                "messages_history": [int(v) for v in self.rate_history.recent(60, "messages_received", 15)],
+                "published_history": [int(v) for v in self.rate_history.recent(60, "messages_sent", 15)],
                 "bytes_stats": hourly_data,  # This contains timestamps, bytes_received, and bytes_sent
                 "daily_message_stats": daily_messages  # This contains dates and counts
             }
 
+    def get_cached_stats(self) -> Dict:
+        """Get the current stats snapshot as a dict (treat as read-only)"""
+        self.get_stats_snapshot()
+        return self._snapshot_stats
+
+    def get_stats_snapshot(self) -> tuple[bytes, str]:
+        """Get the serialized stats response body and its ETag.
+
+        The body is rebuilt only when a $SYS value, the stored history or the
+        displayed message total changed since the last call; otherwise the
+        cached bytes are returned, so concurrent pollers share one build.
+        """
+        total_display = self.format_number(self.message_counter.get_total_count())
+        with self._lock:
+            key = (self._version, total_display)
+
+        with self._snapshot_lock:
+            if key != self._snapshot_key:
+                stats = self.get_stats()
+                self._add_connection_status(stats)
+                body = json.dumps(stats, separators=(",", ":")).encode()
+                self._snapshot_stats = stats
+                self._snapshot_body = body
+                self._snapshot_etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+                self._snapshot_key = key
+            return self._snapshot_body, self._snapshot_etag
+
+    def _add_connection_status(self, stats: Dict):
+        """Add the MQTT connection status fields to a stats dict"""
+        mqtt_connected = self.connected_clients > 0
+        stats["mqtt_connected"] = mqtt_connected
+
+        # If MQTT is not connected, add a message
+        if not mqtt_connected:
+            stats["connection_error"] = f"MQTT broker connection failed. Check if Mosquitto is running on {MOSQUITTO_IP}:{MOSQUITTO_PORT}"
+            logger.warning(f"Serving stats with MQTT disconnected warning: {MOSQUITTO_IP}:{MOSQUITTO_PORT}")
+
 class MessageCounter:
-    def __init__(self, file_path="message_counts.json"):
+    def __init__(self, file_path="message_counts.json", flush_interval: Optional[float] = None):
         self.file_path = file_path
+        self.flush_interval = flush_interval if flush_interval is not None else MESSAGE_COUNT_FLUSH_INTERVAL
+        self._lock = threading.Lock()
         self.daily_counts = self._load_counts()
+        # Messages counted since the last flush; folded into daily_counts by the flusher
+        self._pending = 0
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
 
     def _load_counts(self) -> Dict[str, int]:
         """Load existing counts from JSON file"""
@@ -188,40 +281,80 @@ class MessageCounter:
                 return {}
         return {}
 
-    def _save_counts(self):
-        """Save counts to JSON file"""
+    def _save_counts(self, daily_counts: Dict[str, int]):
+        """Atomically save counts to JSON file (temp file + rename)"""
         # Convert to list of dicts with timestamps
         data = [
             {
                 "timestamp": f"{date} 00:00",
                 "message_counter": count
             }
-            for date, count in self.daily_counts.items()
+            for date, count in daily_counts.items()
         ]
-        with open(self.file_path, 'w') as f:
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
 
-    def increment_count(self):
-        """Increment today's count and maintain 7-day window"""
+    def _fold_pending(self) -> Dict[str, int]:
+        """Move pending messages into today's count and maintain 7-day window.
+
+        Must be called with the lock held. Returns a snapshot for saving.
+        """
         today = datetime.now().date().isoformat()
-        
-        # Increment or initialize today's count
-        self.daily_counts[today] = self.daily_counts.get(today, 0) + 1
+        if self._pending:
+            self.daily_counts[today] = self.daily_counts.get(today, 0) + self._pending
+            self._pending = 0
 
         # Remove counts older than 7 days
         cutoff_date = (datetime.now() - timedelta(days=7)).date().isoformat()
         self.daily_counts = {
-            date: count 
-            for date, count in self.daily_counts.items() 
+            date: count
+            for date, count in self.daily_counts.items()
             if date >= cutoff_date
         }
+        return dict(self.daily_counts)
 
-        # Save updated counts
-        self._save_counts()
+    def _seconds_until_midnight(self) -> float:
+        now = datetime.now()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (midnight - now).total_seconds()
+
+    def _flush_loop(self):
+        """Persist counts every flush_interval seconds and at each day rollover"""
+        while not self._stop_event.is_set():
+            # Wake up just after midnight so messages land on the right day
+            timeout = min(self.flush_interval, self._seconds_until_midnight() + 0.01)
+            if self._stop_event.wait(timeout):
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing message counts: {e}")
+
+    def flush(self):
+        """Fold pending messages into the daily counts and persist them"""
+        with self._lock:
+            snapshot = self._fold_pending()
+        self._save_counts(snapshot)
+
+    def stop(self):
+        """Stop the background flusher and persist the final counts"""
+        self._stop_event.set()
+        self._flush_thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def increment_count(self, count: int = 1):
+        """Count messages; persisted later by the background flusher"""
+        with self._lock:
+            self._pending += count
 
     def get_total_count(self) -> int:
         """Get sum of messages over last 7 days"""
-        return sum(self.daily_counts.values())
+        with self._lock:
+            return sum(self.daily_counts.values()) + self._pending
 
 # Initialize MQTT Stats
 mqtt_stats = MQTTStats()
@@ -235,11 +368,24 @@ ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost").split(",")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code (previously in @app.on_event("startup"))
+    stats_broadcaster.attach_loop(asyncio.get_running_loop())
     client = connect_mqtt()
     client.loop_start()
+    if presence_engine is not None:
+        presence_engine.start()
+    if subscriber_shards is not None:
+        subscriber_shards.start()
+    rate_sampler.start()
     yield
     # Shutdown code if needed
     client.loop_stop()
+    if presence_engine is not None:
+        presence_engine.stop()
+    if subscriber_shards is not None:
+        subscriber_shards.stop()
+    rate_sampler.stop()
+    # Persist any message counts still held in memory
+    mqtt_stats.message_counter.stop()
 
 # Initialize FastAPI app with versioning (only do this once!)
 app = FastAPI(
@@ -268,7 +414,7 @@ app.add_middleware(TrustedHostMiddleware, allowed_hosts=ALLOWED_HOSTS)
 
 async def get_api_key(api_key: str = Depends(api_key_header)):
     """Validate API key"""
-    logger.info(f"Received API Key Header: {api_key}")
+    logger.info(f"Received API Key Header: {'present' if api_key else 'missing'}")
     
     if not api_key:
         logger.error("No API key provided")
@@ -278,17 +424,27 @@ async def get_api_key(api_key: str = Depends(api_key_header)):
         )
     
     if api_key not in API_KEYS:
-        logger.error(f"Invalid API key provided: {api_key}")
+        logger.error("Invalid API key provided")
         raise HTTPException(
             status_code=403,
             detail="Invalid API key"
         )
     return api_key
 
+def _redacted_url(request: Request) -> str:
+    """The request URL with credentials in the query string masked"""
+    if not REDACTED_QUERY_PARAMS.intersection(request.query_params.keys()):
+        return str(request.url)
+    query = urlencode([
+        (key, "***" if key in REDACTED_QUERY_PARAMS else value)
+        for key, value in request.query_params.multi_items()
+    ], safe="*")
+    return str(request.url.replace(query=query))
+
 async def log_request(request: Request):
     """Log API request details"""
     logger.info(
-        f"Request: {request.method} {request.url} "
+        f"Request: {request.method} {_redacted_url(request)} "
         f"Client: {request.client.host} "
         f"User-Agent: {request.headers.get('user-agent')} "
         f"Time: {datetime.now().isoformat()}"
@@ -335,26 +491,179 @@ class NonceManager:
 
 nonce_manager = NonceManager()
 
+# Delay used to coalesce a burst of $SYS updates into a single push
+STATS_STREAM_DEBOUNCE = float(os.getenv("STATS_STREAM_DEBOUNCE", "0.25"))
+# Interval (seconds) between keep-alive comments on idle stats streams
+STATS_STREAM_KEEPALIVE = float(os.getenv("STATS_STREAM_KEEPALIVE", "15"))
+
+class StatsBroadcaster:
+    """Push stats deltas to Server-Sent Events subscribers.
+
+    $SYS updates arrive on the paho network thread; notify() hands them to the
+    event loop, where bursts are coalesced and each delta is serialized once
+    and queued for every subscriber.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._last_stats: Dict = {}
+        self._publish_scheduled = False
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def notify(self):
+        """Signal that stats changed. Safe to call from any thread."""
+        if self._loop is None or not self._subscribers:
+            return
+        self._loop.call_soon_threadsafe(self._schedule_publish)
+
+    def _schedule_publish(self):
+        if self._publish_scheduled:
+            return
+        self._publish_scheduled = True
+        self._loop.call_later(STATS_STREAM_DEBOUNCE, self._publish)
+
+    @staticmethod
+    def _format_event(event: str, data: Dict) -> bytes:
+        return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+    def _publish(self):
+        self._publish_scheduled = False
+        try:
+            stats = mqtt_stats.get_cached_stats()
+        except Exception as e:
+            logger.error(f"Error building stats for stream: {e}")
+            return
+
+        delta = {
+            key: value for key, value in stats.items()
+            if self._last_stats.get(key) != value
+        }
+        # Fields that disappeared (e.g. connection_error once reconnected)
+        for key in self._last_stats.keys() - stats.keys():
+            delta[key] = None
+        self._last_stats = stats
+        if not delta:
+            return
+
+        message = self._format_event("stats", delta)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Subscriber fell behind: drop its backlog and resync with a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._format_event("snapshot", stats))
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self._format_event("snapshot", mqtt_stats.get_cached_stats()))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+stats_broadcaster = StatsBroadcaster()
+
+def on_presence_change(count: int):
+    """Use the presence engine's client count instead of $SYS/broker/clients/connected.
+
+    Only called once the engine has received presence data, so a broker that
+    publishes none keeps the $SYS count.
+    """
+    if mqtt_stats.set_sys_value("presence_clients", count):
+        stats_broadcaster.notify()
+
+presence_engine = (
+    PresenceEngine(
+        MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD,
+        on_change=on_presence_change,
+    )
+    if PRESENCE_ENABLED else None
+)
+
+# Per-topic-prefix traffic seen on the wildcard subscription
+topic_stats = TopicStats()
+
+# Increments of the broker's cumulative $SYS counters, across broker restarts
+sys_counters = SysCounterTracker()
+
+def on_rate_sample():
+    """Record byte-rate history on the sampler's cadence, not only when stats are requested"""
+    if mqtt_stats.update_storage():
+        stats_broadcaster.notify()
+
+# Samples received/sent message and byte counters into the rate history at a fixed cadence
+rate_sampler = RateSampler(
+    mqtt_stats.rate_history, sys_counters.delta,
+    on_minute=mqtt_stats.on_rate_minute, on_sample=on_rate_sample,
+)
+
+def on_shard_counts(messages: int, total_bytes: int, prefixes: Dict[str, List[int]]):
+    """Merge counts collected by the subscriber shards"""
+    if COUNT_FROM_SUBSCRIPTION:
+        mqtt_stats.increment_user_messages(messages)
+    now = time.monotonic()
+    for prefix, (count, size) in prefixes.items():
+        topic_stats.record(prefix, size, now, count)
+
+# Optional shared-subscription shards that take over counting # traffic
+subscriber_shards = (
+    ShardedSubscriber(
+        MOSQUITTO_IP, MOSQUITTO_PORT, MOSQUITTO_ADMIN_USERNAME, MOSQUITTO_ADMIN_PASSWORD,
+        on_counts=on_shard_counts, depth=topic_stats.depth,
+    )
+    if MONITOR_SUBSCRIBER_SHARDS > 1 and SUBSCRIBE_ALL_TOPICS else None
+)
+
+class TopicRateField(str, Enum):
+    MESSAGES = "messages"
+    BYTES = "bytes"
+
 def on_message(client, userdata, msg):
     """Handle messages from MQTT broker"""
+    if msg.topic in SAMPLED_COUNTERS:
+        try:
+            rate_sampler.observe(msg.topic, int(msg.payload.decode()))
+        except ValueError as e:
+            logger.error(f"Error processing message from {msg.topic}: {e}")
     if msg.topic in MONITORED_TOPICS:
         try:
             # Handle byte rate topics differently (they return floats)
             if msg.topic in ["$SYS/broker/load/bytes/received/15min", "$SYS/broker/load/bytes/sent/15min"]:
                 value = float(msg.payload.decode())
-                attr_name = MONITORED_TOPICS[msg.topic]
-                with mqtt_stats._lock:
-                    setattr(mqtt_stats, attr_name, value)
             else:
                 value = int(msg.payload.decode())
-                attr_name = MONITORED_TOPICS[msg.topic]
-                with mqtt_stats._lock:
-                    setattr(mqtt_stats, attr_name, value)
+            if mqtt_stats.set_sys_value(MONITORED_TOPICS[msg.topic], value):
+                stats_broadcaster.notify()
+        except ValueError as e:
+            logger.error(f"Error processing message from {msg.topic}: {e}")
+    elif msg.topic == UPTIME_TOPIC:
+        seconds = parse_uptime(msg.payload.decode())
+        if seconds is not None and sys_counters.update_uptime(seconds):
+            logger.info("Broker restart detected, $SYS counters start again from zero")
+    elif msg.topic == MONITOR_SYS_COUNT_TOPIC and not COUNT_FROM_SUBSCRIPTION:
+        try:
+            received = sys_counters.delta("messages_received", int(msg.payload.decode()))
         except ValueError as e:
             logger.error(f"Error processing message from {msg.topic}: {e}")
+        else:
+            if received:
+                mqtt_stats.increment_user_messages(received)
     # Count non-$SYS messages
     elif not msg.topic.startswith('$SYS/'):
-        mqtt_stats.increment_user_messages()
+        if COUNT_FROM_SUBSCRIPTION:
+            mqtt_stats.increment_user_messages()
+        topic_stats.record(msg.topic, len(msg.payload))
 
 def connect_mqtt():
     """Connect to MQTT broker"""
@@ -363,10 +672,10 @@ def connect_mqtt():
         def on_connect(client, userdata, flags, rc, properties=None):
             if rc == 0:
                 logger.info(f"Connected to MQTT Broker at {MOSQUITTO_IP}:{MOSQUITTO_PORT}!")
-                client.subscribe([
-                    ("$SYS/broker/#", 0),
-                    ("#", 0)
-                ])
+                topics = [("$SYS/broker/#", 0)]
+                if SUBSCRIBE_ALL_TOPICS and subscriber_shards is None:
+                    topics.append(("#", 0))
+                client.subscribe(topics)
                 logger.info("Subscribed to topics")
             else:
                 logger.error(f"Failed to connect to MQTT broker, return code {rc}")
@@ -426,6 +735,12 @@ def connect_mqtt():
         dummy_client.loop_stop = lambda: None
         return dummy_client
 
+def _parse_if_none_match(header: Optional[str]) -> List[str]:
+    """Split an If-None-Match header into its entity tags"""
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
 # API endpoints
 @app.get("/api/v1/stats", dependencies=[Depends(get_api_key)])
 async def get_mqtt_stats(
@@ -448,18 +763,15 @@ async def get_mqtt_stats(
         logger.info("Nonce validation passed")
         
         try:
-            stats = mqtt_stats.get_stats()
-            
-            # Add MQTT connection status
-            mqtt_connected = mqtt_stats.connected_clients > 0
-            stats["mqtt_connected"] = mqtt_connected
-            
-            # If MQTT is not connected, add a message
-            if not mqtt_connected:
-                stats["connection_error"] = f"MQTT broker connection failed. Check if Mosquitto is running on {MOSQUITTO_IP}:{MOSQUITTO_PORT}"
-                logger.warning(f"Serving stats with MQTT disconnected warning: {MOSQUITTO_IP}:{MOSQUITTO_PORT}")
+            body, etag = mqtt_stats.get_stats_snapshot()
+
+            # Unchanged since the client's last poll: skip the body entirely
+            if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+                response = Response(status_code=304)
             else:
-                logger.info("Successfully retrieved stats with active MQTT connection")
+                response = Response(content=body, media_type="application/json")
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
         except Exception as stats_error:
             logger.error(f"Error in mqtt_stats.get_stats(): {str(stats_error)}")
             logger.exception(stats_error)  # This will log the full traceback
@@ -485,10 +797,11 @@ async def get_mqtt_stats(
                     "counts": []
                 }
             }
+            response = JSONResponse(content=stats)
         
-        response = JSONResponse(content=stats)
         response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS, DELETE, PUT"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-API-Key"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-API-Key, If-None-Match"
+        response.headers["Access-Control-Expose-Headers"] = "ETag"
         response.headers["Access-Control-Allow-Origin"] = os.getenv("FRONTEND_URL", "http://localhost:2000")
         response.headers["Access-Control-Allow-Credentials"] = "true"
         return response
@@ -504,6 +817,127 @@ async def get_mqtt_stats(
         )
         
         
+@app.get("/api/v1/topics/top", dependencies=[Depends(get_api_key)])
+async def get_top_topics(
+    request: Request,
+    level: int = Query(1, ge=1, description="Topic depth to group by"),
+    limit: int = Query(10, ge=1, le=100),
+    by: TopicRateField = TopicRateField.MESSAGES,
+):
+    """Topic prefixes with the highest current message or byte rate.
+
+    Rates decay with a half-life of TOPIC_STATS_HALF_LIFE seconds. Prefixes
+    deeper than TOPIC_STATS_DEPTH are grouped under that depth.
+    """
+    await log_request(request)
+    if level > topic_stats.depth:
+        raise HTTPException(
+            status_code=400,
+            detail=f"level must be at most {topic_stats.depth} (TOPIC_STATS_DEPTH)"
+        )
+    return {
+        "enabled": SUBSCRIBE_ALL_TOPICS,
+        "level": level,
+        "by": by.value,
+        "topics": topic_stats.top(level, limit, by.value),
+        **topic_stats.stats(),
+    }
+
+@app.get("/api/v1/rates", dependencies=[Depends(get_api_key)])
+async def get_rates(
+    request: Request,
+    window: int = Query(60, ge=1, le=7 * 24 * 3600, description="Seconds before now"),
+):
+    """Message and byte totals and average rates over a recent window"""
+    await log_request(request)
+    return mqtt_stats.rate_history.window(window)
+
+@app.get("/api/v1/rates/series", dependencies=[Depends(get_api_key)])
+async def get_rate_series(
+    request: Request,
+    resolution: int = Query(60, description="Bucket size in seconds: 1, 60 or 3600"),
+    start: Optional[float] = Query(None, description="Epoch seconds; defaults to 60 buckets before end"),
+    end: Optional[float] = Query(None, description="Epoch seconds; defaults to now"),
+):
+    """Per-bucket message and byte counts and rates at one resolution"""
+    await log_request(request)
+    if resolution not in mqtt_stats.rate_history.resolutions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"resolution must be one of {mqtt_stats.rate_history.resolutions}"
+        )
+    end = time.time() if end is None else end
+    start = end - 60 * resolution if start is None else start
+    if start > end or (end - start) / resolution > 10000:
+        raise HTTPException(status_code=400, detail="start must be before end and span at most 10000 buckets")
+    return {"resolution": resolution, "series": mqtt_stats.rate_history.series(resolution, start, end)}
+
+@app.post("/api/v1/stats/stream/token", dependencies=[Depends(get_api_key)])
+async def create_stats_stream_token(request: Request):
+    """Short-lived token for opening the stats stream.
+
+    EventSource cannot send headers, so the stream is opened with this token
+    in the URL instead of the long-lived API key.
+    """
+    await log_request(request)
+    expires = datetime.now(timezone.utc) + timedelta(seconds=STATS_STREAM_TOKEN_TTL)
+    token = jwt.encode({"scope": "stats_stream", "exp": expires}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return {"token": token, "expires_in": STATS_STREAM_TOKEN_TTL}
+
+def verify_stream_token(token: str):
+    """Validate a token from /api/v1/stats/stream/token"""
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.PyJWTError as e:
+        logger.error(f"Invalid stats stream token: {e}")
+        raise HTTPException(status_code=403, detail="Invalid or expired stream token")
+    if claims.get("scope") != "stats_stream":
+        raise HTTPException(status_code=403, detail="Invalid or expired stream token")
+
+@app.get("/api/v1/stats/stream")
+async def stream_mqtt_stats(
+    request: Request,
+    api_key: Optional[str] = Depends(api_key_header),
+    token: Optional[str] = Query(None, description="Token from /api/v1/stats/stream/token")
+):
+    """Stream MQTT statistics as Server-Sent Events.
+
+    The first event is a full "snapshot"; following "stats" events only carry
+    the fields that changed. EventSource cannot send headers, so browsers
+    authenticate with a short-lived token from /api/v1/stats/stream/token
+    passed as the token query parameter; other clients can send the API key
+    header. The token is only checked when the stream opens.
+    """
+    await log_request(request)
+    if token and not api_key:
+        verify_stream_token(token)
+    else:
+        await get_api_key(api_key)
+
+    queue = stats_broadcaster.subscribe()
+    logger.info(f"Stats stream opened, {stats_broadcaster.subscriber_count} subscriber(s)")
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STATS_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    message = b": keep-alive\n\n"
+                yield message
+        finally:
+            stats_broadcaster.unsubscribe(queue)
+            logger.info(f"Stats stream closed, {stats_broadcaster.subscriber_count} subscriber(s)")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
 @app.get("/api/v1/test/mqtt-stats")
 async def test_mqtt_stats():
     """Test endpoint to verify MQTT stats functionality"""
@@ -561,7 +995,12 @@ async def test_storage():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "count_mode": MONITOR_COUNT_MODE,
+        "topic_breakdown": SUBSCRIBE_ALL_TOPICS,
+        "sys_counters": sys_counters.stats(),
+    }
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,238 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/monitor/rate_history.py
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds between samples of the $SYS counters
+RATE_SAMPLE_INTERVAL = float(os.getenv("RATE_SAMPLE_INTERVAL", "1"))
+
+# Cumulative $SYS counters that are sampled, and the metric each one feeds
+SAMPLED_COUNTERS = {
+    "$SYS/broker/messages/received": "messages_received",
+    "$SYS/broker/messages/sent": "messages_sent",
+    "$SYS/broker/bytes/received": "bytes_received",
+    "$SYS/broker/bytes/sent": "bytes_sent",
+}
+METRICS = tuple(SAMPLED_COUNTERS.values())
+
+# (bucket seconds, buckets kept): 1s for an hour, 1m for a day, 1h for a week
+RESOLUTIONS = ((1, 3600), (60, 1440), (3600, 168))
+
+
+class RollupRing:
+    """Fixed-size ring of time buckets holding per-metric sums.
+
+    Every bucket stores its own sums plus the running totals up to and
+    including it. The sum over any run of buckets still in the ring is
+    therefore the difference of two running totals, an O(1) lookup.
+    Skipped buckets are filled with zeros when time advances, so the ring
+    always covers a contiguous range ending at the current bucket.
+    """
+
+    def __init__(self, resolution: int, capacity: int, metrics: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.metrics = metrics
+        self._sums = array("d", bytes(8 * capacity * metrics))
+        self._totals = array("d", bytes(8 * capacity * metrics))
+        self._current = -1
+        self._oldest = 0
+
+    def add(self, ts: float, values: Sequence[float]):
+        bucket = int(ts // self.resolution)
+        m = self.metrics
+        if self._current < 0:
+            self._current = self._oldest = bucket
+        elif bucket > self._current:
+            prev = (self._current % self.capacity) * m
+            carry = self._totals[prev:prev + m]
+            for b in range(max(self._current + 1, bucket - self.capacity + 1), bucket + 1):
+                slot = (b % self.capacity) * m
+                for k in range(m):
+                    self._sums[slot + k] = 0.0
+                    self._totals[slot + k] = carry[k]
+            self._current = bucket
+            self._oldest = max(self._oldest, bucket - self.capacity + 1)
+        # Late samples are added to the current bucket
+        slot = (self._current % self.capacity) * m
+        for k, value in enumerate(values):
+            self._sums[slot + k] += value
+            self._totals[slot + k] += value
+
+    def _total_before(self, bucket: int, k: int) -> float:
+        """Running total of metric k up to the bucket before `bucket` (which must be in the ring)"""
+        slot = (bucket % self.capacity) * self.metrics + k
+        return self._totals[slot] - self._sums[slot]
+
+    def window(self, first: int, last: int) -> Optional[List[float]]:
+        """Per-metric sums over buckets first..last, clamped to the ring; None if none overlap"""
+        first = max(first, self._oldest)
+        last = min(last, self._current)
+        if self._current < 0 or first > last:
+            return None
+        end = (last % self.capacity) * self.metrics
+        return [self._totals[end + k] - self._total_before(first, k) for k in range(self.metrics)]
+
+    def buckets(self, first: int, last: int) -> List[Tuple[int, List[float]]]:
+        """(bucket start time, per-metric sums) for each bucket in first..last, zero outside the ring"""
+        m = self.metrics
+        result = []
+        for b in range(first, last + 1):
+            if self._oldest <= b <= self._current:
+                slot = (b % self.capacity) * m
+                result.append((b * self.resolution, list(self._sums[slot:slot + m])))
+            else:
+                result.append((b * self.resolution, [0.0] * m))
+        return result
+
+    @property
+    def current(self) -> int:
+        return self._current
+
+
+class RateHistory:
+    """Message and byte counts at 1s, 1m and 1h resolution.
+
+    Each sample is added to all three rings, a fixed O(resolutions x metrics)
+    cost. Memory is fixed by RESOLUTIONS. Window queries are answered from
+    the finest ring that still covers the window, using its running totals,
+    so raw samples are never rescanned.
+    """
+
+    def __init__(self, metrics: Sequence[str] = METRICS, resolutions=RESOLUTIONS):
+        self.metric_names = tuple(metrics)
+        self._index = {name: i for i, name in enumerate(self.metric_names)}
+        self._rings = [RollupRing(res, cap, len(self.metric_names)) for res, cap in resolutions]
+        self._lock = threading.Lock()
+
+    @property
+    def resolutions(self) -> List[int]:
+        return [ring.resolution for ring in self._rings]
+
+    def _ring(self, resolution: int) -> RollupRing:
+        for ring in self._rings:
+            if ring.resolution == resolution:
+                return ring
+        raise ValueError(f"resolution must be one of {self.resolutions}")
+
+    def add(self, ts: float, values: Sequence[float]):
+        with self._lock:
+            for ring in self._rings:
+                ring.add(ts, values)
+
+    def recent(self, resolution: int, metric: str, count: int) -> List[float]:
+        """Sums of the last `count` complete buckets of one metric, oldest first"""
+        ring = self._ring(resolution)
+        k = self._index[metric]
+        with self._lock:
+            now = int(time.time() // resolution)
+            return [values[k] for _, values in ring.buckets(now - count, now - 1)]
+
+    def series(self, resolution: int, start: float, end: float) -> List[Dict[str, Any]]:
+        """Per-bucket counts and rates between two epoch times"""
+        ring = self._ring(resolution)
+        with self._lock:
+            rows = ring.buckets(int(start // resolution), int(end // resolution))
+        return [
+            {"ts": ts, **{
+                name: {"count": values[k], "per_second": values[k] / resolution}
+                for k, name in enumerate(self.metric_names)
+            }}
+            for ts, values in rows
+        ]
+
+    def window(self, seconds: float, end: Optional[float] = None) -> Dict[str, Any]:
+        """Totals and average rates over the `seconds` before `end` (default now)"""
+        end = time.time() if end is None else end
+        with self._lock:
+            for ring in self._rings:
+                if ring.resolution * ring.capacity >= seconds or ring is self._rings[-1]:
+                    break
+            res = ring.resolution
+            last = int(end // res)
+            first = last - max(1, int(round(seconds / res))) + 1
+            sums = ring.window(first, last)
+        covered = (last - first + 1) * res
+        sums = sums or [0.0] * len(self.metric_names)
+        return {
+            "window_seconds": covered,
+            "resolution": res,
+            **{
+                name: {"count": sums[k], "per_second": round(sums[k] / covered, 3)}
+                for k, name in enumerate(self.metric_names)
+            },
+        }
+
+
+class RateSampler:
+    """Background thread that samples the broker's cumulative $SYS counters.
+
+    on_message only stores the latest value of each counter with observe().
+    Every RATE_SAMPLE_INTERVAL the sampler turns those values into
+    increments through delta(name, value), which handles broker restarts,
+    and adds them to the history. The history therefore advances whether
+    or not anyone polls the API. The broker only refreshes $SYS every
+    sys_interval seconds (10 by default), so 1s buckets show that cadence
+    as bursts; the 1m and 1h rollups are smooth. on_sample, if given, runs
+    on this thread after every sample, for other periodic work.
+    """
+
+    def __init__(self, history: RateHistory, delta: Callable[[str, float], float],
+                 interval: float = RATE_SAMPLE_INTERVAL,
+                 on_minute: Optional[Callable[[], None]] = None,
+                 on_sample: Optional[Callable[[], None]] = None):
+        self.history = history
+        self.delta = delta
+        self.interval = interval
+        self.on_minute = on_minute
+        self.on_sample = on_sample
+        self._latest: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def observe(self, topic: str, value: float):
+        self._latest[SAMPLED_COUNTERS[topic]] = value
+
+    def sample(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        latest = dict(self._latest)
+        values = [
+            self.delta(f"rate:{name}", latest[name]) if name in latest else 0.0
+            for name in self.history.metric_names
+        ]
+        self.history.add(now, values)
+
+    def _run(self):
+        minute = int(time.time() // 60)
+        # Align samples to the interval so buckets get one sample each
+        while not self._stop.wait(self.interval - time.time() % self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling $SYS counters: {e}")
+            if self.on_sample is not None:
+                self.on_sample()
+            if self.on_minute is not None and int(time.time() // 60) != minute:
+                minute = int(time.time() // 60)
+                self.on_minute()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rate-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
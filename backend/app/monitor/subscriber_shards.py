@@ -0,0 +1,239 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/monitor/subscriber_shards.py
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from paho.mqtt import client as mqtt_client
+
+logger = logging.getLogger(__name__)
+
+# Number of subscriber connections sharing the # subscription (1 keeps the single client)
+MONITOR_SUBSCRIBER_SHARDS = int(os.getenv("MONITOR_SUBSCRIBER_SHARDS", "1"))
+# Run the shards in separate processes instead of threads of this process
+MONITOR_SUBSCRIBER_PROCESSES = os.getenv("MONITOR_SUBSCRIBER_PROCESSES", "false").lower() in ("1", "true", "yes")
+# Shared subscription group the shards join
+MONITOR_SHARE_GROUP = os.getenv("MONITOR_SHARE_GROUP", "bunkerm-monitor")
+# Seconds between merges of the shard counters
+MONITOR_SHARD_MERGE_INTERVAL = float(os.getenv("MONITOR_SHARD_MERGE_INTERVAL", "1.0"))
+# Distinct topic prefixes a shard collects before it hands its counters over early
+MONITOR_SHARD_MAX_PREFIXES = int(os.getenv("MONITOR_SHARD_MAX_PREFIXES", "10000"))
+
+# [messages, bytes, {topic prefix: [messages, bytes]}]
+ShardCounts = List
+
+
+def topic_prefix(topic: str, depth: int) -> str:
+    """The first `depth` levels of a topic"""
+    end = -1
+    for _ in range(depth):
+        end = topic.find("/", end + 1)
+        if end < 0:
+            return topic
+    return topic[:end]
+
+
+class _Shard:
+    """One subscriber connection with counters touched only by its network thread.
+
+    The counters live in one list with no lock. The merger swaps in a fresh
+    list with a single assignment, which the GIL makes atomic. Only the
+    message being counted at that instant can be split across two merges.
+    """
+
+    def __init__(self, index: int, host: str, port: int, username: str, password: str,
+                 depth: int, on_full: Optional[Callable[[], None]] = None):
+        self.index = index
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.depth = depth
+        self.on_full = on_full
+        self._counts: ShardCounts = [0, 0, {}]
+        self._client = None
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code == 0:
+            client.subscribe(f"$share/{MONITOR_SHARE_GROUP}/#", qos=0)
+            logger.info(f"Subscriber shard {self.index} connected")
+        else:
+            logger.error(f"Subscriber shard {self.index} failed to connect: {reason_code}")
+
+    def _on_message(self, client, userdata, msg):
+        topic = msg.topic
+        if topic.startswith("$SYS/"):
+            return
+        size = len(msg.payload)
+        counts = self._counts
+        counts[0] += 1
+        counts[1] += size
+        prefixes = counts[2]
+        prefix = topic_prefix(topic, self.depth)
+        entry = prefixes.get(prefix)
+        if entry is None:
+            prefixes[prefix] = [1, size]
+        else:
+            entry[0] += 1
+            entry[1] += size
+        if len(prefixes) >= MONITOR_SHARD_MAX_PREFIXES and self.on_full is not None:
+            self.on_full()
+
+    def drain(self) -> ShardCounts:
+        counts, self._counts = self._counts, [0, 0, {}]
+        return counts
+
+    def start(self):
+        client_id = f"bunkerm-monitor-{self.index}-{secrets.token_hex(3)}"
+        client = mqtt_client.Client(
+            mqtt_client.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt_client.MQTTv5
+        )
+        client.username_pw_set(self.username, self.password)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=10)
+        client.connect_async(self.host, self.port, 60)
+        client.loop_start()
+        self._client = client
+
+    def stop(self):
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+            self._client = None
+
+
+def _shard_process(index: int, host: str, port: int, username: str, password: str, depth: int,
+                   results: multiprocessing.Queue, stop: multiprocessing.Event):
+    """Entry point of a shard running in its own process"""
+    full = threading.Event()
+    shard = _Shard(index, host, port, username, password, depth, on_full=full.set)
+    shard.start()
+    try:
+        while not stop.is_set():
+            full.wait(MONITOR_SHARD_MERGE_INTERVAL)
+            full.clear()
+            counts = shard.drain()
+            if counts[0]:
+                results.put(counts)
+    finally:
+        shard.stop()
+        counts = shard.drain()
+        if counts[0]:
+            results.put(counts)
+
+
+class ShardedSubscriber:
+    """Count # traffic over several connections joined in an MQTT v5 shared subscription.
+
+    The broker spreads messages across the shards. Each shard counts into
+    its own counters; in process mode those live in its own interpreter, so
+    shards use separate cores. Every MONITOR_SHARD_MERGE_INTERVAL the counts
+    are collected and passed to on_counts(messages, bytes, prefixes) on the
+    merger thread. That thread is the only place the shared MQTTStats and
+    TopicStats locks are taken. Topics are pre-aggregated per prefix of
+    `depth` levels, so high-cardinality topics collapse before the merge.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 on_counts: Callable[[int, int, Dict[str, List[int]]], None],
+                 shards: int = MONITOR_SUBSCRIBER_SHARDS,
+                 processes: bool = MONITOR_SUBSCRIBER_PROCESSES,
+                 depth: int = 3):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.on_counts = on_counts
+        self.shard_count = max(1, shards)
+        self.processes = processes
+        self.depth = depth
+        self._shards: List[_Shard] = []
+        self._procs: List[multiprocessing.Process] = []
+        self._results: Optional[multiprocessing.Queue] = None
+        self._proc_stop: Optional[multiprocessing.Event] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._merger: Optional[threading.Thread] = None
+        self.merged_messages = 0
+
+    def start(self):
+        if self.processes:
+            ctx = multiprocessing.get_context("spawn")
+            self._results = ctx.Queue()
+            self._proc_stop = ctx.Event()
+            for index in range(self.shard_count):
+                proc = ctx.Process(
+                    target=_shard_process,
+                    args=(index, self.host, self.port, self.username, self.password, self.depth,
+                          self._results, self._proc_stop),
+                    name=f"monitor-shard-{index}",
+                    daemon=True,
+                )
+                proc.start()
+                self._procs.append(proc)
+        else:
+            for index in range(self.shard_count):
+                shard = _Shard(index, self.host, self.port, self.username, self.password,
+                               self.depth, on_full=self._wake.set)
+                shard.start()
+                self._shards.append(shard)
+        mode = "processes" if self.processes else "connections"
+        logger.info(f"Counting # traffic with {self.shard_count} shared-subscription {mode}")
+        self._merger = threading.Thread(target=self._merge_loop, name="monitor-shard-merger", daemon=True)
+        self._merger.start()
+
+    def _deliver(self, counts: ShardCounts):
+        messages, total_bytes, prefixes = counts
+        if not messages:
+            return
+        self.merged_messages += messages
+        try:
+            self.on_counts(messages, total_bytes, prefixes)
+        except Exception as e:
+            logger.error(f"Error merging shard counts: {e}")
+
+    def _collect(self, timeout: float):
+        if self.processes:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    self._deliver(self._results.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    return
+        else:
+            self._wake.wait(timeout)
+            self._wake.clear()
+            for shard in self._shards:
+                self._deliver(shard.drain())
+
+    def _merge_loop(self):
+        while not self._stop.is_set():
+            self._collect(MONITOR_SHARD_MERGE_INTERVAL)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._merger is not None:
+            self._merger.join(timeout=MONITOR_SHARD_MERGE_INTERVAL + 1)
+        if self.processes:
+            self._proc_stop.set()
+            for proc in self._procs:
+                proc.join(timeout=5)
+            # Final counts the shards flushed on their way out
+            self._collect(0.5)
+        else:
+            for shard in self._shards:
+                shard.stop()
+                self._deliver(shard.drain())
@@ -0,0 +1,93 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/monitor/sys_counters.py
+import threading
+from typing import Any, Dict, Optional
+
+UPTIME_TOPIC = "$SYS/broker/uptime"
+
+
+def parse_uptime(payload: str) -> Optional[int]:
+    """Seconds from a "$SYS/broker/uptime" payload such as "1234 seconds" """
+    try:
+        return int(payload.split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+class _Counter:
+    __slots__ = ("last", "epoch", "total", "resets")
+
+    def __init__(self):
+        self.last: Optional[float] = None
+        self.epoch = 0
+        self.total = 0
+        self.resets = 0
+
+
+class SysCounterTracker:
+    """Turn the broker's cumulative $SYS counters into increments.
+
+    The first value seen for a counter only sets its baseline. After that,
+    each value yields the increase since the previous one. The counters
+    restart from zero when the broker restarts. A restart is detected when
+    $SYS/broker/uptime goes backwards, or when a counter goes backwards. In
+    both cases the new value is the increment, since that many were
+    counted after the restart. Baselines survive reconnects of the monitor
+    itself, so traffic while it was disconnected is still counted.
+    A counter published before the uptime in the first $SYS batch after a
+    restart is only caught by the backwards check. If it has already
+    climbed past its old value, the messages between its previous sample
+    and the restart are lost.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, _Counter] = {}
+        self._epoch = 0
+        self._last_uptime: Optional[int] = None
+        self.restarts = 0
+        self._lock = threading.Lock()
+
+    def update_uptime(self, seconds: int) -> bool:
+        """Record the broker uptime; returns True if the broker restarted"""
+        with self._lock:
+            restarted = self._last_uptime is not None and seconds < self._last_uptime
+            if restarted:
+                self._epoch += 1
+                self.restarts += 1
+            self._last_uptime = seconds
+            return restarted
+
+    def delta(self, name: str, value: float) -> float:
+        """Increase of counter `name` since its previous value"""
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self._counters[name] = _Counter()
+            if counter.last is None:
+                increment = 0
+            elif counter.epoch != self._epoch or value < counter.last:
+                increment = value
+                counter.resets += 1
+            else:
+                increment = value - counter.last
+            counter.last = value
+            counter.epoch = self._epoch
+            counter.total += increment
+            return increment
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "broker_restarts": self.restarts,
+                "uptime": self._last_uptime,
+                "counters": {
+                    name: {"last": c.last, "total": c.total, "resets": c.resets}
+                    for name, c in self._counters.items()
+                },
+            }
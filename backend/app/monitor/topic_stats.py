@@ -0,0 +1,130 @@
+# Copyright (c) 2025 BunkerM
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# You may not use this file except in compliance with the License.
+# http://www.apache.org/licenses/LICENSE-2.0
+# Distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND.
+#
+# app/monitor/topic_stats.py
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Number of topic levels accounted for; deeper topics are counted under their prefix at this depth
+TOPIC_STATS_DEPTH = int(os.getenv("TOPIC_STATS_DEPTH", "3"))
+# Prefixes kept per level; the map is pruned back to this size once it grows to twice it
+TOPIC_STATS_MAX_PREFIXES = int(os.getenv("TOPIC_STATS_MAX_PREFIXES", "5000"))
+# Half-life (seconds) of the decaying rate estimates
+TOPIC_STATS_HALF_LIFE = float(os.getenv("TOPIC_STATS_HALF_LIFE", "60"))
+
+
+class _PrefixCounter:
+    __slots__ = ("messages", "bytes", "message_score", "byte_score", "updated", "first_seen")
+
+    def __init__(self, now: float):
+        self.messages = 0
+        self.bytes = 0
+        self.message_score = 0.0
+        self.byte_score = 0.0
+        self.updated = now
+        self.first_seen = now
+
+
+class TopicStats:
+    """Per-topic-prefix message and byte accounting for the wildcard subscription.
+
+    Each message updates one counter per topic level, up to `depth` levels.
+    The cost per message is therefore O(depth) dictionary operations. Next
+    to the running totals, each counter keeps exponentially decaying message
+    and byte scores. A score divided by the mean lifetime (half-life / ln 2)
+    is the recent rate. Every level has its own map, so a high-cardinality
+    level such as devices/<uuid> cannot push out the shallower prefixes.
+    When a map reaches twice max_prefixes it is pruned back to the
+    max_prefixes entries with the highest current rate. Memory is therefore
+    bounded, and the O(n log n) prune is amortised over at least n new
+    prefixes.
+    """
+
+    def __init__(
+        self,
+        depth: int = TOPIC_STATS_DEPTH,
+        max_prefixes: int = TOPIC_STATS_MAX_PREFIXES,
+        half_life: float = TOPIC_STATS_HALF_LIFE,
+    ):
+        self.depth = max(1, depth)
+        self.max_prefixes = max_prefixes
+        self.half_life = half_life
+        self._decay = math.log(2) / half_life
+        self._levels: List[Dict[str, _PrefixCounter]] = [{} for _ in range(self.depth)]
+        self._evicted = [0] * self.depth
+        self._lock = threading.Lock()
+
+    def record(self, topic: str, size: int, now: Optional[float] = None, count: int = 1):
+        """Count `count` messages of `size` bytes in total on a topic"""
+        now = time.monotonic() if now is None else now
+        decay = self._decay
+        with self._lock:
+            start = 0
+            for level, counters in enumerate(self._levels):
+                end = topic.find("/", start)
+                prefix = topic if end < 0 else topic[:end]
+                counter = counters.get(prefix)
+                if counter is None:
+                    if len(counters) >= 2 * self.max_prefixes:
+                        self._prune(level, now)
+                    counter = counters[prefix] = _PrefixCounter(now)
+                factor = math.exp(-decay * (now - counter.updated))
+                counter.message_score = counter.message_score * factor + count
+                counter.byte_score = counter.byte_score * factor + size
+                counter.updated = now
+                counter.messages += count
+                counter.bytes += size
+                if end < 0:
+                    break
+                start = end + 1
+
+    def _prune(self, level: int, now: float):
+        counters = self._levels[level]
+        decay = self._decay
+        ranked = sorted(
+            counters.items(),
+            key=lambda item: item[1].message_score * math.exp(-decay * (now - item[1].updated)),
+            reverse=True,
+        )
+        self._levels[level] = dict(ranked[:self.max_prefixes])
+        self._evicted[level] += len(ranked) - self.max_prefixes
+
+    def top(self, level: int = 1, limit: int = 10, by: str = "messages",
+            now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Prefixes at one level (1-based) with the highest current message or byte rate"""
+        now = time.monotonic() if now is None else now
+        decay = self._decay
+        lifetime = 1 / decay
+        with self._lock:
+            counters = self._levels[min(max(level, 1), self.depth) - 1]
+            rows = []
+            for prefix, c in counters.items():
+                factor = math.exp(-decay * (now - c.updated))
+                rows.append({
+                    "prefix": prefix,
+                    "messages_per_second": round(c.message_score * factor / lifetime, 3),
+                    "bytes_per_second": round(c.byte_score * factor / lifetime, 1),
+                    "messages": c.messages,
+                    "bytes": c.bytes,
+                    "tracked_seconds": round(now - c.first_seen),
+                })
+        key = "bytes_per_second" if by == "bytes" else "messages_per_second"
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "max_prefixes": self.max_prefixes,
+                "half_life_seconds": self.half_life,
+                "tracked": [len(counters) for counters in self._levels],
+                "evicted": list(self._evicted),
+            }
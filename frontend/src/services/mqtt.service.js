@@ -53,6 +53,22 @@ export const mqttService = {
     return response.data.clients.split('\n').filter(Boolean).map(username => ({ username }));
   },
 
+  // One page of clients, filtered and sorted on the server
+  async getClientsPage({ limit, offset = 0, search = '', sort = 'asc', exclude = '' }) {
+    const params = { limit, offset, sort };
+    if (search) {
+      params.search = search;
+    }
+    if (exclude) {
+      params.exclude = exclude;
+    }
+    const response = await api.get('/clients', { params });
+    return {
+      items: response.data.items.map(username => ({ username })),
+      total: response.data.total
+    };
+  },
+
   async getClient(username) {
     const response = await api.get(`/clients/${username}`, {
       headers: {